@@ -156,7 +156,7 @@ if not exist venv (
 echo Activating virtual environment
 call .venv\Scripts\activate
 echo ---------------------------------------------------------------
-start call python main.py
+start call python gradio_app.py
 start start http://localhost:7933
 goto Menu1
 
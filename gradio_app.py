@@ -1,29 +1,114 @@
 # gradio_app.py
 
 import gradio as gr
+import itertools
 import os
 import webbrowser
 import subprocess
-from modules.gguf_model import GGUFModel
+from modules.gguf_model import GGUFModel, detect_device
+from modules.model_pool import ModelPool, model_key
+from modules.model_catalog import ModelCatalog
+from modules.inference_scheduler import InferenceScheduler, QueueFullError
 import modules.data_utils as data_utils
 import modules.visualization_utils as visualization_utils
-from modules.self_awareness_experiment import run_self_referential_question
-from modules.download_tool import search_models, download_model  # Import from download_tool.py
-from modules.visualization_tool import get_visualization_data  # Import from visualization_tool.py
-from modules.brain_visualization import prepare_brain_visualization_data  # Import from brain_visualization.py
-import torch
+from modules.self_awareness_experiment import EXPERIMENTS, run_self_referential_question, run_batch_experiment
+from modules.download_tool import get_model_search, download_model, list_gguf_files  # Import from download_tool.py
+from modules.visualization_tool import get_visualization_data, get_embedding_visualization_data, get_attention_pyramid, get_token_neighbourhood  # Import from visualization_tool.py
+from modules.brain_visualization import prepare_brain_visualization_data, BRAIN_TEMPLATE  # Import from brain_visualization.py
+from modules.payload_codec import encode_payload
+from modules.template_renderer import TemplateRenderer
+from modules.generation_capture import CaptureBuffer, DEFAULT_CAPTURE_CAPACITY, DEFAULT_CAPTURE_TOP_K, iter_capture_deltas
 import json
+from collections import OrderedDict
 
-# Global variable for the model
+# Index of the models directory, rescanned incrementally on refresh
+model_catalog = ModelCatalog('models')
+
+# Loaded models stay warm in the pool; gguf_model is the one the UI is using
+model_pool = ModelPool()
 gguf_model = None
 
-def load_model(model_name, n_ctx, n_gpu_layers, n_threads):
+# All inference on gguf_model goes through the scheduler, which runs one request per
+# replica at a time. Extra replicas are owned by the scheduler, not by the pool.
+MAX_QUEUED_REQUESTS = 64
+MAX_QUEUED_PER_SESSION = 2
+GRADIO_CONCURRENCY = 32
+scheduler = None
+extra_replicas = []
+
+# Per-session state is kept for the most recently active browser sessions only
+MAX_TRACKED_SESSIONS = 64
+
+# Browser session -> chat store session the conversation is saved to. A forgotten
+# session starts a new stored chat on its next turn.
+chat_sessions = OrderedDict()
+CHAT_DROPDOWN_SIZE = 50
+
+# Browser session -> CaptureBuffer of its last instrumented generation
+attention_captures = OrderedDict()
+# Browser session -> (capture, pyramid, serial) of the attention view built from it; the
+# serial keys its tiles, so stored payloads do not keep the capture alive
+attention_pyramids = OrderedDict()
+attention_serials = itertools.count()
+
+# Visualization pages come from templates compiled once. Their data is stored by content
+# hash and, once create_app mounts the payload route, fetched by reference with ETag caching.
+visualization_renderer = TemplateRenderer()
+for _name, _template in (("tokens", visualization_utils.TOKEN_TEMPLATE),
+                         ("weight", visualization_utils.WEIGHT_TEMPLATE),
+                         ("embedding", visualization_utils.EMBEDDING_TEMPLATE),
+                         ("tile", visualization_utils.TILE_HEATMAP_TEMPLATE),
+                         ("live", visualization_utils.LIVE_CAPTURE_TEMPLATE),
+                         ("brain", BRAIN_TEMPLATE)):
+    visualization_renderer.register(_name, _template)
+
+def remember_session(sessions, session_id, value):
+    # Least recently updated sessions are forgotten first
+    sessions[session_id] = value
+    sessions.move_to_end(session_id)
+    while len(sessions) > MAX_TRACKED_SESSIONS:
+        sessions.popitem(last=False)
+
+def store_capture(session_id, capture):
+    # The attention pyramid of the replaced capture is rebuilt on the next tile request
+    attention_pyramids.pop(session_id, None)
+    remember_session(attention_captures, session_id, capture)
+
+def start_scheduler(model, replicas):
+    global scheduler, extra_replicas
+    stop_scheduler()
+    for _ in range(int(replicas) - 1):
+        # Replicas share the session cache, so a chat can continue on any of them; they keep
+        # all logits like the model, since captures and scoring may run on any replica
+        replica = GGUFModel(model.model_path, model.device, n_ctx=model.n_ctx, n_gpu_layers=model.n_gpu_layers,
+                            n_threads=model.n_threads, session_cache=model.session_cache,
+                            logits_all=model.logits_all)
+        replica.load_model()
+        extra_replicas.append(replica)
+    scheduler = InferenceScheduler([model] + extra_replicas, max_queue=MAX_QUEUED_REQUESTS,
+                                   max_pending_per_session=MAX_QUEUED_PER_SESSION)
+
+def stop_scheduler():
+    global scheduler, extra_replicas
+    if scheduler:
+        scheduler.shutdown()
+        scheduler = None
+    for replica in extra_replicas:
+        replica.unload_model()
+    extra_replicas = []
+
+def load_model(model_name, n_ctx, n_gpu_layers, n_threads, replicas=1, logits_all=False, stats_workers=1):
     global gguf_model
     model_path = os.path.join('models', model_name)
-    gguf_model = GGUFModel(model_path, n_ctx=n_ctx, n_gpu_layers=n_gpu_layers, n_threads=n_threads)
     try:
-        gguf_model.load_model()
-        device = "CUDA" if torch.cuda.is_available() else "CPU"
+        stop_scheduler()
+        warm = model_key(model_path, n_ctx, n_gpu_layers, n_threads, logits_all) in model_pool
+        gguf_model = model_pool.acquire(model_path, n_ctx=n_ctx, n_gpu_layers=n_gpu_layers, n_threads=n_threads,
+                                        logits_all=logits_all, stats_workers=stats_workers)
+        start_scheduler(gguf_model, replicas)
+        device = detect_device().upper()
+        if warm:
+            return f"Model '{model_name}' is already loaded on {device}; switched to it."
         return f"Model '{model_name}' loaded successfully on {device}."
     except Exception as e:
         return f"Error loading model: {e}"
@@ -31,21 +116,68 @@ def load_model(model_name, n_ctx, n_gpu_layers, n_threads):
 def unload_model():
     global gguf_model
     if gguf_model:
-        gguf_model.unload_model()
+        stop_scheduler()
+        model_pool.release(gguf_model)
+        gguf_model = None
+        # Captures came from the unloaded model
+        attention_captures.clear()
+        attention_pyramids.clear()
         return "Model unloaded successfully."
     else:
         return "No model is currently loaded."
 
-def generate_response(prompt, history):
+def token_scoring_state():
+    # Scoring reads the logits of every position, which only a model loaded with
+    # "Keep All Logits" (logits_all) keeps
+    scorable = bool(gguf_model and gguf_model.logits_all)
+    return gr.update(interactive=scorable, value=False)
+
+def generate_response(prompt, history, request: gr.Request):
+    if not scheduler:
+        yield history, "Please load a model first."
+        return
+    # Stream tokens into the last chat turn as they are generated. The browser
+    # session keys the saved llama.cpp state, so earlier turns are not re-evaluated.
+    session_id = request.session_hash
+    previous_turns = list(history)
+    try:
+        job = scheduler.submit(
+            session_id, lambda model: model.generate_chat_stream(session_id, previous_turns, prompt))
+    except QueueFullError as e:
+        yield history, str(e)
+        return
+    history = history + [(prompt, "")]
+    response = ""
+    try:
+        for piece in job.stream():
+            response += piece
+            history[-1] = (prompt, response)
+            yield history, ""
+    finally:
+        # Stops generation if the browser goes away mid-stream
+        job.cancel()
+    response = response.strip()
+    history[-1] = (prompt, response)
+    # Queued for the background chat writer, so saving normally never delays the response
+    try:
+        remember_session(chat_sessions, session_id, data_utils.save_chat(
+            prompt, response, session_id=chat_sessions.get(session_id),
+            model=os.path.basename(gguf_model.model_path)))
+    except Exception as e:
+        yield history, f"The response could not be saved to the chat history: {e}"
+        return
+    yield history, ""
+
+def new_chat(request: gr.Request):
     if gguf_model:
-        response = gguf_model.generate(prompt)
-        # Save chat to outputs
-        data_utils.save_chat(prompt, response)
-        # Update chat history
-        history = history + [(prompt, response)]
-        return history, ""
-    else:
-        return history, "Please load a model first."
+        gguf_model.end_chat_session(request.session_hash)
+    chat_sessions.pop(request.session_hash, None)
+    return [], ""
+
+def get_queue_status():
+    if not scheduler:
+        return "No model is currently loaded."
+    return json.dumps(scheduler.metrics(), indent=2)
 
 def run_tests():
     # Run unit tests and return the results
@@ -57,44 +189,146 @@ def open_huggingface_repo():
     webbrowser.open_new_tab(url)
     return "Opened HuggingFace repository in a new tab."
 
-def search_huggingface_models(query):
-    model_names = search_models(query)
-    return gr.Dropdown.update(choices=model_names)
+def search_huggingface_models(query, page=0):
+    try:
+        result = get_model_search().search(query, page=int(page))
+    except Exception as e:
+        return gr.Dropdown.update(choices=[], value=None), 0, f"Search failed: {e}"
+    status = f"Page {result['page'] + 1}" + (", more results available" if result['has_more'] else "")
+    if result['stale']:
+        status += " (offline: showing cached results)"
+    return gr.Dropdown.update(choices=result['models'], value=None), result['page'], status
+
+def next_huggingface_models(query, page):
+    return search_huggingface_models(query, page=int(page) + 1)
+
+def list_huggingface_files(model_id):
+    if not model_id:
+        return gr.Dropdown.update(choices=[], value=None)
+    try:
+        files = [f["path"] for f in list_gguf_files(model_id)]
+    except Exception as e:
+        print(f"Could not list the files of '{model_id}': {e}")
+        files = []
+    return gr.Dropdown.update(choices=files, value=files[0] if files else None)
+
+def download_huggingface_model(model_id, filename, progress=gr.Progress()):
+    if not model_id:
+        return "Please select a model first."
 
-def download_huggingface_model(model_id):
-    status = download_model(model_id)
+    def report(name, done, total, rate):
+        progress(done / total if total else 0, desc=f"{name}: {rate / 1e6:.1f} MB/s")
+
+    status = download_model(model_id, filenames=[filename] if filename else None, progress=report)
+    refresh_models()
     return status
 
 def refresh_models():
-    model_files = []
-    for root, dirs, files in os.walk('models'):
-        for file in files:
-            if file.endswith('.gguf') or file.endswith('.bin'):
-                relative_path = os.path.relpath(os.path.join(root, file), 'models')
-                model_files.append(relative_path)
-        for dir in dirs:
-            model_files.append(dir)
+    model_catalog.scan()
+    model_files = [model['path'] for model in model_catalog.list_models()]
     return gr.Dropdown.update(choices=model_files)
 
 def get_previous_chats():
-    data_utils.ensure_directory_exists('outputs')
-    chat_files = os.listdir('outputs')
-    json_files = [f for f in chat_files if f.endswith('.json')]
-    return json_files
-
-def load_chat(chat_file):
-    chat_data = data_utils.load_chat(chat_file)
-    history = []
-    if 'prompt' in chat_data and 'response' in chat_data:
-        history.append((chat_data['prompt'], chat_data['response']))
+    # Only the most recent page of sessions; older ones stay in the store
+    sessions, _ = data_utils.list_chats(limit=CHAT_DROPDOWN_SIZE)
+    return [f"{session['id']} · {session['title']}" for session in sessions]
+
+def refresh_previous_chats():
+    return gr.Dropdown.update(choices=get_previous_chats())
+
+def load_chat(chat_choice, request: gr.Request):
+    if not chat_choice:
+        return []
+    chat_id = chat_choice.split(" · ", 1)[0]
+    history = [(message['prompt'], message['response']) for message in data_utils.load_chat(chat_id)]
+    # Continue the loaded conversation; the llama.cpp state is rebuilt from the history
+    remember_session(chat_sessions, request.session_hash, chat_id)
+    if gguf_model:
+        gguf_model.end_chat_session(request.session_hash)
     return history
 
-def run_self_awareness_experiment(prompt):
-    if gguf_model:
-        return run_self_referential_question(gguf_model, prompt)
+def run_self_awareness_experiment(prompt, request: gr.Request):
+    if scheduler:
+        try:
+            job = scheduler.submit(request.session_hash, lambda model: run_self_referential_question(model, prompt))
+        except QueueFullError as e:
+            return str(e)
+        return job.result()
     else:
         return "Please load a model first."
 
+def run_batch_experiment_file(prompts_file, experiment, system_prompt):
+    if not scheduler:
+        return "Please load a model first."
+    if prompts_file is None:
+        return "Please upload a JSONL file of prompts."
+    # Batch jobs share the scheduler with interactive users under their own session
+    output_path = os.path.join('outputs', 'batch', os.path.splitext(os.path.basename(prompts_file.name))[0]
+                               + f'_{experiment}.jsonl')
+    summary = run_batch_experiment(scheduler, prompts_file.name, output_path,
+                                   experiment=experiment, system_prompt=system_prompt)
+    return json.dumps(summary, indent=2)
+
+def run_capture_generation(prompt, max_tokens, position_stride, capacity, request: gr.Request):
+    if not scheduler:
+        return "Please load a model first.", ""
+    capture = CaptureBuffer(capacity=int(capacity), position_stride=int(position_stride))
+    try:
+        job = scheduler.submit(request.session_hash, lambda model: model.generate_with_capture(
+            prompt, max_tokens=int(max_tokens), capture=capture))
+    except QueueFullError as e:
+        return str(e), ""
+    try:
+        text, capture, elapsed = job.result()
+    except Exception as e:
+        return "", f"Generation failed: {e}"
+    store_capture(request.session_hash, capture)
+    return text, _capture_report(capture, elapsed)
+
+def _capture_report(capture, elapsed):
+    return (f"Captured {len(capture)} positions ({capture.dropped} overwritten, {capture.skipped} skipped) "
+            f"in {elapsed:.2f}s; capture overhead {capture.overhead_s * 1000:.1f} ms "
+            f"({100 * capture.overhead_s / max(elapsed, 1e-9):.1f}%).")
+
+def run_live_capture(prompt, max_tokens, position_stride, capacity, request: gr.Request):
+    # Yields (generated text, status, delta payload); the payload goes to a hidden component
+    # whose change event patches the mounted live view in the browser
+    if not scheduler:
+        yield "", "Please load a model first.", ""
+        return
+    capture = CaptureBuffer(capacity=int(capacity), position_stride=int(position_stride))
+    try:
+        job = scheduler.submit(request.session_hash, lambda model: model.generate_with_capture(
+            prompt, max_tokens=int(max_tokens), capture=capture))
+    except QueueFullError as e:
+        yield "", str(e), ""
+        return
+    try:
+        # Token text as generated, not the '▁'/'Ġ'-encoded vocabulary strings
+        tokenizer = gguf_model.get_tokenizer()
+    except (KeyError, NotImplementedError) as e:
+        print(f"Live view without token text: {e}")
+        tokenizer = None
+    try:
+        for delta in iter_capture_deltas(capture, lambda: job.status in ("done", "failed", "cancelled")):
+            delta["tokens"] = tokenizer.pieces(delta["token_ids"]) if tokenizer else []
+            yield gr.update(), f"Generating... {delta['seq']} positions captured.", encode_payload(delta)
+        text, capture, elapsed = job.result()
+    except Exception as e:
+        yield "", f"Generation failed: {e}", gr.update()
+        return
+    finally:
+        # Stops generation if the browser goes away mid-stream
+        job.cancel()
+    store_capture(request.session_hash, capture)
+    yield text, _capture_report(capture, elapsed), gr.update()
+
+def render_live_view(width=640, height=480):
+    payload_id = visualization_renderer.store.get_or_put(
+        ("live", DEFAULT_CAPTURE_TOP_K, width, height),
+        lambda: visualization_utils.prepare_live_capture_view(top_k=DEFAULT_CAPTURE_TOP_K, width=width, height=height))
+    return render_visualization("live", payload_id, frame_height=height + 110)
+
 def get_visualization_json():
     if gguf_model:
         # Get visualization data
@@ -103,14 +337,138 @@ def get_visualization_json():
     else:
         return {}
 
-def get_brain_visualization_json():
+def get_embedding_visualization_json():
+    # Only the embedding projection, so this never waits for the statistics of every tensor
     if gguf_model:
-        # Prepare brain visualization data
-        brain_data = prepare_brain_visualization_data(gguf_model)
-        return brain_data
+        return get_embedding_visualization_data(gguf_model)
     else:
         return {}
 
+def list_weight_tensors():
+    if not gguf_model:
+        return gr.Dropdown.update(choices=[], value=None)
+    names = [info.name for info in gguf_model.get_reader().tensors if len(info.dims) >= 2]
+    return gr.Dropdown.update(choices=names, value=names[0] if names else None)
+
+def _load_tile(pyramid, key, level, tile_row, tile_column, field):
+    # Only the requested tile is pooled and sent, so the cost is bounded by the tile size;
+    # a tile viewed before is neither pooled nor serialized again
+    if level is None or level < 0:
+        level, tile_row, tile_column = pyramid.n_levels - 1, 0, 0
+    level, tile_row, tile_column = int(level), int(tile_row), int(tile_column)
+    try:
+        payload_id = visualization_renderer.store.get_or_put(
+            key + (level, tile_row, tile_column, field),
+            lambda: visualization_utils.prepare_tile_data(pyramid.tile(level, tile_row, tile_column), field=field))
+    except ValueError as e:
+        return str(e), ""
+    rows, columns = pyramid.shape
+    grid = pyramid.tile_grid(level)
+    status = (f"{pyramid.name}: {rows}x{columns}, levels 0-{pyramid.n_levels - 1}; "
+              f"level {level} has a {grid[0]}x{grid[1]} tile grid.")
+    return status, render_visualization("tile", payload_id, frame_height=560, field=json.dumps(field))
+
+def load_weight_tile(tensor_name, level, tile_row, tile_column, field):
+    if not gguf_model:
+        return "No model loaded.", ""
+    if not tensor_name:
+        return "Select a tensor.", ""
+    try:
+        pyramid = gguf_model.get_tensor_pyramid(tensor_name)
+    except KeyError as e:
+        return str(e), ""
+    return _load_tile(pyramid, ("tile", gguf_model.model_path, tensor_name), level, tile_row, tile_column, field)
+
+def load_attention_tile(level, tile_row, tile_column, field, request: gr.Request):
+    # The pyramid is rebuilt only when the session has captured a new generation
+    capture = attention_captures.get(request.session_hash)
+    cached = attention_pyramids.get(request.session_hash)
+    if cached is None or cached[0] is not capture:
+        cached = (capture, get_attention_pyramid(capture), next(attention_serials))
+    remember_session(attention_pyramids, request.session_hash, cached)
+    return _load_tile(cached[1], ("attention", cached[2]), level, tile_row, tile_column, field)
+
+def find_nearest_tokens(token, k, data):
+    if not gguf_model:
+        return "No model loaded.", [], data
+    vocabulary = gguf_model.get_vocabulary()
+    token = token.strip()
+    if token.isdigit():
+        token_id = int(token)
+    else:
+        token_id = next((i for i, text in enumerate(vocabulary) if text == token), None)
+        if token_id is None:
+            return f"Token '{token}' is not in the vocabulary.", [], data
+    try:
+        neighbourhood = get_token_neighbourhood(gguf_model, token_id, k=int(k))
+    except (KeyError, ValueError, IndexError, NotImplementedError) as e:
+        return str(e), [], data
+    rows = [[i, vocabulary[i] if i < len(vocabulary) else "", round(similarity, 4)]
+            for i, similarity in neighbourhood["neighbours"]]
+    # The plot is redrawn with the neighbourhood highlighted
+    data = dict(data or get_embedding_visualization_json())
+    data.update(highlight=neighbourhood["highlight"], highlight_ids=neighbourhood["highlight_ids"])
+    return f"Nearest tokens to {token_id} by embedding cosine similarity:", rows, data
+
+def get_visualization_payload_id():
+    if not gguf_model:
+        return None
+    # The data only depends on the model file, so it is serialized once
+    return visualization_renderer.store.get_or_put(
+        ("visualization", gguf_model.model_path),
+        lambda: encode_payload(get_visualization_json()))
+
+def get_token_payload_id(text, score, request: gr.Request):
+    if not gguf_model:
+        return None, "Please load a model first."
+    if not text:
+        return None, "Enter some text."
+    if score and not gguf_model.logits_all:
+        return None, "Scoring tokens needs the model loaded with 'Keep All Logits' ticked."
+
+    def build():
+        if score:
+            # Scoring evaluates the model, so it waits for a replica like any other inference
+            data = scheduler.submit(request.session_hash,
+                                    lambda model: model.get_token_data(text, logprobs=True)).result()
+        else:
+            data = gguf_model.get_token_data(text)
+        return visualization_utils.prepare_token_visualization_data(data)
+
+    try:
+        payload_id = visualization_renderer.store.get_or_put(
+            ("tokens", gguf_model.model_path, text, bool(score)), build)
+    except (QueueFullError, KeyError, ValueError, NotImplementedError) as e:
+        return None, str(e)
+    return payload_id, ""
+
+def get_brain_visualization_json(expand_experts=False):
+    if gguf_model:
+        # Prepare brain visualization data, stored once per model and layout
+        return visualization_renderer.store.get_or_put(
+            ("brain", gguf_model.model_path, bool(expand_experts)),
+            lambda: prepare_brain_visualization_data(gguf_model, expand_experts=expand_experts))
+    else:
+        return None
+
+def render_visualization(name, payload_id, frame_height=620, **values):
+    if not payload_id:
+        return "<p>Load a model first.</p>"
+    try:
+        return visualization_renderer.render(name, payload_id, frame_height=frame_height, **values)
+    except KeyError:
+        return "<p>The visualization data expired; load it again.</p>"
+
+def create_app(path="/"):
+    # Serves the interface together with the payload route, so visualization pages fetch
+    # their data by reference instead of carrying it inline. launch() runs it; it can also
+    # be served directly with uvicorn "gradio_app:create_app" --factory
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    visualization_renderer.mount(app)
+    return gr.mount_gradio_app(app, create_gradio_interface(), path=path)
+
 # Define Gradio Interface
 def create_gradio_interface():
     with gr.Blocks(css=".gradio-container {background-color: #f0f0f0;}") as demo:
@@ -122,29 +480,47 @@ def create_gradio_interface():
                 n_ctx_slider = gr.Slider(256, 4096, value=512, step=64, label="Context Length")
                 n_gpu_layers_slider = gr.Slider(0, 40, value=0, step=1, label="GPU Layers")
                 n_threads_slider = gr.Slider(1, os.cpu_count(), value=4, step=1, label="CPU Threads")
+                replicas_slider = gr.Slider(1, 8, value=1, step=1, label="Inference Replicas")
+                stats_workers_slider = gr.Slider(
+                    1, os.cpu_count(), value=1, step=1,
+                    label="Statistics Workers (processes computing weight statistics; 1 computes them in-process)")
+                logits_all_checkbox = gr.Checkbox(
+                    label="Keep All Logits (captures include the prompt and tokens can be scored; "
+                          "uses context length x vocabulary floats per replica)", value=False)
                 load_button = gr.Button("Load Model")
                 unload_button = gr.Button("Unload Model")
                 load_status = gr.Textbox(label="Status", interactive=False, lines=2)
 
                 # Actions
-                load_button.click(
+                model_loaded = load_button.click(
                     load_model,
-                    inputs=[model_dropdown, n_ctx_slider, n_gpu_layers_slider, n_threads_slider],
+                    inputs=[model_dropdown, n_ctx_slider, n_gpu_layers_slider, n_threads_slider, replicas_slider,
+                            logits_all_checkbox, stats_workers_slider],
                     outputs=load_status
                 )
-                unload_button.click(unload_model, outputs=load_status)
+                model_unloaded = unload_button.click(unload_model, outputs=load_status)
 
                 # Model search components
                 gr.Markdown("## Search and Download Models from HuggingFace")
                 search_bar = gr.Textbox(label="Search GGUF Models on HuggingFace", placeholder="Enter model name...")
-                search_button = gr.Button("Search")
+                with gr.Row():
+                    search_button = gr.Button("Search")
+                    next_page_button = gr.Button("Next Page")
+                search_page = gr.State(0)
+                search_status = gr.Markdown()
                 search_results = gr.Dropdown(label="Search Results", choices=[])
+                file_choice = gr.Dropdown(label="GGUF File", choices=[])
                 download_button = gr.Button("Download Model")
                 refresh_button = gr.Button("Refresh Models")
                 open_repo_button = gr.Button("Open GGUF Repository")
 
-                search_button.click(search_huggingface_models, inputs=search_bar, outputs=search_results)
-                download_button.click(download_huggingface_model, inputs=search_results, outputs=load_status)
+                search_button.click(search_huggingface_models, inputs=search_bar,
+                                    outputs=[search_results, search_page, search_status])
+                next_page_button.click(next_huggingface_models, inputs=[search_bar, search_page],
+                                       outputs=[search_results, search_page, search_status])
+                search_results.change(list_huggingface_files, inputs=search_results, outputs=file_choice)
+                download_button.click(download_huggingface_model, inputs=[search_results, file_choice],
+                                      outputs=load_status)
                 refresh_button.click(refresh_models, outputs=model_dropdown)
                 open_repo_button.click(open_huggingface_repo)
 
@@ -153,11 +529,16 @@ def create_gradio_interface():
                 with gr.Row():
                     load_chat_dropdown = gr.Dropdown(choices=get_previous_chats(), label="Load Previous Chat")
                     load_chat_button = gr.Button("Load Chat")
+                    refresh_chats_button = gr.Button("Refresh Chats")
                     new_chat_button = gr.Button("New Chat")
 
                 chat_history = gr.Chatbot()
                 user_input = gr.Textbox(placeholder="Type your message here...", lines=2)
                 send_button = gr.Button("Send")
+                with gr.Row():
+                    queue_status_button = gr.Button("Queue Status")
+                    queue_status = gr.Textbox(label="Queue Status", interactive=False, lines=4)
+                queue_status_button.click(get_queue_status, outputs=queue_status)
 
                 # Actions
                 send_button.click(
@@ -172,8 +553,10 @@ def create_gradio_interface():
                     outputs=chat_history
                 )
 
+                refresh_chats_button.click(refresh_previous_chats, outputs=load_chat_dropdown)
+
                 new_chat_button.click(
-                    lambda: ([], ""),
+                    new_chat,
                     inputs=None,
                     outputs=[chat_history, user_input]
                 )
@@ -181,107 +564,78 @@ def create_gradio_interface():
             with gr.TabItem("Visualization"):
                 gr.Markdown("# Visualization")
                 with gr.Tabs():
-                    with gr.TabItem("Layer Visualization"):
-                        gr.Markdown("### Layer Visualization")
-                        layer_vis = gr.HTML("<div id='layer-visualization'></div>")
-                        # Fetch visualization data and embed D3.js script
-                        layer_data = gr.State()
-
-                        def update_layer_visualization():
-                            data = get_visualization_json()
-                            return data
-
-                        layer_data_event = gr.Button("Load Layer Visualization Data")
-                        layer_data_event.click(update_layer_visualization, outputs=layer_data)
-
-                        # Embed D3.js script with the visualization data
-                        layer_vis_content = gr.HTML("""
-                        <script src="https://d3js.org/d3.v7.min.js"></script>
-                        <div id="visualization"></div>
-                        <script>
-                            const data = {data_json};
-
-                            // Example D3.js visualization
-                            const width = 800;
-                            const height = 600;
-
-                            const svg = d3.select("#visualization")
-                                          .append("svg")
-                                          .attr("width", width)
-                                          .attr("height", height);
-
-                            // Simple scatter plot example
-                            svg.selectAll("circle")
-                               .data(data.input.concat(data.output))
-                               .enter()
-                               .append("circle")
-                               .attr("cx", d => d.x * 10)
-                               .attr("cy", d => height - d.y)
-                               .attr("r", 5)
-                               .attr("fill", d => d.z === 0 ? "blue" : "red");
-                        </script>
-                        """)
-
-                        # Bind the data to the HTML component
-                        layer_data_event.click(
-                            lambda data: layer_vis_content.replace("{data_json}", json.dumps(data)),
-                            inputs=layer_data,
-                            outputs=layer_vis
+                    with gr.TabItem("Token Visualization"):
+                        gr.Markdown("### Token Visualization")
+                        token_text = gr.Textbox(label="Text", lines=6)
+                        token_score = gr.Checkbox(
+                            label="Score tokens (needs the model loaded with 'Keep All Logits' ticked)",
+                            value=False, interactive=False)
+                        for model_event in (model_loaded, model_unloaded):
+                            model_event.then(token_scoring_state, outputs=token_score)
+                        token_status = gr.Markdown()
+                        token_vis = gr.HTML("<div id='token-visualization'></div>")
+                        # Payload ID of the tokenized text
+                        token_data = gr.State()
+
+                        token_data_event = gr.Button("Tokenize")
+                        token_data_event.click(
+                            get_token_payload_id,
+                            inputs=[token_text, token_score],
+                            outputs=[token_data, token_status]
+                        ).then(
+                            lambda payload_id: render_visualization("tokens", payload_id, frame_height=700),
+                            inputs=token_data,
+                            outputs=token_vis
                         )
 
                     with gr.TabItem("Attention Visualization"):
                         gr.Markdown("### Attention Visualization")
-                        attention_vis = gr.HTML("<div id='attention-visualization'></div>")
-                        # Similar implementation as Layer Visualization
-                        attention_data = gr.State()
 
-                        def update_attention_visualization():
-                            data = get_visualization_json()  # Modify as per actual attention data
-                            return data
+                        # Opt-in instrumented generation; its capture replaces the example matrix
+                        with gr.Row():
+                            capture_prompt = gr.Textbox(label="Prompt", lines=2)
+                            capture_tokens = gr.Number(label="Max Tokens", value=64, precision=0)
+                            capture_stride = gr.Number(label="Position Stride", value=1, precision=0)
+                            capture_capacity = gr.Number(label="Positions Kept", value=DEFAULT_CAPTURE_CAPACITY,
+                                                         precision=0)
+                        capture_button = gr.Button("Generate with Capture")
+                        capture_output = gr.Textbox(label="Generated Text")
+                        capture_status = gr.Markdown()
+                        capture_button.click(
+                            run_capture_generation,
+                            inputs=[capture_prompt, capture_tokens, capture_stride, capture_capacity],
+                            outputs=[capture_output, capture_status]
+                        )
 
-                        attention_data_event = gr.Button("Load Attention Visualization Data")
-                        attention_data_event.click(update_attention_visualization, outputs=attention_data)
-
-                        attention_vis_content = gr.HTML("""
-                        <script src="https://d3js.org/d3.v7.min.js"></script>
-                        <div id="attention-visualization"></div>
-                        <script>
-                            const data = {data_json};
-
-                            // Example D3.js visualization for attention
-                            const width = 800;
-                            const height = 600;
-
-                            const svg = d3.select("#attention-visualization")
-                                          .append("svg")
-                                          .attr("width", width)
-                                          .attr("height", height);
-
-                            // Simple heatmap example
-                            const heatmapData = data.attention || [];
-
-                            const colorScale = d3.scaleSequential(d3.interpolateBlues)
-                                                 .domain([0, d3.max(heatmapData.flat())]);
-
-                            const cellSize = 20;
-
-                            svg.selectAll("rect")
-                               .data(heatmapData.flat())
-                               .enter()
-                               .append("rect")
-                               .attr("x", (d, i) => (i % 30) * cellSize)
-                               .attr("y", (d, i) => Math.floor(i / 30) * cellSize)
-                               .attr("width", cellSize)
-                               .attr("height", cellSize)
-                               .attr("fill", d => colorScale(d));
-                        </script>
-                        """)
-
-                        # Bind the data to the HTML component
+                        # Live mode: the view is mounted once, then only the new positions are sent
+                        live_button = gr.Button("Generate with Live View")
+                        live_view = gr.HTML(elem_id="live-capture-view")
+                        live_delta = gr.Textbox(visible=False)
+                        live_button.click(
+                            render_live_view,
+                            outputs=live_view
+                        ).then(
+                            run_live_capture,
+                            inputs=[capture_prompt, capture_tokens, capture_stride, capture_capacity],
+                            outputs=[capture_output, capture_status, live_delta]
+                        )
+                        live_delta.change(None, inputs=live_delta, outputs=None,
+                                          _js=visualization_utils.LIVE_DELTA_JS)
+
+                        # The last capture (or the example matrix) as level-of-detail tiles
+                        gr.Markdown("#### Attention Tiles")
+                        with gr.Row():
+                            attention_level = gr.Number(label="Level (-1 for overview)", value=-1, precision=0)
+                            attention_row = gr.Number(label="Tile Row", value=0, precision=0)
+                            attention_column = gr.Number(label="Tile Column", value=0, precision=0)
+                            attention_field = gr.Radio(["mean", "min", "max"], value="max", label="Pooling")
+                        attention_data_event = gr.Button("Load Attention Tile")
+                        attention_status = gr.Markdown()
+                        attention_vis = gr.HTML()
                         attention_data_event.click(
-                            lambda data: attention_vis_content.replace("{data_json}", json.dumps(data)),
-                            inputs=attention_data,
-                            outputs=attention_vis
+                            load_attention_tile,
+                            inputs=[attention_level, attention_row, attention_column, attention_field],
+                            outputs=[attention_status, attention_vis]
                         )
 
                     with gr.TabItem("Weight Visualization"):
@@ -290,59 +644,32 @@ def create_gradio_interface():
                         # Similar implementation as above
                         weight_data = gr.State()
 
-                        def update_weight_visualization():
-                            data = get_visualization_json()  # Modify as per actual weight data
-                            return data
-
                         weight_data_event = gr.Button("Load Weight Visualization Data")
-                        weight_data_event.click(update_weight_visualization, outputs=weight_data)
-
-                        weight_vis_content = gr.HTML("""
-                        <script src="https://d3js.org/d3.v7.min.js"></script>
-                        <div id="weight-visualization"></div>
-                        <script>
-                            const data = {data_json};
-
-                            // Example D3.js visualization for weights
-                            const width = 800;
-                            const height = 600;
-
-                            const svg = d3.select("#weight-visualization")
-                                          .append("svg")
-                                          .attr("width", width)
-                                          .attr("height", height);
-
-                            // Simple bar chart example
-                            const weights = data.weights || [];
-
-                            const xScale = d3.scaleBand()
-                                             .domain(d3.range(weights.length))
-                                             .range([0, width])
-                                             .padding(0.1);
-
-                            const yScale = d3.scaleLinear()
-                                             .domain([0, d3.max(weights)])
-                                             .range([height, 0]);
-
-                            svg.selectAll("rect")
-                               .data(weights)
-                               .enter()
-                               .append("rect")
-                               .attr("x", (d, i) => xScale(i))
-                               .attr("y", d => yScale(d))
-                               .attr("width", xScale.bandwidth())
-                               .attr("height", d => height - yScale(d))
-                               .attr("fill", "steelblue");
-                        </script>
-                        """)
-
-                        # Bind the data to the HTML component
-                        weight_data_event.click(
-                            lambda data: weight_vis_content.replace("{data_json}", json.dumps(data)),
+                        weight_data_event.click(get_visualization_payload_id, outputs=weight_data).then(
+                            lambda payload_id: render_visualization("weight", payload_id),
                             inputs=weight_data,
                             outputs=weight_vis
                         )
 
+                        gr.Markdown("#### Weight Tiles")
+                        with gr.Row():
+                            tile_tensor = gr.Dropdown(label="Tensor", choices=[])
+                            tile_level = gr.Number(label="Level (-1 for overview)", value=-1, precision=0)
+                            tile_row = gr.Number(label="Tile Row", value=0, precision=0)
+                            tile_column = gr.Number(label="Tile Column", value=0, precision=0)
+                            tile_field = gr.Radio(["mean", "min", "max"], value="mean", label="Pooling")
+                        with gr.Row():
+                            list_tensors_button = gr.Button("List Tensors")
+                            load_tile_button = gr.Button("Load Tile")
+                        tile_status = gr.Markdown()
+                        tile_vis = gr.HTML()
+                        list_tensors_button.click(list_weight_tensors, outputs=tile_tensor)
+                        load_tile_button.click(
+                            load_weight_tile,
+                            inputs=[tile_tensor, tile_level, tile_row, tile_column, tile_field],
+                            outputs=[tile_status, tile_vis]
+                        )
+
                     with gr.TabItem("Node Embedding Visualization"):
                         gr.Markdown("### Node Embedding Visualization")
                         embedding_vis = gr.HTML("<div id='embedding-visualization'></div>")
@@ -350,147 +677,47 @@ def create_gradio_interface():
                         embedding_data = gr.State()
 
                         def update_embedding_visualization():
-                            data = get_visualization_json()  # Modify as per actual embedding data
+                            data = get_embedding_visualization_json()
                             return data
 
+                        def render_embedding_visualization(data):
+                            # Highlighted neighbourhoods change the data, so it is stored again by content
+                            payload_id = visualization_renderer.store.put(encode_payload(data)) if data else None
+                            return render_visualization("embedding", payload_id)
+
                         embedding_data_event = gr.Button("Load Embedding Visualization Data")
-                        embedding_data_event.click(update_embedding_visualization, outputs=embedding_data)
-
-                        embedding_vis_content = gr.HTML("""
-                        <script src="https://d3js.org/d3.v7.min.js"></script>
-                        <div id="embedding-visualization"></div>
-                        <script>
-                            const data = {data_json};
-
-                            // Example D3.js visualization for node embeddings
-                            const width = 800;
-                            const height = 600;
-
-                            const svg = d3.select("#embedding-visualization")
-                                          .append("svg")
-                                          .attr("width", width)
-                                          .attr("height", height);
-
-                            // Assuming embeddings are 3D coordinates
-                            const embeddings = data.embeddings || [];
-
-                            // Simple scatter plot for 3D embeddings projected to 2D
-                            svg.selectAll("circle")
-                               .data(embeddings)
-                               .enter()
-                               .append("circle")
-                               .attr("cx", d => d[0] * 10 + width / 2)
-                               .attr("cy", d => -d[1] * 10 + height / 2)
-                               .attr("r", 5)
-                               .attr("fill", "green")
-                               .attr("opacity", 0.6);
-                        </script>
-                        """)
-
-                        # Bind the data to the HTML component
-                        embedding_data_event.click(
-                            lambda data: embedding_vis_content.replace("{data_json}", json.dumps(data)),
+                        embedding_data_event.click(update_embedding_visualization, outputs=embedding_data).then(
+                            render_embedding_visualization,
                             inputs=embedding_data,
                             outputs=embedding_vis
                         )
 
+                        with gr.Row():
+                            neighbour_token = gr.Textbox(label="Token (text or id)")
+                            neighbour_count = gr.Number(label="Neighbours", value=10, precision=0)
+                            neighbour_button = gr.Button("Nearest Tokens")
+                        neighbour_status = gr.Markdown()
+                        neighbour_table = gr.Dataframe(headers=["Token ID", "Token", "Cosine Similarity"])
+                        neighbour_button.click(
+                            find_nearest_tokens,
+                            inputs=[neighbour_token, neighbour_count, embedding_data],
+                            outputs=[neighbour_status, neighbour_table, embedding_data]
+                        ).then(render_embedding_visualization, inputs=embedding_data, outputs=embedding_vis)
+
                     with gr.TabItem("Brain Visualization"):
                         gr.Markdown("### Brain Visualization")
                         brain_vis = gr.HTML("<div id='brain-visualization'></div>")
-                        # Fetch brain visualization data and embed Three.js scripts
+                        brain_expand_experts = gr.Checkbox(label="One node per MoE expert", value=False)
+                        # Packed node and link buffers of the layer graph
                         brain_data = gr.State()
 
-                        def update_brain_visualization():
-                            data = get_brain_visualization_json()
-                            return data
-
                         brain_data_event = gr.Button("Load Brain Visualization Data")
-                        brain_data_event.click(update_brain_visualization, outputs=brain_data)
-
-                        brain_vis_content_template = """
-                        <script src="https://cdnjs.cloudflare.com/ajax/libs/three.js/r128/three.min.js"></script>
-                        <script src="https://cdnjs.cloudflare.com/ajax/libs/three.js/r128/controls/OrbitControls.js"></script>
-                        <div id="brain-visualization-container" style="width: 800px; height: 600px;"></div>
-                        <script>
-                            (function() {{
-                                const data = {data_json};
-
-                                // Initialize Three.js scene
-                                const scene = new THREE.Scene();
-                                const camera = new THREE.PerspectiveCamera(75, 800/600, 0.1, 1000);
-                                const renderer = new THREE.WebGLRenderer({{alpha: true}});
-                                renderer.setSize(800, 600);
-                                document.getElementById('brain-visualization-container').appendChild(renderer.domElement);
-
-                                // Add orbit controls for interactivity
-                                const controls = new THREE.OrbitControls(camera, renderer.domElement);
-
-                                // Add ambient and point lights
-                                const ambientLight = new THREE.AmbientLight(0xffffff, 0.5);
-                                scene.add(ambientLight);
-
-                                const pointLight = new THREE.PointLight(0xffffff, 1);
-                                pointLight.position.set(50, 50, 50);
-                                scene.add(pointLight);
-
-                                // Add semi-translucent brain mesh (placeholder)
-                                const brainGeometry = new THREE.SphereGeometry(10, 64, 64);
-                                const brainMaterial = new THREE.MeshPhongMaterial({{
-                                    color: 0x156289,
-                                    emissive: 0x072534,
-                                    side: THREE.DoubleSide,
-                                    transparent: true,
-                                    opacity: 0.3
-                                }});
-                                const brainMesh = new THREE.Mesh(brainGeometry, brainMaterial);
-                                scene.add(brainMesh);
-
-                                // Add nodes (neurons or layers)
-                                data.nodes.forEach(node => {{
-                                    const nodeGeometry = new THREE.SphereGeometry(0.5 * node.size, 16, 16);
-                                    const nodeMaterial = new THREE.MeshBasicMaterial({{color: node.color}});
-                                    const nodeMesh = new THREE.Mesh(nodeGeometry, nodeMaterial);
-                                    nodeMesh.position.set(node.x, node.y, node.z);
-                                    scene.add(nodeMesh);
-                                }});
-
-                                // Add links (connections between nodes)
-                                data.links.forEach(link => {{
-                                    const sourceNode = data.nodes.find(node => node.id === link.source);
-                                    const targetNode = data.nodes.find(node => node.id === link.target);
-                                    if (sourceNode && targetNode) {{
-                                        const points = [];
-                                        points.push(new THREE.Vector3(sourceNode.x, sourceNode.y, sourceNode.z));
-                                        points.push(new THREE.Vector3(targetNode.x, targetNode.y, targetNode.z));
-                                        const geometry = new THREE.BufferGeometry().setFromPoints(points);
-                                        const material = new THREE.LineBasicMaterial({{color: 0xffffff, linewidth: link.value}});
-                                        const line = new THREE.Line(geometry, material);
-                                        scene.add(line);
-                                    }}
-                                }});
-
-                                camera.position.z = 30;
-
-                                // Animation loop
-                                function animate() {{
-                                    requestAnimationFrame(animate);
-                                    controls.update();
-                                    renderer.render(scene, camera);
-                                }}
-
-                                animate();
-                            }})();
-                        </script>
-                        """
-
-                        # Function to inject data into the brain visualization HTML
-                        def update_brain_vis_content(data):
-                            data_json = json.dumps(data)
-                            return brain_vis_content_template.replace("{data_json}", data_json)
-
-                        # Bind the data to the HTML component
                         brain_data_event.click(
-                            update_brain_vis_content,
+                            get_brain_visualization_json,
+                            inputs=brain_expand_experts,
+                            outputs=brain_data
+                        ).then(
+                            lambda payload_id: render_visualization("brain", payload_id, frame_height=610, height=600),
                             inputs=brain_data,
                             outputs=brain_vis
                         )
@@ -507,6 +734,19 @@ def create_gradio_interface():
                     outputs=experiment_output
                 )
 
+                gr.Markdown("## Batch Run")
+                batch_file = gr.File(label="Prompts (JSONL)", file_types=[".jsonl"])
+                batch_experiment = gr.Dropdown(choices=list(EXPERIMENTS), value="self_referential", label="Experiment")
+                batch_system_prompt = gr.Textbox(label="System Prompt (shared by every prompt)", lines=2)
+                batch_button = gr.Button("Run Batch")
+                batch_output = gr.Textbox(label="Batch Summary", interactive=False, lines=6)
+
+                batch_button.click(
+                    run_batch_experiment_file,
+                    inputs=[batch_file, batch_experiment, batch_system_prompt],
+                    outputs=batch_output
+                )
+
             with gr.TabItem("Run Tests"):
                 gr.Markdown("# Run Unit Tests")
                 test_output = gr.Textbox(label="Test Output", interactive=False, lines=15)
@@ -517,4 +757,19 @@ def create_gradio_interface():
                     outputs=test_output
                 )
 
+        # Generator callbacks (streamed chat responses) require the queue. Gradio may run
+        # many handlers at once; the inference scheduler provides the actual backpressure.
+        demo.queue(concurrency_count=GRADIO_CONCURRENCY)
         return demo
+
+def launch(server_name="0.0.0.0", server_port=None):
+    # demo.launch() would serve the interface without the payload route, so the app from
+    # create_app is run under uvicorn instead. The port follows Gradio's own variable.
+    import uvicorn
+
+    if server_port is None:
+        server_port = int(os.environ.get("GRADIO_SERVER_PORT", 7933))
+    uvicorn.run(create_app(), host=server_name, port=server_port)
+
+if __name__ == "__main__":
+    launch()
@@ -1,18 +1,17 @@
 # main.py
 
-import torch
 import gradio as gr
-from modules.gguf_model import GGUFModel  # Adjust the import based on your project structure
+from modules.gguf_model import GGUFModel, detect_device  # Adjust the import based on your project structure
 # Import other necessary modules
 
 def get_device():
     """Detects if CUDA is available and returns the appropriate device."""
-    if torch.cuda.is_available():
+    if detect_device() == "cuda":
         print("CUDA is available. Using GPU.")
-        return torch.device("cuda")
+        return "cuda"
     else:
         print("CUDA is not available. Falling back to CPU.")
-        return torch.device("cpu")
+        return "cpu"
 
 def main():
     try:
@@ -24,7 +23,7 @@ def main():
             model_path='models/your_model.gguf',  # Replace with your actual model path
             device=device,
             n_ctx=2048,
-            n_gpu_layers=40 if device.type == 'cuda' else 0,
+            n_gpu_layers=40 if device == 'cuda' else 0,
             n_threads=8
         )
         model.load_model()
@@ -1,25 +1,97 @@
 # modules/brain_visualization.py
 
-import json
+from modules.payload_codec import encode_payload
 
-def prepare_brain_visualization_data(model):
+# Rendered by template_renderer.TemplateRenderer with {{load_payload}} and {{height}}
+BRAIN_TEMPLATE = """<body style="margin:0;background:#111;color:#ddd;font:12px sans-serif">
+<div id="legend" style="position:absolute;top:6px;left:8px"></div>
+<div id="brain" style="width:100%;height:{{height}}px"></div>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/three.js/r128/three.min.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/three@0.128.0/examples/js/controls/OrbitControls.js"></script>
+<script>
+{{load_payload}}.then(function (data) {
+    const container = document.getElementById("brain");
+    const width = container.clientWidth, height = container.clientHeight;
+    const scene = new THREE.Scene();
+    const camera = new THREE.PerspectiveCamera(60, width / height, 0.1, 20 * data.radius);
+    const renderer = new THREE.WebGLRenderer({antialias: true});
+    renderer.setPixelRatio(window.devicePixelRatio);
+    renderer.setSize(width, height);
+    container.appendChild(renderer.domElement);
+    scene.add(new THREE.AmbientLight(0xffffff, 0.6));
+    const light = new THREE.DirectionalLight(0xffffff, 0.8);
+    light.position.set(1, 1, 1);
+    scene.add(light);
+
+    // The layout is centred on the origin so the orbit controls turn around the model
+    const graph = new THREE.Group();
+    graph.position.set(-data.center[0], -data.center[1], -data.center[2]);
+    scene.add(graph);
+
+    // Every node is an instance of one sphere: a single draw call, whose instance
+    // matrices (a scale and a translation) are written straight into the GPU buffer
+    const count = data.count;
+    const nodes = new THREE.InstancedMesh(new THREE.IcosahedronGeometry(0.5, 1),
+                                          new THREE.MeshLambertMaterial(), count);
+    const matrices = nodes.instanceMatrix.array;
+    for (let i = 0; i < count; i++) {
+        const m = 16 * i, size = data.sizes[i];
+        matrices[m] = size;
+        matrices[m + 5] = size;
+        matrices[m + 10] = size;
+        matrices[m + 12] = data.positions[3 * i];
+        matrices[m + 13] = data.positions[3 * i + 1];
+        matrices[m + 14] = data.positions[3 * i + 2];
+        matrices[m + 15] = 1;
+    }
+    nodes.instanceColor = new THREE.InstancedBufferAttribute(data.colors, 3);
+    // The bounding sphere of an InstancedMesh is the one of its base geometry
+    nodes.frustumCulled = false;
+    graph.add(nodes);
+
+    // All links are one indexed LineSegments sharing the node position buffer
+    if (data.edges.length) {
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute("position", new THREE.BufferAttribute(data.positions, 3));
+        geometry.setAttribute("color", new THREE.BufferAttribute(data.colors, 3));
+        geometry.setIndex(new THREE.BufferAttribute(data.edges, 1));
+        const links = new THREE.LineSegments(geometry, new THREE.LineBasicMaterial(
+            {vertexColors: true, transparent: true, opacity: 0.35}));
+        links.frustumCulled = false;
+        graph.add(links);
+    }
+
+    const present = new Set(data.kinds);
+    document.getElementById("legend").innerHTML =
+        `${count} nodes, ${data.edges.length / 2} links<br>` +
+        data.kind_names.map((name, k) => present.has(k) ?
+            `<span style="color:${data.kind_colors[k]}">&#9679;</span> ${name}` : "").filter(Boolean).join(" ");
+
+    camera.position.set(0, 0, 1.6 * data.radius);
+    const controls = THREE.OrbitControls ? new THREE.OrbitControls(camera, renderer.domElement) : null;
+    function animate() {
+        requestAnimationFrame(animate);
+        if (controls) controls.update();
+        renderer.render(scene, camera);
+    }
+    animate();
+});
+</script></body>"""
+
+def prepare_brain_visualization_data(model, expand_experts=False, compression=None):
     """
     Prepares data for the 3D brain visualization.
 
     :param model: Instance of GGUFModel.
-    :return: Dictionary containing nodes and links for visualization.
+    :param expand_experts: One node per expert of MoE tensors instead of one per tensor.
+    :param compression: Optional 'gzip' or 'zstd' compression of the buffers.
+    :return: JSON payload of the packed node and edge buffers (see LayerGraph.to_buffers),
+             or None without a model.
     """
     if model is None:
-        return {}
+        return None
 
-    # Extract nodes and links from the model
-    nodes = model.get_brain_nodes()
-    links = model.get_brain_links()
-
-    # Prepare the data dictionary
-    brain_data = {
-        "nodes": nodes,
-        "links": links
-    }
+    # Nodes and links come from the component graph of the GGUF tensor table
+    buffers = model.get_layer_graph(expand_experts=expand_experts).to_buffers()
 
-    return brain_data
+    return encode_payload(buffers, compression=compression)
@@ -0,0 +1,365 @@
+# modules/chat_store.py
+
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+DEFAULT_DB_PATH = os.path.join('outputs', 'chats.db')
+DEFAULT_PAGE_SIZE = 50
+TITLE_LENGTH = 60
+DEFAULT_WRITE_QUEUE = 1024
+DEFAULT_WRITE_BATCH = 256
+DEFAULT_SYNC_INTERVAL = 1.0  # Seconds between WAL checkpoints, which fsync the database
+DEFAULT_PUT_TIMEOUT = 0.0  # Seconds submit() may wait on a full queue before writing itself
+
+_STOP = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    model TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    created_at REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS messages_by_time ON messages(created_at);
+CREATE INDEX IF NOT EXISTS sessions_by_update ON sessions(updated_at, id);
+"""
+
+_LEGACY_NAME = re.compile(r"chat_(\d{8})_(\d{6})\.json$")
+
+
+def new_session_id():
+    """
+    :return: A new random chat session identifier.
+    """
+    return uuid.uuid4().hex
+
+
+class ChatStore:
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        """
+        Stores chat sessions in a single SQLite database in WAL mode. Appending a message
+        is one indexed insert, and listing, loading and time-range queries use indexes,
+        so the cost does not grow with the number of stored chats.
+
+        :param db_path: Path to the database file (':memory:' for a private in-memory store).
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory and db_path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+        self.created = db_path == ':memory:' or not os.path.exists(db_path)
+        # One connection shared by the Gradio worker threads, serialized by a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def checkpoint(self):
+        """
+        Copies the write-ahead log into the database file. With synchronous=NORMAL the
+        commits are only made durable by this fsync, so ChatWriter calls it periodically.
+        """
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def append(self, session_id, prompt, response, created_at=None, model=None):
+        """
+        Appends one prompt/response pair to a session, creating the session if needed.
+
+        :param session_id: Chat session identifier.
+        :param prompt: User input.
+        :param response: Model's response.
+        :param created_at: Unix timestamp of the message (defaults to now).
+        :param model: Optional model name recorded when the session is created.
+        :return: Row id of the new message.
+        """
+        return self.append_many([(session_id, prompt, response, created_at, model)])[0]
+
+    def append_many(self, messages):
+        """
+        Appends several messages in a single transaction.
+
+        :param messages: Iterable of (session_id, prompt, response, created_at, model) tuples;
+                         created_at and model may be None.
+        :return: List of the new message row ids.
+        """
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for session_id, prompt, response, created_at, model in messages:
+                    created_at = time.time() if created_at is None else created_at
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO sessions (id, title, model, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (session_id, " ".join(prompt.split())[:TITLE_LENGTH], model, created_at, created_at))
+                    self._conn.execute(
+                        "UPDATE sessions SET updated_at = MAX(updated_at, ?), message_count = message_count + 1 "
+                        "WHERE id = ?", (created_at, session_id))
+                    cursor = self._conn.execute(
+                        "INSERT INTO messages (session_id, created_at, prompt, response) VALUES (?, ?, ?, ?)",
+                        (session_id, created_at, prompt, response))
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def list_sessions(self, limit=DEFAULT_PAGE_SIZE, before=None):
+        """
+        Lists sessions, most recently updated first, one page at a time.
+
+        :param limit: Maximum number of sessions to return.
+        :param before: Cursor returned with the previous page, or None for the first page.
+        :return: Tuple (list of session dictionaries, cursor for the next page or None).
+        """
+        query = "SELECT * FROM sessions"
+        params = []
+        if before is not None:
+            query += " WHERE (updated_at, id) < (?, ?)"
+            params.extend(before)
+        query += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(query, params)]
+        cursor = (rows[-1]["updated_at"], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, cursor
+
+    def get_session(self, session_id):
+        """
+        :param session_id: Chat session identifier.
+        :return: Session dictionary, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def load_session(self, session_id):
+        """
+        Loads every message of a session in the order they were created (a message the
+        ChatWriter wrote synchronously can reach the database before earlier queued ones).
+
+        :param session_id: Chat session identifier.
+        :return: List of message dictionaries.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE session_id = ? ORDER BY created_at, id", (session_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def messages_between(self, start=None, end=None, session_id=None, limit=None):
+        """
+        Returns the messages written in a time range, oldest first.
+
+        :param start: Unix timestamp of the start of the range (inclusive), or None.
+        :param end: Unix timestamp of the end of the range (exclusive), or None.
+        :param session_id: Optionally restrict the query to one session.
+        :param limit: Maximum number of messages to return.
+        :return: List of message dictionaries.
+        """
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("created_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("created_at < ?")
+            params.append(end)
+        if session_id is not None:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        query = "SELECT * FROM messages"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_json_chats(self, directory='outputs'):
+        """
+        Imports the chat_<timestamp>.json files written by earlier versions. Each file
+        held one prompt/response pair; the pairs are grouped into one session per day.
+        The files themselves are left in place.
+
+        :param directory: Directory containing the legacy chat files.
+        :return: Number of imported messages.
+        """
+        if not os.path.isdir(directory):
+            return 0
+        messages = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                match = _LEGACY_NAME.match(entry.name)
+                if not match:
+                    continue
+                try:
+                    with open(entry.path, 'r') as f:
+                        chat_data = json.load(f)
+                    prompt, response = chat_data["prompt"], chat_data["response"]
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Skipping chat file '{entry.name}': {e}")
+                    continue
+                created_at = datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S").timestamp()
+                messages.append((f"imported-{match.group(1)}", prompt, response, created_at, None))
+        messages.sort(key=lambda m: m[3])
+        if messages:
+            self.append_many(messages)
+        return len(messages)
+
+
+class ChatWriter:
+    def __init__(self, store, max_queue=DEFAULT_WRITE_QUEUE, batch_size=DEFAULT_WRITE_BATCH,
+                 sync_interval=DEFAULT_SYNC_INTERVAL, put_timeout=DEFAULT_PUT_TIMEOUT):
+        """
+        Writes chat messages to a ChatStore on a background thread, so responses never
+        wait for disk I/O. Queued messages are committed in batches (one transaction per
+        batch) and the database is synced every sync_interval seconds.
+
+        :param store: ChatStore the messages are written to.
+        :param max_queue: Maximum number of messages waiting to be written.
+        :param batch_size: Maximum number of messages committed in one transaction.
+        :param sync_interval: Seconds between syncs of the database to disk.
+        :param put_timeout: Seconds submit() waits for room in a full queue before it
+                            writes the message itself (0 writes immediately).
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._counters = {"written": 0, "synchronous": 0, "batches": 0, "failed": 0, "syncs": 0}
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer_loop, name="chat-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id, prompt, response, created_at=None, model=None):
+        """
+        Queues a message for writing and returns immediately. When the queue is full the
+        message is written synchronously instead, so it is never lost.
+
+        :param session_id: Chat session identifier.
+        :param prompt: User input.
+        :param response: Model's response.
+        :param created_at: Unix timestamp of the message (defaults to now).
+        :param model: Optional model name recorded when the session is created.
+        :return: True if the message was queued, False if it was written synchronously.
+        :raises sqlite3.Error: If the synchronous write fails.
+        """
+        if self._closed:
+            raise RuntimeError("The chat writer has been closed.")
+        message = (session_id, prompt, response, time.time() if created_at is None else created_at, model)
+        try:
+            if self.put_timeout:
+                self._queue.put(message, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            # The writer is behind; writing here is slower but keeps the message. Its
+            # created_at still orders it correctly among the queued messages.
+            print(f"Chat writer queue is full; writing a message of session '{session_id}' synchronously.")
+            self.store.append_many([message])
+            self._counters["synchronous"] += 1
+            return False
+
+    def flush(self):
+        """
+        Waits until every queued message has been written.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Writes the remaining messages, syncs the database and stops the writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def metrics(self):
+        """
+        :return: Dictionary of writer counters and the current queue depth.
+        """
+        metrics = dict(self._counters)
+        metrics["queue_depth"] = self._queue.qsize()
+        return metrics
+
+    def _writer_loop(self):
+        last_sync = time.monotonic()
+        dirty = False
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.sync_interval)
+            except queue.Empty:
+                item = None
+            batch = []
+            if item is _STOP:
+                stop = True
+            elif item is not None:
+                batch.append(item)
+            # Group commit: everything that queued up meanwhile goes into the same transaction
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    self.store.append_many(batch)
+                    self._counters["written"] += len(batch)
+                    self._counters["batches"] += 1
+                    dirty = True
+                except Exception as e:
+                    self._counters["failed"] += len(batch)
+                    print(f"Failed to write {len(batch)} chat messages: {e}")
+            if dirty and (stop or time.monotonic() - last_sync >= self.sync_interval):
+                try:
+                    self.store.checkpoint()
+                    self._counters["syncs"] += 1
+                except Exception as e:
+                    print(f"Failed to sync the chat database: {e}")
+                dirty = False
+                last_sync = time.monotonic()
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
@@ -1,8 +1,16 @@
 # data_utils.py
 
+import atexit
 import os
-import json
-from datetime import datetime
+import threading
+from modules.chat_store import ChatStore, ChatWriter, DEFAULT_PAGE_SIZE, new_session_id
+
+CHAT_DB_PATH = os.path.join('outputs', 'chats.db')
+CHAT_SYNC_INTERVAL = 1.0  # Seconds between syncs of the chat database to disk
+
+_chat_store = None
+_chat_writer = None
+_chat_store_lock = threading.RLock()
 
 def ensure_directory_exists(directory):
     """
@@ -13,31 +21,74 @@ def ensure_directory_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def save_chat(prompt, response):
+def get_chat_store():
+    """
+    Returns the shared chat store, opening it on first use. When the database is
+    created, chats saved as individual JSON files by earlier versions are imported.
+
+    :return: ChatStore instance.
+    """
+    global _chat_store
+    with _chat_store_lock:
+        if _chat_store is None:
+            _chat_store = ChatStore(CHAT_DB_PATH)
+            if _chat_store.created:
+                imported = _chat_store.import_json_chats('outputs')
+                if imported:
+                    print(f"Imported {imported} chat messages into {CHAT_DB_PATH}.")
+        return _chat_store
+
+def get_chat_writer():
+    """
+    Returns the shared background chat writer, starting it on first use. Queued
+    messages are flushed when the interpreter exits.
+
+    :return: ChatWriter instance.
     """
-    Save the chat session to a JSON file.
+    global _chat_writer
+    with _chat_store_lock:
+        if _chat_writer is None:
+            _chat_writer = ChatWriter(get_chat_store(), sync_interval=CHAT_SYNC_INTERVAL)
+            atexit.register(_chat_writer.close)
+        return _chat_writer
+
+def save_chat(prompt, response, session_id=None, model=None):
+    """
+    Queue a prompt/response pair for appending to a chat session. The write happens
+    on a background thread, so this returns without touching the disk.
 
     :param prompt: User input.
     :param response: Model's response.
+    :param session_id: Chat session identifier (a new session is started if None).
+    :param model: Optional name of the model that produced the response.
+    :return: The session identifier.
+    """
+    session_id = session_id or new_session_id()
+    get_chat_writer().submit(session_id, prompt, response, model=model)
+    return session_id
+
+def list_chats(limit=DEFAULT_PAGE_SIZE, before=None):
     """
-    ensure_directory_exists('outputs')
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    chat_file = os.path.join('outputs', f"chat_{timestamp}.json")
-    chat_data = {
-        "prompt": prompt,
-        "response": response
-    }
-    with open(chat_file, 'w') as f:
-        json.dump(chat_data, f)
+    List chat sessions, most recent first.
 
-def load_chat(chat_file):
+    :param limit: Page size.
+    :param before: Cursor returned with the previous page.
+    :return: Tuple (list of session dictionaries, cursor for the next page or None).
     """
-    Load a chat session from a JSON file.
+    _flush_pending_chats()
+    return get_chat_store().list_sessions(limit=limit, before=before)
 
-    :param chat_file: Chat file name.
-    :return: Chat data.
+def load_chat(session_id):
     """
-    chat_path = os.path.join('outputs', chat_file)
-    with open(chat_path, 'r') as f:
-        chat_data = json.load(f)
-    return chat_data
+    Load all messages of a chat session.
+
+    :param session_id: Chat session identifier.
+    :return: List of message dictionaries with 'prompt' and 'response' keys.
+    """
+    _flush_pending_chats()
+    return get_chat_store().load_session(session_id)
+
+def _flush_pending_chats():
+    # Reads should see the messages saved just before them
+    if _chat_writer is not None:
+        _chat_writer.flush()
@@ -1,39 +1,478 @@
 # modules/download_tool.py
 
-from huggingface_hub import HfApi
+import hashlib
+import itertools
+import json
 import os
-import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-def search_models(query):
+HF_ENDPOINT = "https://huggingface.co"
+DEFAULT_CONNECTIONS = 4
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024  # Unit of work and of resume bookkeeping
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 5
+READ_BUFFER_BYTES = 1024 * 1024
+PROGRESS_INTERVAL = 0.5  # Seconds between progress callbacks
+SIDECAR_INTERVAL = 1.0  # Seconds between saves of the resume sidecar
+DEFAULT_SEARCH_LIMIT = 50
+DEFAULT_SEARCH_TTL = 600  # Seconds a cached search result stays fresh
+DEFAULT_SEARCH_TIMEOUT = 10
+DEFAULT_SEARCH_CACHE_ENTRIES = 256
+DEFAULT_SEARCH_CACHE_PATH = os.path.join('outputs', 'cache', 'hf_search.json')
+
+
+class DownloadError(RuntimeError):
+    """Raised when a download cannot be completed or fails verification."""
+
+
+class ModelSearch:
+    def __init__(self, client=None, ttl=DEFAULT_SEARCH_TTL, cache_path=DEFAULT_SEARCH_CACHE_PATH,
+                 timeout=DEFAULT_SEARCH_TIMEOUT, max_entries=DEFAULT_SEARCH_CACHE_ENTRIES):
+        """
+        Bounded, cached search of HuggingFace Hub models.
+
+        Results are fetched with a limit, so a broad query never materializes the whole
+        Hub listing. Recent queries are served from a TTL cache, which is also saved to
+        disk: when the Hub cannot be reached, the last results for a query are returned
+        even if they have expired.
+
+        :param client: Object with an HfApi-compatible list_models(search=, filter=, sort=,
+                       direction=, limit=) method (defaults to huggingface_hub.HfApi()).
+        :param ttl: Seconds a cached result is considered fresh.
+        :param cache_path: JSON file persisting the cache (None keeps it in memory only).
+        :param timeout: Seconds to wait for the Hub before falling back to the cache.
+        :param max_entries: Maximum number of cached queries.
+        """
+        self._client = client
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # query key -> (fetched_at, model ids, number requested)
+        self._lock = threading.Lock()
+        # Searches run on a worker thread, so a stalled request only costs the caller the timeout
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hf-search")
+        self._load_cache()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from huggingface_hub import HfApi
+            self._client = HfApi()
+        return self._client
+
+    def search(self, query, page=0, page_size=DEFAULT_SEARCH_LIMIT, gguf_only=True):
+        """
+        Searches for models whose ID contains the query, most downloaded first.
+
+        :param query: Search string.
+        :param page: Zero-based page number.
+        :param page_size: Number of models per page.
+        :param gguf_only: Only return repositories tagged as GGUF.
+        :return: Dictionary with the page's "models" (list of IDs), "page", "has_more",
+                 "cached" (served from the cache) and "stale" (expired cache used offline).
+        """
+        key = f"{int(bool(gguf_only))}:{query.strip().lower()}"
+        # One extra result tells whether there is a next page
+        needed = (page + 1) * page_size + 1
+        with self._lock:
+            entry = self._cache.get(key)
+        cached = stale = False
+        if entry is not None and time.time() - entry[0] < self.ttl and (
+                len(entry[1]) >= needed or len(entry[1]) < entry[2]):
+            ids = entry[1]
+            cached = True
+        else:
+            try:
+                future = self._executor.submit(self._fetch, query.strip(), gguf_only, needed)
+                ids = future.result(timeout=self.timeout)
+                self._store(key, ids, needed)
+            except Exception as e:
+                if entry is None:
+                    raise DownloadError(f"Model search failed and no cached results exist: {e}") from e
+                print(f"Model search failed ({e}); using cached results.")
+                ids = entry[1]
+                cached = stale = True
+        start = page * page_size
+        return {
+            "models": ids[start:start + page_size],
+            "page": page,
+            "has_more": len(ids) > start + page_size,
+            "cached": cached,
+            "stale": stale,
+        }
+
+    def _fetch(self, query, gguf_only, limit):
+        kwargs = {"search": query or None, "sort": "downloads", "direction": -1, "limit": limit}
+        if gguf_only:
+            kwargs["filter"] = "gguf"
+        results = itertools.islice(self.client.list_models(**kwargs), limit)
+        return [getattr(model, "id", None) or model.modelId for model in results]
+
+    def _store(self, key, ids, requested):
+        with self._lock:
+            # The number requested is kept: fewer results than that means the list is complete
+            self._cache[key] = (time.time(), ids, requested)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            snapshot = {k: list(v) for k, v in self._cache.items()}
+        self._save_cache(snapshot)
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                saved = json.load(f)
+            for key, (fetched_at, ids, requested) in saved.items():
+                self._cache[key] = (fetched_at, ids, requested)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Ignoring unreadable search cache '{self.cache_path}': {e}")
+
+    def _save_cache(self, snapshot):
+        if not self.cache_path:
+            return
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not save the search cache: {e}")
+
+
+_default_search = None
+
+
+def get_model_search():
+    """
+    :return: The shared ModelSearch, created on first use.
+    """
+    global _default_search
+    if _default_search is None:
+        _default_search = ModelSearch()
+    return _default_search
+
+
+def search_models(query, page=0, page_size=DEFAULT_SEARCH_LIMIT, gguf_only=True):
     """
     Search for models on HuggingFace Hub matching the query.
 
     :param query: Search query string.
-    :return: List of model IDs matching the query.
+    :param page: Zero-based page number.
+    :param page_size: Number of models per page.
+    :param gguf_only: Only return repositories tagged as GGUF.
+    :return: List of model IDs on the requested page.
+    """
+    return get_model_search().search(query, page=page, page_size=page_size, gguf_only=gguf_only)["models"]
+
+
+def _open(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    request = urllib.request.Request(url, headers=headers or {})
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def _auth_headers(token):
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def list_repo_files(model_id, revision="main", endpoint=HF_ENDPOINT, token=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Lists the files of a HuggingFace model repository with their sizes and, for files
+    stored in LFS, their sha256 (the LFS oid).
+
+    :param model_id: Repository ID such as 'org/model-GGUF'.
+    :param revision: Branch, tag or commit.
+    :param endpoint: Hub base URL.
+    :param token: Optional access token for gated or private repositories.
+    :param timeout: Request timeout in seconds.
+    :return: List of {"path", "size", "sha256"} dictionaries.
     """
-    api = HfApi()
-    results = api.list_models(filter=f"*{query}*")
-    model_names = [model.modelId for model in results]
-    return model_names
+    url = f"{endpoint}/api/models/{model_id}/tree/{urllib.parse.quote(revision, safe='')}?recursive=true"
+    with _open(url, _auth_headers(token), timeout) as response:
+        entries = json.load(response)
+    files = []
+    for entry in entries:
+        if entry.get("type") != "file":
+            continue
+        lfs = entry.get("lfs") or {}
+        files.append({
+            "path": entry["path"],
+            "size": lfs.get("size", entry.get("size")),
+            "sha256": lfs.get("oid"),
+        })
+    return files
+
+
+def list_gguf_files(model_id, **kwargs):
+    """
+    Lists the .gguf files of a HuggingFace model repository.
+
+    :param model_id: Repository ID.
+    :return: List of file dictionaries (see list_repo_files).
+    """
+    return [f for f in list_repo_files(model_id, **kwargs) if f["path"].lower().endswith(".gguf")]
+
+
+def resolve_url(model_id, filename, revision="main", endpoint=HF_ENDPOINT):
+    """
+    :return: Download URL of a file in a HuggingFace repository.
+    """
+    return f"{endpoint}/{model_id}/resolve/{urllib.parse.quote(revision, safe='')}/{urllib.parse.quote(filename)}"
+
+
+def _probe(url, headers, timeout):
+    # A one-byte range request tells both the size and whether ranges are supported
+    with _open(url, {**headers, "Range": "bytes=0-0"}, timeout) as response:
+        if response.status == 206:
+            return int(response.headers["Content-Range"].rsplit("/", 1)[1]), True
+        length = response.headers.get("Content-Length")
+        return (int(length) if length is not None else None), False
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BUFFER_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Progress:
+    def __init__(self, total, done, callback):
+        self.total = total
+        self.done = done
+        self.resumed = done
+        self.callback = callback
+        self.started = time.monotonic()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.done += count
+            now = time.monotonic()
+            if self.callback is None or now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+        self.report()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return (self.done - self.resumed) / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        if self.callback is not None:
+            self.callback(self.done, self.total, self.rate())
+
+
+class _ResumeState:
+    def __init__(self, sidecar_path, size, sha256, chunk_bytes):
+        """
+        Tracks which chunks of a .part file are complete, saved in a JSON sidecar file.
+        """
+        self.path = sidecar_path
+        self.header = {"size": size, "sha256": sha256, "chunk_bytes": chunk_bytes}
+        self.done = set()
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if {key: saved.get(key) for key in self.header} != self.header:
+            return False
+        self.done = set(saved.get("done", []))
+        return True
+
+    def mark_done(self, index):
+        with self._lock:
+            self.done.add(index)
+            if time.monotonic() - self._last_save >= SIDECAR_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({**self.header, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
+
+
+def _fetch_chunk(url, part_path, start, end, headers, timeout, retries, progress):
+    for attempt in range(retries + 1):
+        written = 0
+        try:
+            with _open(url, {**headers, "Range": f"bytes={start}-{end - 1}"}, timeout) as response, \
+                    open(part_path, "r+b") as f:
+                if response.status != 206:
+                    raise DownloadError(f"Server ignored the range request (HTTP {response.status}).")
+                f.seek(start)
+                while start + written < end:
+                    block = response.read(min(READ_BUFFER_BYTES, end - start - written))
+                    if not block:
+                        raise DownloadError("Connection closed before the chunk was complete.")
+                    f.write(block)
+                    written += len(block)
+                    progress.add(len(block))
+                # The chunk is only recorded as done once it is on disk
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        except (OSError, DownloadError) as e:
+            progress.add(-written)
+            if attempt == retries:
+                raise DownloadError(f"Bytes {start}-{end - 1} failed after {retries + 1} attempts: {e}") from e
+            time.sleep(min(2 ** attempt, 30) * 0.1)
+
+
+def _fetch_whole(url, part_path, headers, timeout, progress):
+    with _open(url, headers, timeout) as response, open(part_path, "wb") as f:
+        for block in iter(lambda: response.read(READ_BUFFER_BYTES), b""):
+            f.write(block)
+            progress.add(len(block))
+
+
+def download_file(url, dest_path, expected_size=None, sha256=None, connections=DEFAULT_CONNECTIONS,
+                  chunk_bytes=DEFAULT_CHUNK_BYTES, progress=None, token=None, timeout=DEFAULT_TIMEOUT,
+                  retries=DEFAULT_RETRIES):
+    """
+    Downloads a file over parallel HTTP range requests.
+
+    Data goes to '<dest>.part', and the finished chunks are recorded in
+    '<dest>.part.json', so an interrupted download resumes where it stopped. Servers
+    without range support get a plain, non-resumable single stream instead.
+
+    :param url: File URL.
+    :param dest_path: Destination path.
+    :param expected_size: Expected size in bytes, checked against the server's.
+    :param sha256: Expected sha256 hex digest (e.g. the LFS oid); verified when given.
+    :param connections: Number of parallel connections.
+    :param chunk_bytes: Size of each range request.
+    :param progress: Optional callable(downloaded_bytes, total_bytes, bytes_per_second).
+    :param token: Optional HuggingFace access token.
+    :param timeout: Socket timeout in seconds.
+    :param retries: Retries per chunk before giving up.
+    :return: Dictionary with path, size, elapsed_s, bytes_per_second and resumed_bytes.
+    :raises DownloadError: If the download fails or does not match the expected size or hash.
+    """
+    headers = _auth_headers(token)
+    part_path = dest_path + ".part"
+    sidecar_path = part_path + ".json"
+    directory = os.path.dirname(dest_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    size, ranges = _probe(url, headers, timeout)
+    if expected_size is not None and size is not None and size != expected_size:
+        raise DownloadError(f"Server reports {size} bytes for '{url}', expected {expected_size}.")
+
+    if ranges:
+        state = _ResumeState(sidecar_path, size, sha256, chunk_bytes)
+        if not (state.load() and os.path.exists(part_path)):
+            state.done = set()
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+        chunks = [(i, i * chunk_bytes, min(size, (i + 1) * chunk_bytes))
+                  for i in range((size + chunk_bytes - 1) // chunk_bytes)]
+        pending = [c for c in chunks if c[0] not in state.done]
+        tracker = _Progress(size, sum(end - start for i, start, end in chunks if i in state.done), progress)
+
+        def work(chunk):
+            index, start, end = chunk
+            _fetch_chunk(url, part_path, start, end, headers, timeout, retries, tracker)
+            state.mark_done(index)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, connections))
+        try:
+            for future in [executor.submit(work, chunk) for chunk in pending]:
+                future.result()
+        finally:
+            # On failure, chunks not yet started are left for the next attempt
+            executor.shutdown(wait=True, cancel_futures=True)
+            state.save()
+    else:
+        print(f"'{url}' does not support range requests; downloading in a single stream.")
+        tracker = _Progress(size, 0, progress)
+        _fetch_whole(url, part_path, headers, timeout, tracker)
+    tracker.report()
+
+    actual_size = os.path.getsize(part_path)
+    if size is not None and actual_size != size:
+        raise DownloadError(f"Downloaded {actual_size} bytes, expected {size}.")
+    if sha256:
+        digest = _sha256_file(part_path)
+        if digest != sha256.lower():
+            # A corrupt file must not be resumed, so the partial state is dropped
+            for path in (part_path, sidecar_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise DownloadError(f"sha256 mismatch for '{dest_path}': got {digest}, expected {sha256}.")
+    os.replace(part_path, dest_path)
+    if os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+
+    elapsed = time.monotonic() - tracker.started
+    return {
+        "path": dest_path,
+        "size": actual_size,
+        "elapsed_s": elapsed,
+        "bytes_per_second": tracker.rate(),
+        "resumed_bytes": tracker.resumed,
+    }
+
 
-def download_model(model_id, destination_dir='models'):
+def download_model(model_id, destination_dir='models', filenames=None, connections=DEFAULT_CONNECTIONS,
+                   progress=None, token=None, endpoint=HF_ENDPOINT):
     """
-    Download a model from HuggingFace Hub using Git LFS.
+    Download GGUF files of a model from HuggingFace Hub over parallel, resumable HTTP.
 
     :param model_id: The ID of the model on HuggingFace Hub.
     :param destination_dir: Directory to save the downloaded model.
+    :param filenames: Files of the repository to fetch (defaults to every .gguf file).
+    :param connections: Number of parallel connections per file.
+    :param progress: Optional callable(filename, downloaded_bytes, total_bytes, bytes_per_second).
+    :param token: Optional HuggingFace access token.
+    :param endpoint: Hub base URL.
     :return: Status message.
     """
     try:
-        # Ensure the destination directory exists
-        if not os.path.exists(destination_dir):
-            os.makedirs(destination_dir)
-        # Initialize Git LFS
-        subprocess.run(["git", "lfs", "install"], check=True)
-        # Clone the repository into the destination directory
+        files = list_gguf_files(model_id, endpoint=endpoint, token=token)
+        if filenames:
+            files = [f for f in files if f["path"] in filenames]
+        if not files:
+            return f"No matching GGUF files found in '{model_id}'."
         repo_name = model_id.split('/')[-1]
-        clone_path = os.path.join(destination_dir, repo_name)
-        subprocess.run(["git", "clone", f"https://huggingface.co/{model_id}", clone_path], check=True)
-        return f"Model '{repo_name}' downloaded successfully."
-    except subprocess.CalledProcessError as e:
+        messages = []
+        for file in files:
+            dest_path = os.path.join(destination_dir, repo_name, *file["path"].split("/"))
+            if os.path.exists(dest_path) and os.path.getsize(dest_path) == file["size"]:
+                messages.append(f"'{file['path']}' is already downloaded.")
+                continue
+            callback = (lambda done, total, rate, name=file["path"]: progress(name, done, total, rate)) \
+                if progress else None
+            result = download_file(resolve_url(model_id, file["path"], endpoint=endpoint), dest_path,
+                                   expected_size=file["size"], sha256=file["sha256"], connections=connections,
+                                   progress=callback, token=token)
+            messages.append(f"'{file['path']}' downloaded ({result['size'] / 1e9:.2f} GB at "
+                            f"{result['bytes_per_second'] / 1e6:.1f} MB/s).")
+        return "\n".join(messages)
+    except (DownloadError, urllib.error.URLError, OSError, ValueError) as e:
         return f"Error downloading model: {e}"
@@ -0,0 +1,284 @@
+# modules/embedding_projection.py
+
+import os
+
+import numpy as np
+
+from modules.stats_cache import StatsCache, file_fingerprint
+from modules.weight_stats import DEFAULT_CHUNK_BYTES, read_blocks
+
+EMBEDDING_TENSOR = "token_embd.weight"
+DEFAULT_OVERSAMPLES = 10
+DEFAULT_POWER_ITERATIONS = 1
+DEFAULT_PROJECTION_CACHE_DIR = os.path.join('outputs', 'cache', 'projection')
+DEFAULT_PROJECTION_CACHE_BYTES = 128 * 1024 * 1024
+
+
+class EmbeddingProjection:
+    def __init__(self, coords, token_ids, components, mean, explained_variance, total_variance):
+        """
+        Rows of an embedding matrix projected onto its leading principal components.
+
+        :param coords: (n, k) float32 coordinates of the projected rows.
+        :param token_ids: (n,) token id of each coordinate row.
+        :param components: (k, d) principal directions.
+        :param mean: (d,) mean row that was subtracted before projecting.
+        :param explained_variance: (k,) variance along each component.
+        :param total_variance: Total variance of the rows (sum over all dimensions).
+        """
+        self.coords = coords
+        self.token_ids = token_ids
+        self.components = components
+        self.mean = mean
+        self.explained_variance = explained_variance
+        self.total_variance = total_variance
+
+    @property
+    def explained_variance_ratio(self):
+        """Fraction of the total variance captured by each component."""
+        if self.total_variance <= 0:
+            return np.zeros_like(self.explained_variance)
+        return self.explained_variance / self.total_variance
+
+    def project(self, vectors):
+        """
+        Projects new vectors with the same transform.
+
+        :param vectors: (m, d) or (d,) array.
+        :return: (m, k) or (k,) float32 coordinates.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return ((vectors - self.mean) @ self.components.T).astype(np.float32)
+
+    def nearest(self, token_id, k=10):
+        """
+        Finds the tokens closest to a token in the projected space.
+
+        :param token_id: Token id; it must be among the projected rows.
+        :param k: Number of neighbours.
+        :return: List of (token id, distance) pairs, nearest first, excluding the token itself.
+        """
+        rows = np.flatnonzero(self.token_ids == token_id)
+        if not rows.size:
+            raise KeyError(f"Token {token_id} is not in the projection.")
+        distances = np.sum((self.coords - self.coords[rows[0]]) ** 2, axis=1)
+        distances[rows[0]] = np.inf
+        k = min(k, len(distances) - 1)
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(int(self.token_ids[i]), float(np.sqrt(distances[i]))) for i in nearest]
+
+    def to_arrays(self):
+        return {
+            "coords": self.coords, "token_ids": self.token_ids, "components": self.components,
+            "mean": self.mean, "explained_variance": self.explained_variance,
+            "total_variance": np.array(self.total_variance, dtype=np.float64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays["coords"], arrays["token_ids"], arrays["components"], arrays["mean"],
+                   arrays["explained_variance"], float(arrays["total_variance"]))
+
+
+def _orthonormalize(matrix):
+    q, _ = np.linalg.qr(matrix)
+    return q
+
+
+def randomized_pca(iter_rows, n_rows, n_columns, n_components=3, oversamples=DEFAULT_OVERSAMPLES,
+                   power_iterations=DEFAULT_POWER_ITERATIONS, seed=0):
+    """
+    Randomized PCA (Halko, Martinsson and Tropp) of a matrix read in row chunks.
+
+    Only the (n_rows, k + oversamples) sketch and a few (n_columns, k + oversamples)
+    matrices are held in memory; the rows are streamed 3 + 2 * power_iterations times.
+    Centering is applied algebraically to each product, so chunks are used as read.
+
+    :param iter_rows: Callable returning an iterator of (row_start, float32 rows) chunks.
+    :param n_rows: Number of rows.
+    :param n_columns: Number of columns.
+    :param n_components: Number of principal components.
+    :param oversamples: Extra sketch columns improving accuracy.
+    :param power_iterations: Power iterations; more help when the spectrum decays slowly.
+    :param seed: Seed of the random test matrix.
+    :return: Tuple (coords, components, mean, explained_variance, total_variance).
+    """
+    width = min(n_components + oversamples, n_rows, n_columns)
+    omega = np.random.default_rng(seed).standard_normal((n_columns, width)).astype(np.float32)
+
+    # First pass: sketch, mean and total sum of squares together
+    sketch = np.empty((n_rows, width), dtype=np.float32)
+    column_sum = np.zeros(n_columns, dtype=np.float64)
+    sum_squares = 0.0
+    for start, rows in iter_rows():
+        sketch[start:start + len(rows)] = rows @ omega
+        column_sum += rows.sum(axis=0, dtype=np.float64)
+        sum_squares += float(np.einsum("ij,ij->", rows, rows, dtype=np.float64))
+    mean = column_sum / max(n_rows, 1)
+    total_variance = (sum_squares - n_rows * float(mean @ mean)) / max(n_rows - 1, 1)
+    mean32 = mean.astype(np.float32)
+    sketch -= mean32 @ omega
+
+    def times_transpose(q):
+        # (A - 1 mean^T)^T q, streamed
+        product = np.zeros((n_columns, q.shape[1]), dtype=np.float64)
+        for start, rows in iter_rows():
+            product += rows.T @ q[start:start + len(rows)]
+        return product - np.outer(mean, q.sum(axis=0))
+
+    def times(z):
+        # (A - 1 mean^T) z, streamed
+        z = z.astype(np.float32)
+        product = np.empty((n_rows, z.shape[1]), dtype=np.float32)
+        for start, rows in iter_rows():
+            product[start:start + len(rows)] = rows @ z
+        return product - mean32 @ z
+
+    for _ in range(power_iterations):
+        z = _orthonormalize(times_transpose(_orthonormalize(sketch)))
+        sketch = times(z)
+
+    q = _orthonormalize(sketch)
+    small = times_transpose(q).T  # q^T (A - 1 mean^T), (width, n_columns)
+    _, s, vt = np.linalg.svd(small, full_matrices=False)
+    k = min(n_components, len(s))
+    components = vt[:k].astype(np.float32)
+    # Exact projection onto the components (q u s would only approximate it)
+    coords = times(components.T)
+    explained_variance = (s[:k] ** 2 / max(n_rows - 1, 1)).astype(np.float64)
+    return coords, components, mean32, explained_variance, total_variance
+
+
+def _sample_rows(n_rows, sample, seed):
+    if sample is None or sample >= n_rows:
+        return np.arange(n_rows, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n_rows, size=sample, replace=False)).astype(np.int64)
+
+
+def project_array(array, n_components=3, sample=None, power_iterations=DEFAULT_POWER_ITERATIONS, seed=0,
+                  chunk_rows=4096):
+    """
+    Projects the rows of an in-memory matrix onto its leading principal components.
+
+    :param array: (n, d) array.
+    :param n_components: Number of output dimensions.
+    :param sample: Optional number of randomly chosen rows to project.
+    :param power_iterations: Power iterations of the randomized PCA.
+    :param seed: Random seed (sampling and sketch).
+    :param chunk_rows: Rows converted to float32 at a time.
+    :return: EmbeddingProjection.
+    """
+    array = np.asarray(array)
+    if array.ndim != 2:
+        raise ValueError("Expected a 2D matrix.")
+    token_ids = _sample_rows(array.shape[0], sample, seed)
+
+    def iter_rows():
+        for start in range(0, len(token_ids), chunk_rows):
+            yield start, np.asarray(array[token_ids[start:start + chunk_rows]], dtype=np.float32)
+
+    coords, components, mean, explained_variance, total_variance = randomized_pca(
+        iter_rows, len(token_ids), array.shape[1], n_components=n_components, power_iterations=power_iterations, seed=seed)
+    return EmbeddingProjection(coords, token_ids, components, mean, explained_variance, total_variance)
+
+
+def embedding_info(reader, tensor_name=EMBEDDING_TENSOR):
+    """
+    Looks up an embedding matrix in a GGUF file.
+
+    :param reader: Open GGUFReader.
+    :param tensor_name: Tensor name.
+    :return: GGUFTensorInfo of the (n_vocab, n_embd) tensor.
+    """
+    info = reader.get_tensor_info(tensor_name)
+    if info is None:
+        raise KeyError(f"Tensor '{tensor_name}' not found.")
+    if len(info.dims) != 2:
+        raise ValueError(f"Tensor '{tensor_name}' is not a matrix.")
+    return info
+
+
+def iter_embedding_rows(reader, info, token_ids=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Dequantizes rows of an embedding matrix in chunks of about chunk_bytes.
+
+    :param reader: Open GGUFReader.
+    :param info: GGUFTensorInfo of the tensor.
+    :param token_ids: Optional sorted row indices to read (all rows by default). They are
+                      picked out of sequentially read chunks, so the reads stay sequential.
+    :param chunk_bytes: Approximate size of the float32 rows dequantized at a time.
+    :return: Generator of (position in token_ids, float32 rows) pairs.
+    """
+    n_columns, n_rows = info.dims
+    blocks_per_row = n_columns // info.block_size
+    rows_per_chunk = max(1, chunk_bytes // (4 * n_columns))
+    if token_ids is None:
+        token_ids = np.arange(n_rows, dtype=np.int64)
+    bounds = np.searchsorted(token_ids, np.arange(0, n_rows + rows_per_chunk, rows_per_chunk))
+    position = 0
+    for chunk, row_start in enumerate(range(0, n_rows, rows_per_chunk)):
+        selected = token_ids[bounds[chunk]:bounds[chunk + 1]]
+        if not selected.size:
+            continue
+        row_end = int(selected[-1]) + 1
+        values = read_blocks(reader, info, row_start * blocks_per_row, row_end * blocks_per_row)
+        rows = values.reshape(row_end - row_start, n_columns)
+        if len(selected) != len(rows):
+            rows = rows[selected - row_start]
+        yield position, rows
+        position += len(rows)
+
+
+def project_embeddings(reader, tensor_name=EMBEDDING_TENSOR, n_components=3, sample=None,
+                       power_iterations=DEFAULT_POWER_ITERATIONS, seed=0, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Projects the rows of an embedding tensor of a GGUF file, dequantizing it in chunks
+    of about chunk_bytes so memory stays bounded whatever the vocabulary size.
+
+    :param reader: Open GGUFReader.
+    :param tensor_name: Name of the (n_vocab, n_embd) tensor.
+    :param n_components: Number of output dimensions (2 or 3 for plots).
+    :param sample: Optional number of randomly chosen tokens to project (all by default).
+    :param power_iterations: Power iterations of the randomized PCA.
+    :param seed: Random seed (sampling and sketch).
+    :param chunk_bytes: Approximate size of the float32 rows dequantized at a time.
+    :return: EmbeddingProjection.
+    """
+    info = embedding_info(reader, tensor_name)
+    n_columns, n_rows = info.dims
+    token_ids = _sample_rows(n_rows, sample, seed)
+
+    def iter_rows():
+        return iter_embedding_rows(reader, info, token_ids, chunk_bytes)
+
+    coords, components, mean, explained_variance, total_variance = randomized_pca(
+        iter_rows, len(token_ids), n_columns, n_components=n_components, power_iterations=power_iterations, seed=seed)
+    return EmbeddingProjection(coords, token_ids, components, mean, explained_variance, total_variance)
+
+
+class ProjectionCache(StatsCache):
+    def __init__(self, cache_dir=DEFAULT_PROJECTION_CACHE_DIR, max_bytes=DEFAULT_PROJECTION_CACHE_BYTES):
+        """
+        On-disk cache of embedding projections, one .npz file per model and settings,
+        evicted least-recently-used first like the statistics cache.
+        """
+        super().__init__(cache_dir=cache_dir, max_bytes=max_bytes)
+
+    def get_or_project(self, reader, tensor_name=EMBEDDING_TENSOR, n_components=3, sample=None,
+                       power_iterations=DEFAULT_POWER_ITERATIONS, seed=0):
+        """
+        Returns the projection of an embedding tensor, computing and caching it on a miss.
+
+        :return: EmbeddingProjection (see project_embeddings for the parameters).
+        """
+        key = file_fingerprint(reader, "pca", tensor_name, n_components, sample, power_iterations, seed)
+        projection = self.get_arrays(key, decode=EmbeddingProjection.from_arrays)
+        if projection is None:
+            projection = project_embeddings(reader, tensor_name, n_components=n_components, sample=sample,
+                                            power_iterations=power_iterations, seed=seed)
+            self.put_arrays(key, projection.to_arrays())
+        return projection
@@ -0,0 +1,143 @@
+# modules/generation_capture.py
+
+import time
+
+import numpy as np
+
+DEFAULT_CAPTURE_CAPACITY = 1024
+DEFAULT_CAPTURE_TOP_K = 8
+DEFAULT_LIVE_INTERVAL_S = 0.25  # Shortest time between two live deltas
+
+_FIELDS = ("positions", "token_ids", "generated", "logprobs", "ranks", "entropy", "top_ids", "top_probs")
+
+
+class CaptureBuffer:
+    def __init__(self, capacity=DEFAULT_CAPTURE_CAPACITY, top_k=DEFAULT_CAPTURE_TOP_K, position_stride=1):
+        """
+        Fixed-size ring buffer of per-position summaries of the next-token distribution,
+        filled during an instrumented generation. All arrays are allocated up front, so
+        memory does not grow with the context length; once full, the oldest positions
+        are overwritten.
+
+        :param capacity: Number of positions kept.
+        :param top_k: Most likely tokens kept per position.
+        :param position_stride: Record every n-th position only.
+        """
+        if capacity < 1 or top_k < 1 or position_stride < 1:
+            raise ValueError("capacity, top_k and position_stride must be at least 1.")
+        self.capacity = capacity
+        self.top_k = top_k
+        self.position_stride = position_stride
+        self.positions = np.zeros(capacity, dtype=np.int64)
+        self.token_ids = np.zeros(capacity, dtype=np.int32)
+        self.generated = np.zeros(capacity, dtype=bool)
+        self.logprobs = np.zeros(capacity, dtype=np.float32)
+        self.ranks = np.zeros(capacity, dtype=np.int32)
+        self.entropy = np.zeros(capacity, dtype=np.float32)
+        self.top_ids = np.zeros((capacity, top_k), dtype=np.int32)
+        self.top_probs = np.zeros((capacity, top_k), dtype=np.float32)
+        self.recorded = 0  # Positions written, including overwritten ones
+        self.skipped = 0  # Positions left out by the stride
+        self.overhead_s = 0.0  # Time spent summarizing, i.e. the cost of capturing
+
+    def __len__(self):
+        return min(self.recorded, self.capacity)
+
+    @property
+    def dropped(self):
+        """Positions overwritten because the buffer was full."""
+        return max(0, self.recorded - self.capacity)
+
+    def record(self, position, token_id, logits, generated=True):
+        """
+        Summarizes the distribution a token was drawn from (or, for prompt positions,
+        the one that predicted it).
+
+        :param position: Position of the token in the context.
+        :param token_id: Token at that position.
+        :param logits: Logits over the vocabulary that predicted the token.
+        :param generated: Whether the token was generated rather than part of the prompt.
+        :return: True if the position was recorded, False if the stride skipped it.
+        """
+        if position % self.position_stride:
+            self.skipped += 1
+            return False
+        started = time.perf_counter()
+        logits = np.asarray(logits, dtype=np.float32)
+        shifted = logits - logits.max()
+        exp = np.exp(shifted)
+        total = exp.sum(dtype=np.float64)
+        log_total = np.log(total)
+        k = min(self.top_k, len(logits))
+        top = np.argpartition(-logits, k - 1)[:k]
+        top = top[np.argsort(-logits[top])]
+
+        slot = self.recorded % self.capacity
+        self.positions[slot] = position
+        self.token_ids[slot] = token_id
+        self.generated[slot] = generated
+        self.logprobs[slot] = shifted[token_id] - log_total
+        self.ranks[slot] = int(np.count_nonzero(logits > logits[token_id]))
+        # H = log Z - sum(p * shifted), with Z the sum of exp(shifted)
+        self.entropy[slot] = log_total - float(exp @ shifted) / total
+        self.top_ids[slot, :k] = top
+        self.top_probs[slot, :k] = exp[top] / total
+        self.recorded += 1
+        self.overhead_s += time.perf_counter() - started
+        return True
+
+    def snapshot(self):
+        """
+        Copies the recorded positions in order, oldest first.
+
+        :return: Dictionary of arrays ("positions", "token_ids", "generated", "logprobs",
+                 "ranks", "entropy", "top_ids", "top_probs") and the capture counters.
+        """
+        count = len(self)
+        order = (np.arange(count) + (self.recorded - count)) % self.capacity
+        data = {name: getattr(self, name)[order] for name in _FIELDS}
+        data.update(recorded=self.recorded, dropped=self.dropped, skipped=self.skipped,
+                    overhead_s=self.overhead_s)
+        return data
+
+    def delta(self, since=0):
+        """
+        Copies the positions recorded after a sequence number, so a live view can append
+        them instead of receiving the whole capture again. Safe to call while another
+        thread records: the slot that the next record overwrites is never read.
+
+        :param since: Sequence number (a previous delta's "seq") the view has already applied.
+        :return: Dictionary with the arrays of snapshot() for the new positions, "start" and
+                 "seq" (sequence numbers of the first one and one past the last), and "gap"
+                 (positions overwritten before they could be sent).
+        """
+        seq = self.recorded
+        start = min(max(since, seq - self.capacity + 1), seq)
+        order = np.arange(start, seq) % self.capacity
+        data = {name: getattr(self, name)[order] for name in _FIELDS}
+        data.update(start=start, seq=seq, gap=start - since)
+        return data
+
+
+def iter_capture_deltas(capture, finished, interval=DEFAULT_LIVE_INTERVAL_S, since=0):
+    """
+    Follows a capture filled by another thread, yielding at most one delta per interval
+    with everything recorded since the previous one. Steps between two polls are
+    coalesced, so the update rate does not depend on the generation speed.
+
+    :param capture: CaptureBuffer being recorded into.
+    :param finished: Callable returning True once the generation is over.
+    :param interval: Seconds between two polls.
+    :param since: Sequence number to start from.
+    :return: Generator of CaptureBuffer.delta dictionaries; the last one follows the end of the generation.
+    """
+    while True:
+        # Checked before reading, so the positions recorded last are still sent
+        done = finished()
+        delta = capture.delta(since)
+        if delta["seq"] > since:
+            since = delta["seq"]
+            yield delta
+        if done:
+            return
+        time.sleep(interval)
@@ -1,37 +1,173 @@
 # modules/gguf_model.py
 
-import torch
-from llama_cpp import Llama
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from modules.gguf_reader import GGUFReader
+from modules.gguf_tokenizer import GGUFTokenizer
+from modules.stats_cache import StatsCache
+from modules.lod_pyramid import PyramidCache
+from modules.embedding_projection import EMBEDDING_TENSOR, ProjectionCache
+from modules.token_index import TokenIndex
+from modules.generation_capture import CaptureBuffer
+from modules.layer_graph import build_layer_graph
+
+DEFAULT_SESSION_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+MAX_OPEN_PYRAMIDS = 8
+MAX_TOKENIZED_TEXTS = 16
+SCORE_ROWS = 256  # Logit rows converted to log-probabilities at a time
+# Text generate and generate_stream return in place of a response when inference fails
+GENERATION_ERROR = "An error occurred while generating the response."
+
+def detect_device():
+    """
+    Detects whether models can be offloaded to a GPU. Asks llama.cpp first, since it is
+    the library doing the offloading; torch is only imported if llama.cpp cannot tell.
+
+    :return: 'cuda' or 'cpu'.
+    """
+    try:
+        import llama_cpp
+        if hasattr(llama_cpp, "llama_supports_gpu_offload"):
+            return "cuda" if llama_cpp.llama_supports_gpu_offload() else "cpu"
+    except ImportError:
+        pass
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+class SessionStateCache:
+    def __init__(self, max_bytes=DEFAULT_SESSION_CACHE_BYTES):
+        """
+        Keeps the llama.cpp state (KV cache and evaluated tokens) of each chat session,
+        evicting the least recently used sessions once max_bytes is exceeded. States are
+        only valid for models loaded from the same file with the same context settings.
+
+        :param max_bytes: Maximum total size of the saved states in bytes.
+        """
+        self.max_bytes = max_bytes
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _state_size(state):
+        return getattr(state, "llama_state_size", 0)
+
+    def get(self, session_id):
+        """
+        :param session_id: Chat session identifier.
+        :return: Saved LlamaState, or None.
+        """
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None:
+                self._states.move_to_end(session_id)
+            return state
+
+    def put(self, session_id, state):
+        """
+        Saves the state of a session and evicts old sessions if over budget.
+
+        :param session_id: Chat session identifier.
+        :param state: LlamaState from Llama.save_state().
+        """
+        with self._lock:
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            total = sum(self._state_size(s) for s in self._states.values())
+            while total > self.max_bytes and len(self._states) > 1:
+                _, evicted = self._states.popitem(last=False)
+                total -= self._state_size(evicted)
+
+    def discard(self, session_id):
+        """
+        Forgets the state of a session (e.g. when the user starts a new chat).
+
+        :param session_id: Chat session identifier.
+        """
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._states)
+
+def _model_scores(model):
+    # The logits buffer of llama-cpp-python: one row per context position, only filled
+    # when the model was loaded with logits_all
+    scores = getattr(model, "scores", None)
+    return scores if scores is not None else model._scores
+
+def _last_logits(model):
+    # Without logits_all, llama.cpp only computes the logits of the last evaluated token,
+    # and they are only in the context's output buffer
+    return np.ctypeslib.as_array(model._ctx.get_logits(), shape=(model.n_vocab(),))
 
 class GGUFModel:
-    def __init__(self, model_path, device, n_ctx=2048, n_gpu_layers=40, n_threads=8):
+    def __init__(self, model_path, device=None, n_ctx=2048, n_gpu_layers=40, n_threads=8, stats_cache=None,
+                 stats_workers=1, session_cache=None, token_index_dir=None, logits_all=False):
         """
         Initializes the GGUFModel.
 
         :param model_path: Path to the GGUF model file.
-        :param device: Torch device ('cuda' or 'cpu').
+        :param device: Device the model runs on ('cuda' or 'cpu'), for reporting only.
         :param n_ctx: Context length for the model.
         :param n_gpu_layers: Number of layers to offload to GPU.
         :param n_threads: Number of CPU threads for inference.
+        :param stats_cache: StatsCache for weight statistics (defaults to the on-disk cache in outputs/).
+        :param stats_workers: Processes used to compute weight statistics (1 computes them in this
+                              process; pass e.g. os.cpu_count() to use a process pool).
+        :param session_cache: SessionStateCache for multi-turn chats (may be shared between replicas).
+        :param token_index_dir: Where the token embedding index is kept (defaults to next to the model).
+        :param logits_all: Keep the logits of every position, so captured generations include
+                           the prompt and score_tokens works (costs n_ctx x n_vocab floats in llama.cpp).
         """
         self.model_path = model_path
         self.device = device
         self.n_ctx = n_ctx
         self.n_gpu_layers = n_gpu_layers
         self.n_threads = n_threads
+        self.logits_all = logits_all
         self.model = None
+        self._reader = None
+        self.stats_cache = stats_cache if stats_cache is not None else StatsCache()
+        self.stats_workers = stats_workers if stats_workers is not None else 1
+        self._weight_stats = None
+        self._layer_stats = None
+        self.pyramid_cache = PyramidCache()
+        self._pyramids = OrderedDict()
+        self.projection_cache = ProjectionCache()
+        self._projections = {}
+        self._layer_graphs = {}
+        self.token_index_dir = token_index_dir
+        self._token_index = None
+        self._tokenizer = None
+        self._token_data = OrderedDict()
+        self.session_cache = session_cache if session_cache is not None else SessionStateCache()
+        # Chat session whose tokens are currently in the llama.cpp context
+        self._active_session = None
 
     def load_model(self):
         """
         Loads the GGUF model using the Llama library.
         """
+        # Imported here so that reading GGUF files and computing statistics does not pay
+        # for loading the llama.cpp shared library
+        from llama_cpp import Llama
         try:
             self.model = Llama(
                 model_path=self.model_path,
                 n_ctx=self.n_ctx,
                 n_gpu_layers=self.n_gpu_layers,
-                n_threads=self.n_threads
+                n_threads=self.n_threads,
+                logits_all=self.logits_all
             )
+            # Texts tokenized from the GGUF vocabulary are redone with llama.cpp
+            self._token_data.clear()
             print("Model loaded successfully.")
         except Exception as e:
             print(f"Failed to load model: {e}")
@@ -44,7 +180,45 @@ class GGUFModel:
         if self.model:
             del self.model
             self.model = None
+            self._active_session = None
             print("Model unloaded successfully.")
+        self.close_reader()
+        self._weight_stats = None
+        self._layer_stats = None
+        self._projections = {}
+        self._layer_graphs = {}
+        self._token_index = None
+        self._tokenizer = None
+        self._token_data.clear()
+
+    def get_reader(self):
+        """
+        Returns a memory-mapped reader of the GGUF file. Only the header, metadata
+        and tensor info table are parsed, so this works without loading the model.
+
+        :return: GGUFReader instance for model_path.
+        """
+        if self._reader is None:
+            self._reader = GGUFReader(self.model_path)
+        return self._reader
+
+    def close_reader(self):
+        """
+        Closes the GGUF file reader if one is open.
+        """
+        # Pyramids read their fine levels through the reader
+        self._pyramids.clear()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def get_model_info(self):
+        """
+        Summarizes the model architecture from the GGUF header.
+
+        :return: Dictionary with architecture, layer count, hidden size and tensor list.
+        """
+        return self.get_reader().summary()
 
     def generate(self, prompt, max_tokens=50, stop_tokens=None):
         """
@@ -57,6 +231,7 @@ class GGUFModel:
         """
         if self.model is None:
             raise ValueError("Model not loaded.")
+        self._active_session = None
         try:
             output = self.model(
                 prompt,
@@ -66,102 +241,368 @@ class GGUFModel:
             return output['choices'][0]['text'].strip()
         except Exception as e:
             print(f"Error during inference: {e}")
-            return "An error occurred while generating the response."
+            return GENERATION_ERROR
 
-    def get_brain_nodes(self):
+    def generate_stream(self, prompt, max_tokens=50, stop_tokens=None):
         """
-        Extracts nodes (e.g., neurons or layers) from the model for visualization.
+        Generates a response token by token, yielding text as soon as llama.cpp produces it.
 
-        :return: List of dictionaries containing node data.
+        :param prompt: The input text prompt.
+        :param max_tokens: The maximum number of tokens to generate.
+        :param stop_tokens: Tokens at which generation should stop.
+        :return: Generator of text pieces.
         """
-        nodes = []
         if self.model is None:
-            return nodes
-
+            raise ValueError("Model not loaded.")
+        self._active_session = None
         try:
-            # Example: Extracting layer information as nodes
-            num_layers = self.model.params.n_layers
-            hidden_size = self.model.params.dim
-
-            for i in range(num_layers):
-                node = {
-                    "id": f"layer_{i}",
-                    "name": f"Layer {i}",
-                    "x": i * 15,  # Spatial positioning along the X-axis
-                    "y": 0,        # Fixed Y-axis for simplicity
-                    "z": 0,        # Fixed Z-axis for simplicity
-                    "color": self._get_color(i, num_layers),
-                    "size": hidden_size / 200,  # Adjust size based on hidden dimensions
-                    "weight": self._get_layer_weight(i)
-                }
-                nodes.append(node)
+            for chunk in self.model(prompt, max_tokens=max_tokens, stop=stop_tokens, stream=True):
+                text = chunk['choices'][0]['text']
+                if text:
+                    yield text
         except Exception as e:
-            print(f"Error extracting brain nodes: {e}")
+            print(f"Error during inference: {e}")
+            yield GENERATION_ERROR
 
-        return nodes
+    def generate_with_capture(self, prompt, max_tokens=50, stop_tokens=None, capture=None, temperature=0.8,
+                              top_k=40, top_p=0.95, repeat_penalty=1.1):
+        """
+        Generates a response while recording, for each position, a summary of the
+        next-token distribution (entropy, log-probability and rank of the chosen token,
+        top-k alternatives) into a preallocated CaptureBuffer.
 
-    def get_brain_links(self):
+        llama-cpp-python does not expose attention weights, so logits are what is
+        captured: the last position's logits after every decoding step (read from the
+        llama.cpp context, since Llama.scores is only filled with logits_all) and, if the
+        model was loaded with logits_all, those of the prompt positions. Capturing is opt-in;
+        generate and the chat methods are not instrumented. The time spent summarizing
+        is accumulated in capture.overhead_s.
+
+        :param prompt: The input text prompt.
+        :param max_tokens: The maximum number of tokens to generate.
+        :param stop_tokens: Strings at which generation should stop.
+        :param capture: CaptureBuffer to fill (a default one is created if omitted).
+        :param temperature: Sampling temperature.
+        :param top_k: Top-k sampling cutoff.
+        :param top_p: Nucleus sampling cutoff.
+        :param repeat_penalty: Repetition penalty.
+        :return: Tuple (generated text, CaptureBuffer, elapsed seconds).
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded.")
+        if capture is None:
+            capture = CaptureBuffer()
+        self._active_session = None
+        started = time.perf_counter()
+        tokens = self.model.tokenize(prompt.encode("utf-8"))
+        eos = self.model.token_eos()
+        pieces = []
+        text = ""
+        generated = 0
+        for token in self.model.generate(tokens, top_k=top_k, top_p=top_p, temp=temperature,
+                                         repeat_penalty=repeat_penalty):
+            position = self.model.n_tokens
+            if self.logits_all:
+                scores = _model_scores(self.model)
+                if generated == 0:
+                    # Row i holds the logits that predicted prompt token i + 1
+                    for i in range(len(tokens) - 1):
+                        capture.record(i + 1, tokens[i + 1], scores[i], generated=False)
+                logits = scores[position - 1]
+            else:
+                logits = _last_logits(self.model)
+            capture.record(position, token, logits)
+            generated += 1
+            if token == eos:
+                break
+            pieces.append(self.model.detokenize([token]))
+            text = b"".join(pieces).decode("utf-8", errors="ignore")
+            if stop_tokens and any(stop in text for stop in stop_tokens):
+                text = text[:min(text.index(stop) for stop in stop_tokens if stop in text)]
+                break
+            if generated >= max_tokens:
+                break
+        return text.strip(), capture, time.perf_counter() - started
+
+    def tokenize(self, text, add_bos=True):
+        """
+        Tokenizes text with llama.cpp when the model is loaded, or otherwise with the
+        vocabulary from the GGUF metadata, without loading the weights.
+
+        :param text: Text to tokenize.
+        :param add_bos: Prepend the beginning-of-sequence token.
+        :return: int32 array of token ids.
+        """
+        if self.model is not None:
+            return np.array(self.model.tokenize(text.encode("utf-8"), add_bos=add_bos), dtype=np.int32)
+        return self.get_tokenizer().encode(text, add_bos=add_bos)
+
+    def token_pieces(self, token_ids):
+        """
+        Text of each token, from llama.cpp when the model is loaded (so every vocabulary
+        type llama.cpp supports works), or otherwise from the GGUF metadata.
+
+        :param token_ids: Token ids.
+        :return: List of strings; bytes that are not valid UTF-8 on their own are replaced.
+        """
+        if self.model is not None:
+            return [self.model.detokenize([int(token_id)]).decode("utf-8", errors="replace")
+                    for token_id in token_ids]
+        return self.get_tokenizer().pieces(token_ids)
+
+    def score_tokens(self, token_ids):
         """
-        Extracts links (e.g., connections between neurons or layers) from the model for visualization.
+        Computes the log-probability the model gave each token given the tokens before
+        it. Sequences longer than the context are scored in consecutive windows of n_ctx
+        tokens, each starting without context.
 
-        :return: List of dictionaries containing link data.
+        :param token_ids: Token ids.
+        :return: float32 array of log-probabilities, NaN where there is no prediction
+                 (the first token of each window).
         """
-        links = []
         if self.model is None:
-            return links
+            raise ValueError("Model not loaded.")
+        if not self.logits_all:
+            raise ValueError("Scoring every token needs the model loaded with logits_all=True.")
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        logprobs = np.full(len(token_ids), np.nan, dtype=np.float32)
+        # The evaluation replaces the llama.cpp context of any chat session
+        self._active_session = None
+        for start in range(0, len(token_ids), self.n_ctx):
+            window = token_ids[start:start + self.n_ctx]
+            self.model.reset()
+            self.model.eval(window.tolist())
+            scores = _model_scores(self.model)
+            # Row i holds the logits that predicted token i + 1 of the window
+            for row in range(0, len(window) - 1, SCORE_ROWS):
+                logits = np.asarray(scores[row:min(row + SCORE_ROWS, len(window) - 1)], dtype=np.float32)
+                targets = window[row + 1:row + 1 + len(logits)]
+                peak = logits.max(axis=1)
+                log_total = np.log(np.exp(logits - peak[:, None]).sum(axis=1)) + peak
+                logprobs[start + row + 1:start + row + 1 + len(logits)] = \
+                    logits[np.arange(len(logits)), targets] - log_total
+        return logprobs
+
+    def generate_chat_stream(self, session_id, history, prompt, max_tokens=50, stop_tokens=None):
+        """
+        Continues a multi-turn chat, yielding text as it is generated.
+
+        The llama.cpp state of each session is saved after every turn and restored
+        before the next one. llama.cpp then only evaluates the tokens after the longest
+        common prefix with the restored state, so the cost of a turn depends on the
+        length of the new message rather than the length of the whole conversation.
 
+        :param session_id: Chat session identifier.
+        :param history: Previous turns as (user message, assistant response) pairs.
+        :param prompt: The new user message.
+        :param max_tokens: The maximum number of tokens to generate.
+        :param stop_tokens: Tokens at which generation should stop.
+        :return: Generator of text pieces.
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded.")
+        messages = []
+        for user_message, response in history:
+            messages.append({"role": "user", "content": user_message})
+            if response:
+                messages.append({"role": "assistant", "content": response})
+        messages.append({"role": "user", "content": prompt})
+
+        if self._active_session != session_id:
+            state = self.session_cache.get(session_id)
+            if state is not None:
+                self.model.load_state(state)
+            self._active_session = session_id
         try:
-            num_layers = self.model.params.n_layers
-
-            for i in range(num_layers - 1):
-                link = {
-                    "source": f"layer_{i}",
-                    "target": f"layer_{i + 1}",
-                    "value": self._get_link_weight(i)
-                }
-                links.append(link)
+            for chunk in self.model.create_chat_completion(
+                messages=messages,
+                max_tokens=max_tokens,
+                stop=stop_tokens,
+                stream=True
+            ):
+                text = chunk['choices'][0]['delta'].get('content')
+                if text:
+                    yield text
+            self.session_cache.put(session_id, self.model.save_state())
         except Exception as e:
-            print(f"Error extracting brain links: {e}")
+            print(f"Error during inference: {e}")
+            self._active_session = None
+            yield GENERATION_ERROR
 
-        return links
+    def end_chat_session(self, session_id):
+        """
+        Drops the saved state of a chat session.
 
-    def _get_color(self, index, total):
+        :param session_id: Chat session identifier.
         """
-        Generates a color code based on the node index.
+        self.session_cache.discard(session_id)
+        if self._active_session == session_id:
+            self._active_session = None
 
-        :param index: The current node index.
-        :param total: Total number of nodes.
-        :return: Hex color code as a string.
+    def get_layer_graph(self, expand_experts=False):
         """
-        hue = (index / total) * 360
-        return f"hsl({hue}, 70%, 50%)"
+        Builds the component graph of the model from the GGUF tensor table. Only the header
+        is read: weight statistics are attached if they were already computed or cached,
+        and the graph is rebuilt with them once they are (see get_weight_statistics).
 
-    def _get_layer_weight(self, layer_index):
+        :param expand_experts: One node per expert of MoE tensors instead of one per tensor.
+        :return: LayerGraph.
         """
-        Computes a weight value for a given layer based on model parameters.
+        tensor_stats = self.get_cached_weight_statistics()
+        graph, has_stats = self._layer_graphs.get(expand_experts, (None, False))
+        if graph is None or (tensor_stats is not None and not has_stats):
+            graph = build_layer_graph(self.get_reader(), tensor_stats=tensor_stats, expand_experts=expand_experts)
+            self._layer_graphs[expand_experts] = (graph, tensor_stats is not None)
+        return graph
 
-        :param layer_index: Index of the layer.
-        :return: Weight value as a float.
+    def get_brain_nodes(self):
         """
-        try:
-            # Replace with actual computation based on model's parameters
-            weight = torch.abs(self.model.layers[layer_index].self_attn.norm.weight).mean().item()
-            return weight
-        except Exception as e:
-            print(f"Error computing layer weight for layer {layer_index}: {e}")
-            return 0.0
+        Extracts nodes (one per block component and global tensor) from the model for visualization.
 
-    def _get_link_weight(self, layer_index):
+        :return: List of dictionaries containing node data.
         """
-        Computes a weight value for a link between two layers.
+        return self.get_layer_graph().to_dict()["nodes"]
 
-        :param layer_index: Index of the source layer.
-        :return: Weight value as a float.
+    def get_brain_links(self):
         """
-        try:
-            # Replace with actual computation based on model's parameters
-            weight = torch.abs(self.model.layers[layer_index].self_attn.norm.weight).mean().item()
-            return weight
-        except Exception as e:
-            print(f"Error computing link weight for layer {layer_index}: {e}")
-            return 0.0
+        Extracts links following the flow of the hidden state between components.
+
+        :return: List of dictionaries containing link data; source and target are node indices.
+        """
+        return self.get_layer_graph().to_dict()["links"]
+
+    def get_weight_statistics(self):
+        """
+        Computes per-tensor weight statistics by streaming the GGUF file, or loads
+        them from the stats cache when this file has been analysed before.
+
+        :return: Dictionary mapping tensor names to TensorStats.
+        """
+        if self._weight_stats is None:
+            self._weight_stats, self._layer_stats = self.stats_cache.get_or_compute(
+                self.get_reader(), workers=self.stats_workers)
+        return self._weight_stats
+
+    def get_cached_weight_statistics(self):
+        """
+        Returns the weight statistics if they are in memory or in the stats cache, without
+        reading any tensor data.
+
+        :return: Dictionary mapping tensor names to TensorStats, or None.
+        """
+        if self._weight_stats is None:
+            entry = self.stats_cache.lookup(self.get_reader())
+            if entry is not None:
+                self._weight_stats, self._layer_stats = entry
+        return self._weight_stats
+
+    def get_layer_statistics(self):
+        """
+        Aggregates the weight statistics per transformer block.
+
+        :return: Dictionary mapping block index to aggregated statistics.
+        """
+        self.get_weight_statistics()
+        return self._layer_stats
+
+    def get_tensor_pyramid(self, name):
+        """
+        Returns the level-of-detail pyramid of a tensor, built on first use and cached
+        on disk; the most recently used pyramids are also kept in memory.
+
+        :param name: Tensor name.
+        :return: TensorPyramid.
+        """
+        pyramid = self._pyramids.get(name)
+        if pyramid is None:
+            pyramid = self.pyramid_cache.get_or_build(self.get_reader(), name)
+            self._pyramids[name] = pyramid
+            while len(self._pyramids) > MAX_OPEN_PYRAMIDS:
+                self._pyramids.popitem(last=False)
+        self._pyramids.move_to_end(name)
+        return pyramid
+
+    def get_tensor_tile(self, name, level=None, tile_row=0, tile_column=0):
+        """
+        Returns one tile of a tensor's pyramid.
+
+        :param name: Tensor name.
+        :param level: Zoom level (0 is full resolution; None gives the whole-tensor overview).
+        :param tile_row: Tile row index.
+        :param tile_column: Tile column index.
+        :return: Tile dictionary (see TensorPyramid.tile).
+        """
+        pyramid = self.get_tensor_pyramid(name)
+        if level is None:
+            return pyramid.overview()
+        return pyramid.tile(level, tile_row, tile_column)
+
+    def get_embedding_projection(self, n_components=3, sample=None, tensor_name=EMBEDDING_TENSOR):
+        """
+        Projects the token embeddings onto their leading principal components. Computed
+        once per setting and cached on disk, so later calls do not read the tensor again.
+
+        :param n_components: Number of output dimensions.
+        :param sample: Optional number of randomly chosen tokens to project (all by default).
+        :param tensor_name: Embedding tensor.
+        :return: EmbeddingProjection.
+        """
+        key = (tensor_name, n_components, sample)
+        if key not in self._projections:
+            self._projections[key] = self.projection_cache.get_or_project(
+                self.get_reader(), tensor_name, n_components=n_components, sample=sample)
+        return self._projections[key]
+
+    def get_token_index(self):
+        """
+        Returns the approximate nearest-neighbour index of the token embeddings, opened
+        from next to the model file (or token_index_dir), or built there on first use.
+
+        :return: TokenIndex.
+        """
+        if self._token_index is None:
+            self._token_index = TokenIndex.open_or_build(self.get_reader(), index_dir=self.token_index_dir)
+        return self._token_index
+
+    def get_vocabulary(self):
+        """
+        :return: Token strings from the GGUF tokenizer metadata (indexable by token id), or an empty list.
+        """
+        return self.get_reader().metadata.get("tokenizer.ggml.tokens", [])
+
+    def get_tokenizer(self):
+        """
+        :return: GGUFTokenizer built from the GGUF metadata (the weights are not loaded).
+        """
+        if self._tokenizer is None:
+            self._tokenizer = GGUFTokenizer.from_metadata(self.get_reader().metadata)
+        return self._tokenizer
+
+    def get_token_data(self, text, logprobs=False, add_bos=True):
+        """
+        Token-level view of a text: what the model sees, and optionally how surprised it
+        is by each token. Results are cached per text for this model.
+
+        :param text: Text to tokenize.
+        :param logprobs: Also score every token (needs the model loaded with logits_all).
+        :param add_bos: Prepend the beginning-of-sequence token.
+        :return: Dictionary with "token_ids" (int32), "positions" (int32), "logprobs"
+                 (float32, NaN where not computed), "pieces" (text of each token) and
+                 "source" ('model' or 'vocab', the tokenizer used).
+        """
+        key = (text, bool(logprobs), bool(add_bos))
+        if key in self._token_data:
+            self._token_data.move_to_end(key)
+            return self._token_data[key]
+        token_ids = self.tokenize(text, add_bos=add_bos)
+        data = {
+            "token_ids": token_ids,
+            "positions": np.arange(len(token_ids), dtype=np.int32),
+            "logprobs": self.score_tokens(token_ids) if logprobs else np.full(len(token_ids), np.nan, dtype=np.float32),
+            "pieces": self.token_pieces(token_ids),
+            "source": "model" if self.model is not None else "vocab",
+        }
+        self._token_data[key] = data
+        while len(self._token_data) > MAX_TOKENIZED_TEXTS:
+            self._token_data.popitem(last=False)
+        return data
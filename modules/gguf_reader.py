@@ -0,0 +1,411 @@
+# modules/gguf_reader.py
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+GGUF_MAGIC = b"GGUF"
+GGUF_DEFAULT_ALIGNMENT = 32
+
+# GGUF metadata value types
+GGUF_TYPE_UINT8 = 0
+GGUF_TYPE_INT8 = 1
+GGUF_TYPE_UINT16 = 2
+GGUF_TYPE_INT16 = 3
+GGUF_TYPE_UINT32 = 4
+GGUF_TYPE_INT32 = 5
+GGUF_TYPE_FLOAT32 = 6
+GGUF_TYPE_BOOL = 7
+GGUF_TYPE_STRING = 8
+GGUF_TYPE_ARRAY = 9
+GGUF_TYPE_UINT64 = 10
+GGUF_TYPE_INT64 = 11
+GGUF_TYPE_FLOAT64 = 12
+
+_SCALAR_DTYPES = {
+    GGUF_TYPE_UINT8: np.dtype("<u1"),
+    GGUF_TYPE_INT8: np.dtype("<i1"),
+    GGUF_TYPE_UINT16: np.dtype("<u2"),
+    GGUF_TYPE_INT16: np.dtype("<i2"),
+    GGUF_TYPE_UINT32: np.dtype("<u4"),
+    GGUF_TYPE_INT32: np.dtype("<i4"),
+    GGUF_TYPE_FLOAT32: np.dtype("<f4"),
+    GGUF_TYPE_BOOL: np.dtype("?"),
+    GGUF_TYPE_UINT64: np.dtype("<u8"),
+    GGUF_TYPE_INT64: np.dtype("<i8"),
+    GGUF_TYPE_FLOAT64: np.dtype("<f8"),
+}
+
+_SCALAR_STRUCTS = {
+    GGUF_TYPE_UINT8: struct.Struct("<B"),
+    GGUF_TYPE_INT8: struct.Struct("<b"),
+    GGUF_TYPE_UINT16: struct.Struct("<H"),
+    GGUF_TYPE_INT16: struct.Struct("<h"),
+    GGUF_TYPE_UINT32: struct.Struct("<I"),
+    GGUF_TYPE_INT32: struct.Struct("<i"),
+    GGUF_TYPE_FLOAT32: struct.Struct("<f"),
+    GGUF_TYPE_BOOL: struct.Struct("<?"),
+    GGUF_TYPE_UINT64: struct.Struct("<Q"),
+    GGUF_TYPE_INT64: struct.Struct("<q"),
+    GGUF_TYPE_FLOAT64: struct.Struct("<d"),
+}
+
+# ggml tensor types: id -> (name, elements per block, bytes per block)
+GGML_TYPES = {
+    0: ("F32", 1, 4),
+    1: ("F16", 1, 2),
+    2: ("Q4_0", 32, 18),
+    3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22),
+    7: ("Q5_1", 32, 24),
+    8: ("Q8_0", 32, 34),
+    9: ("Q8_1", 32, 36),
+    10: ("Q2_K", 256, 84),
+    11: ("Q3_K", 256, 110),
+    12: ("Q4_K", 256, 144),
+    13: ("Q5_K", 256, 176),
+    14: ("Q6_K", 256, 210),
+    15: ("Q8_K", 256, 292),
+    16: ("IQ2_XXS", 256, 66),
+    17: ("IQ2_XS", 256, 74),
+    18: ("IQ3_XXS", 256, 98),
+    19: ("IQ1_S", 256, 50),
+    20: ("IQ4_NL", 32, 18),
+    21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82),
+    23: ("IQ4_XS", 256, 136),
+    24: ("I8", 1, 1),
+    25: ("I16", 1, 2),
+    26: ("I32", 1, 4),
+    27: ("I64", 1, 8),
+    28: ("F64", 1, 8),
+    29: ("IQ1_M", 256, 56),
+    30: ("BF16", 1, 2),
+}
+
+# llama.cpp file types (general.file_type), i.e. the quantization preset of a model
+LLAMA_FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16",
+}
+
+
+class GGUFFormatError(ValueError):
+    """Raised when a file is not a valid GGUF file."""
+
+
+class GGUFStringArray:
+    """
+    A string array from the metadata table that is decoded on access.
+
+    Vocabularies hold hundreds of thousands of strings, so the reader only records
+    where each string starts and decodes them when they are actually used.
+    """
+
+    def __init__(self, buffer, offsets, lengths):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._lengths = lengths
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start = self._offsets[index]
+        return self._buffer[start:start + self._lengths[index]].decode("utf-8", errors="replace")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self):
+        """
+        Decodes every string in the array.
+
+        :return: List of strings.
+        """
+        return list(self)
+
+
+class GGUFTensorInfo:
+    def __init__(self, name, dims, ggml_type, offset):
+        """
+        Describes one entry of the GGUF tensor info table.
+
+        :param name: Tensor name (e.g. 'blk.0.attn_q.weight').
+        :param dims: Dimensions in GGUF order (fastest-varying first).
+        :param ggml_type: ggml type id of the tensor data.
+        :param offset: Absolute byte offset of the tensor data in the file.
+        """
+        if ggml_type not in GGML_TYPES:
+            raise GGUFFormatError(f"Tensor '{name}' has unknown ggml type {ggml_type}.")
+        self.name = name
+        self.dims = tuple(dims)
+        self.ggml_type = ggml_type
+        self.offset = offset
+        self.type_name, self.block_size, self.type_size = GGML_TYPES[ggml_type]
+        self.n_elements = int(np.prod(self.dims, dtype=np.int64)) if self.dims else 1
+        self.n_blocks = self.n_elements // self.block_size
+        self.n_bytes = self.n_blocks * self.type_size
+
+    @property
+    def shape(self):
+        """Tensor shape in NumPy (row-major) order."""
+        return tuple(reversed(self.dims))
+
+    def to_dict(self):
+        """
+        Returns a JSON-serializable description of the tensor.
+
+        :return: Dictionary with name, shape, dtype, offset and size.
+        """
+        return {
+            "name": self.name,
+            "shape": list(self.shape),
+            "dtype": self.type_name,
+            "offset": self.offset,
+            "n_elements": self.n_elements,
+            "n_bytes": self.n_bytes,
+        }
+
+    def __repr__(self):
+        return f"GGUFTensorInfo(name={self.name!r}, shape={self.shape}, dtype={self.type_name})"
+
+
+class GGUFReader:
+    def __init__(self, path):
+        """
+        Opens a GGUF file through a read-only memory map and parses its header,
+        metadata table and tensor info table. Tensor data is never read here.
+
+        :param path: Path to the GGUF file.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise GGUFFormatError(f"'{path}' is empty.")
+        self.metadata = {}
+        self.tensors = []
+        self._tensor_index = {}
+        try:
+            self._parse()
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            self.close()
+            raise GGUFFormatError(f"'{path}' is truncated or corrupt: {e}")
+        except GGUFFormatError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Releases the memory map and file handle.
+        """
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # NumPy views of tensor data are still alive; the map is released
+                # once they are garbage collected.
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _parse(self):
+        buf = self._mmap
+        if buf[:4] != GGUF_MAGIC:
+            raise GGUFFormatError(f"'{self.path}' is not a GGUF file.")
+        (self.version,) = struct.unpack_from("<I", buf, 4)
+        if self.version not in (1, 2, 3):
+            raise GGUFFormatError(f"Unsupported GGUF version {self.version}.")
+        # Version 1 used 32-bit counts and string lengths
+        self._count_fmt = "<I" if self.version == 1 else "<Q"
+        self._count_size = struct.calcsize(self._count_fmt)
+
+        offset = 8
+        (n_tensors,) = struct.unpack_from(self._count_fmt, buf, offset)
+        offset += self._count_size
+        (n_kv,) = struct.unpack_from(self._count_fmt, buf, offset)
+        offset += self._count_size
+
+        for _ in range(n_kv):
+            key, offset = self._read_string(offset)
+            (value_type,) = struct.unpack_from("<I", buf, offset)
+            value, offset = self._read_value(value_type, offset + 4)
+            self.metadata[key] = value
+
+        tensor_infos = []
+        for _ in range(n_tensors):
+            name, offset = self._read_string(offset)
+            (n_dims,) = struct.unpack_from("<I", buf, offset)
+            offset += 4
+            dims = struct.unpack_from(f"<{n_dims}{self._count_fmt[1]}", buf, offset)
+            offset += n_dims * self._count_size
+            ggml_type, tensor_offset = struct.unpack_from("<IQ", buf, offset)
+            offset += 12
+            tensor_infos.append((name, dims, ggml_type, tensor_offset))
+
+        self.alignment = int(self.metadata.get("general.alignment", GGUF_DEFAULT_ALIGNMENT))
+        self.header_size = offset
+        self.data_offset = offset + (-offset % self.alignment)
+
+        for name, dims, ggml_type, tensor_offset in tensor_infos:
+            info = GGUFTensorInfo(name, dims, ggml_type, self.data_offset + tensor_offset)
+            if info.offset + info.n_bytes > len(buf):
+                raise GGUFFormatError(f"Tensor '{name}' extends past the end of the file.")
+            self.tensors.append(info)
+            self._tensor_index[name] = info
+
+    def _read_string(self, offset):
+        (length,) = struct.unpack_from(self._count_fmt, self._mmap, offset)
+        offset += self._count_size
+        return self._mmap[offset:offset + length].decode("utf-8"), offset + length
+
+    def _read_value(self, value_type, offset):
+        buf = self._mmap
+        if value_type == GGUF_TYPE_STRING:
+            return self._read_string(offset)
+        if value_type in _SCALAR_STRUCTS:
+            scalar = _SCALAR_STRUCTS[value_type]
+            (value,) = scalar.unpack_from(buf, offset)
+            return value, offset + scalar.size
+        if value_type == GGUF_TYPE_ARRAY:
+            (item_type,) = struct.unpack_from("<I", buf, offset)
+            (count,) = struct.unpack_from(self._count_fmt, buf, offset + 4)
+            offset += 4 + self._count_size
+            if item_type in _SCALAR_DTYPES:
+                dtype = _SCALAR_DTYPES[item_type]
+                values = np.frombuffer(buf, dtype=dtype, count=count, offset=offset).copy()
+                return values, offset + count * dtype.itemsize
+            if item_type == GGUF_TYPE_STRING:
+                offsets = []
+                lengths = []
+                unpack = struct.Struct(self._count_fmt).unpack_from
+                size = self._count_size
+                for _ in range(count):
+                    (length,) = unpack(buf, offset)
+                    offset += size
+                    offsets.append(offset)
+                    lengths.append(length)
+                    offset += length
+                return GGUFStringArray(buf, offsets, lengths), offset
+            values = []
+            for _ in range(count):
+                value, offset = self._read_value(item_type, offset)
+                values.append(value)
+            return values, offset
+        raise GGUFFormatError(f"Unknown metadata value type {value_type} at offset {offset}.")
+
+    @property
+    def architecture(self):
+        """Model architecture name (e.g. 'llama'), or None if missing."""
+        return self.metadata.get("general.architecture")
+
+    def get_arch_field(self, field, default=None):
+        """
+        Reads an architecture-scoped metadata field such as '<arch>.block_count'.
+
+        :param field: Field name without the architecture prefix.
+        :param default: Value returned when the field is missing.
+        :return: Field value or default.
+        """
+        return self.metadata.get(f"{self.architecture}.{field}", default)
+
+    @property
+    def block_count(self):
+        """Number of transformer blocks (layers)."""
+        count = self.get_arch_field("block_count")
+        if count is not None:
+            return int(count)
+        # Fall back to the highest block index found in the tensor names
+        indices = [int(t.name.split(".")[1]) for t in self.tensors
+                   if t.name.startswith("blk.") and t.name.split(".")[1].isdigit()]
+        return max(indices) + 1 if indices else 0
+
+    @property
+    def embedding_length(self):
+        """Hidden size of the model."""
+        length = self.get_arch_field("embedding_length")
+        if length is not None:
+            return int(length)
+        embd = self._tensor_index.get("token_embd.weight")
+        return embd.dims[0] if embd is not None else 0
+
+    @property
+    def file_type(self):
+        """Quantization preset (e.g. 'Q4_K_M'), or the type holding most of the weight bytes."""
+        file_type = self.metadata.get("general.file_type")
+        if file_type is not None and int(file_type) in LLAMA_FILE_TYPES:
+            return LLAMA_FILE_TYPES[int(file_type)]
+        totals = {}
+        for t in self.tensors:
+            totals[t.type_name] = totals.get(t.type_name, 0) + t.n_bytes
+        return max(totals, key=totals.get) if totals else None
+
+    def get_tensor_info(self, name):
+        """
+        Looks up a tensor by name.
+
+        :param name: Tensor name.
+        :return: GGUFTensorInfo, or None if the tensor does not exist.
+        """
+        return self._tensor_index.get(name)
+
+    def header_bytes(self):
+        """
+        Returns the raw header, metadata and tensor info bytes (everything before the data).
+
+        :return: bytes object.
+        """
+        return self._mmap[:self.header_size]
+
+    def tensor_bytes(self, info, start_block=0, end_block=None):
+        """
+        Returns a zero-copy view of the raw bytes of a range of tensor blocks.
+
+        :param info: GGUFTensorInfo of the tensor.
+        :param start_block: First block to include.
+        :param end_block: Block after the last one to include (defaults to all).
+        :return: uint8 NumPy array backed by the memory map.
+        """
+        if end_block is None:
+            end_block = info.n_blocks
+        start = info.offset + start_block * info.type_size
+        count = (end_block - start_block) * info.type_size
+        return np.frombuffer(self._mmap, dtype=np.uint8, count=count, offset=start)
+
+    def summary(self):
+        """
+        Summarizes the model without reading any tensor data.
+
+        :return: Dictionary with architecture, layer count, hidden size and tensor list.
+        """
+        return {
+            "path": self.path,
+            "version": self.version,
+            "architecture": self.architecture,
+            "name": self.metadata.get("general.name"),
+            "block_count": self.block_count,
+            "embedding_length": self.embedding_length,
+            "tensor_count": len(self.tensors),
+            "parameter_count": sum(t.n_elements for t in self.tensors),
+            "file_size": os.path.getsize(self.path),
+            "tensors": [t.to_dict() for t in self.tensors],
+        }
@@ -0,0 +1,211 @@
+# modules/gguf_tokenizer.py
+
+import heapq
+import re
+
+import numpy as np
+
+SPM_SPACE = "▁"  # SentencePiece marks spaces with '▁'
+TOKEN_TYPE_CONTROL = 3
+MAX_CACHED_WORDS = 200000
+
+# Pieces that start a SentencePiece word: a run of '▁' followed by other characters
+_SPM_WORD = re.compile(f"{SPM_SPACE}*[^{SPM_SPACE}]+|{SPM_SPACE}+")
+# GPT-2 pre-tokenization, with the Unicode letter and digit classes of the original
+# pattern approximated by those of the re module
+_BPE_WORD = re.compile(r"'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+")
+_BYTE_PIECE = re.compile(r"^<0x([0-9A-Fa-f]{2})>$")
+
+
+def _bytes_to_unicode():
+    # The reversible byte -> printable character mapping of byte-level BPE vocabularies
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) \
+        + list(range(ord("®"), ord("ÿ") + 1))
+    characters = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            characters.append(256 + extra)
+            extra += 1
+    return {byte: chr(character) for byte, character in zip(printable, characters)}
+
+
+class GGUFTokenizer:
+    def __init__(self, tokens, scores=None, token_types=None, merges=None, model="llama", bos_id=None,
+                 add_bos=True, add_space_prefix=True, unk_id=None):
+        """
+        Tokenizer rebuilt from the vocabulary in GGUF metadata, so text can be tokenized
+        without loading the model weights. Supports SentencePiece-style ('llama') and
+        byte-level BPE ('gpt2') vocabularies. Text is split into words first and each
+        word is tokenized once, so repeated words cost a dictionary lookup.
+
+        llama.cpp's own tokenizer remains authoritative: special tokens written in the
+        text are not recognized here, and architecture-specific BPE pre-tokenizers
+        ('tokenizer.ggml.pre') are approximated by the GPT-2 one.
+
+        :param tokens: Token strings, indexed by token id.
+        :param scores: Merge scores of SentencePiece vocabularies.
+        :param token_types: Token types (normal, unknown, control, byte, ...).
+        :param merges: BPE merges as 'left right' strings, highest priority first.
+        :param model: 'llama' (SentencePiece) or 'gpt2' (byte-level BPE).
+        :param bos_id: Beginning-of-sequence token id.
+        :param add_bos: Whether encode prepends the BOS token by default.
+        :param add_space_prefix: Whether SentencePiece text gets a leading space.
+        :param unk_id: Token for characters without a piece or byte fallback.
+        """
+        if model not in ("llama", "gpt2"):
+            raise NotImplementedError(f"Tokenizer model '{model}' is not supported.")
+        self.tokens = tokens
+        self.model = model
+        self.bos_id = bos_id
+        self.add_bos = add_bos and bos_id is not None
+        self.add_space_prefix = add_space_prefix
+        self.unk_id = unk_id
+        self.token_types = np.asarray(token_types) if token_types is not None else None
+        # A list, since the merge loop reads one score at a time
+        self.scores = np.asarray(scores, dtype=np.float64).tolist() if scores is not None else [0.0] * len(tokens)
+        self._ids = {token: i for i, token in enumerate(tokens)}
+        self._merge_ranks = {}
+        if merges is not None:
+            for rank, merge in enumerate(merges):
+                left, _, right = merge.partition(" ")
+                self._merge_ranks[(left, right)] = rank
+        self._byte_encoder = _bytes_to_unicode()
+        self._byte_decoder = {character: byte for byte, character in self._byte_encoder.items()}
+        self._word_cache = {}
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """
+        :param metadata: GGUF metadata dictionary (see GGUFReader.metadata).
+        :return: GGUFTokenizer.
+        """
+        if "tokenizer.ggml.tokens" not in metadata:
+            raise KeyError("The GGUF file has no tokenizer vocabulary.")
+        model = metadata.get("tokenizer.ggml.model", "llama")
+        # Decoded once: the encoder looks every piece up
+        tokens = list(metadata["tokenizer.ggml.tokens"])
+        return cls(tokens,
+                   scores=metadata.get("tokenizer.ggml.scores"),
+                   token_types=metadata.get("tokenizer.ggml.token_type"),
+                   merges=metadata.get("tokenizer.ggml.merges"),
+                   model=model,
+                   bos_id=metadata.get("tokenizer.ggml.bos_token_id"),
+                   add_bos=bool(metadata.get("tokenizer.ggml.add_bos_token", model == "llama")),
+                   add_space_prefix=bool(metadata.get("tokenizer.ggml.add_space_prefix", True)),
+                   unk_id=metadata.get("tokenizer.ggml.unknown_token_id"))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def encode(self, text, add_bos=None):
+        """
+        :param text: Text to tokenize.
+        :param add_bos: Prepend the BOS token (defaults to the vocabulary's setting).
+        :return: int32 array of token ids.
+        """
+        if self.model == "llama":
+            if self.add_space_prefix and text:
+                text = " " + text
+            words = _SPM_WORD.findall(text.replace(" ", SPM_SPACE))
+            encode_word = self._encode_spm_word
+        else:
+            words = _BPE_WORD.findall(text)
+            encode_word = self._encode_bpe_word
+        ids = [self.bos_id] if (self.add_bos if add_bos is None else add_bos) and self.bos_id is not None else []
+        cache = self._word_cache
+        for word in words:
+            word_ids = cache.get(word)
+            if word_ids is None:
+                if len(cache) >= MAX_CACHED_WORDS:
+                    cache.clear()
+                word_ids = cache[word] = encode_word(word)
+            ids.extend(word_ids)
+        return np.array(ids, dtype=np.int32)
+
+    def _encode_spm_word(self, word):
+        # Repeatedly merges the adjacent pair whose merged piece has the highest score,
+        # as llama.cpp's SentencePiece tokenizer does; symbols form a linked list
+        symbols = list(word)
+        following = list(range(1, len(symbols) + 1))
+        preceding = list(range(-1, len(symbols) - 1))
+        heap = []
+
+        def push(left):
+            right = following[left]
+            if right < len(symbols):
+                token_id = self._ids.get(symbols[left] + symbols[right])
+                if token_id is not None:
+                    heapq.heappush(heap, (-self.scores[token_id], left, symbols[left], symbols[right]))
+
+        for i in range(len(symbols) - 1):
+            push(i)
+        while heap:
+            _, left, left_piece, right_piece = heapq.heappop(heap)
+            right = following[left]
+            # Skip pairs made stale by an earlier merge
+            if right >= len(symbols) or symbols[left] != left_piece or symbols[right] != right_piece:
+                continue
+            symbols[left] = left_piece + right_piece
+            symbols[right] = ""
+            following[left] = following[right]
+            if following[left] < len(symbols):
+                preceding[following[left]] = left
+            if preceding[left] >= 0:
+                push(preceding[left])
+            push(left)
+        ids = []
+        for symbol in symbols:
+            if not symbol:
+                continue
+            token_id = self._ids.get(symbol)
+            if token_id is not None:
+                ids.append(token_id)
+                continue
+            # Byte fallback, or the unknown token for vocabularies without byte pieces
+            for byte in symbol.encode("utf-8"):
+                byte_id = self._ids.get(f"<0x{byte:02X}>", self.unk_id)
+                if byte_id is not None:
+                    ids.append(byte_id)
+        return ids
+
+    def _encode_bpe_word(self, word):
+        parts = [self._byte_encoder[byte] for byte in word.encode("utf-8")]
+        ranks = self._merge_ranks
+        while len(parts) > 1:
+            pairs = [(ranks.get((a, b)), i) for i, (a, b) in enumerate(zip(parts, parts[1:]))]
+            candidates = [(rank, i) for rank, i in pairs if rank is not None]
+            if not candidates:
+                break
+            _, i = min(candidates)
+            parts[i:i + 2] = [parts[i] + parts[i + 1]]
+        ids = []
+        for part in parts:
+            token_id = self._ids.get(part, self.unk_id)
+            if token_id is not None:
+                ids.append(token_id)
+        return ids
+
+    def piece(self, token_id):
+        """
+        :param token_id: Token id.
+        :return: The text the token stands for (control tokens keep their name).
+        """
+        token = self.tokens[token_id]
+        if self.model == "llama":
+            match = _BYTE_PIECE.match(token)
+            if match:
+                return bytes([int(match.group(1), 16)]).decode("utf-8", errors="replace")
+            return token.replace(SPM_SPACE, " ")
+        if self.token_types is not None and self.token_types[token_id] == TOKEN_TYPE_CONTROL:
+            return token
+        data = bytes(self._byte_decoder.get(character, 32) for character in token)
+        return data.decode("utf-8", errors="replace")
+
+    def pieces(self, token_ids):
+        """
+        :param token_ids: Token ids.
+        :return: List of the text of each token.
+        """
+        return [self.piece(token_id) for token_id in np.asarray(token_ids).tolist()]
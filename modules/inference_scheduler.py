@@ -0,0 +1,273 @@
+# modules/inference_scheduler.py
+
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_MAX_QUEUE = 64
+WAIT_TIME_WINDOW = 1000  # Number of recent wait times kept for the percentiles
+
+_END = object()
+
+
+class QueueFullError(RuntimeError):
+    """Raised by InferenceScheduler.submit when the queue is at capacity."""
+
+
+class JobCancelledError(RuntimeError):
+    """Raised when waiting for the result of a cancelled job."""
+
+
+class InferenceJob:
+    def __init__(self, job_id, session_id, task):
+        """
+        A unit of work submitted to the InferenceScheduler.
+
+        :param job_id: Sequential job number.
+        :param session_id: Session that submitted the job.
+        :param task: Callable(model) returning a value or an iterator of streamed items.
+        """
+        self.id = job_id
+        self.session_id = session_id
+        self.task = task
+        self.status = "queued"
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._outputs = queue.Queue()
+        self._cancelled = threading.Event()
+        self._scheduler = None
+        self._streamed = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def wait_time(self):
+        """Seconds the job spent in the queue, or None if it has not started."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    def cancel(self):
+        """
+        Cancels the job. A queued job is removed from the queue; a running job stops
+        at the next streamed item. Cancelling a finished job has no effect.
+        """
+        if self.status in ("done", "failed", "cancelled"):
+            return
+        self._cancelled.set()
+        if self._scheduler is not None:
+            self._scheduler._discard(self)
+
+    def stream(self, timeout=None):
+        """
+        Yields the items produced by the task as they arrive.
+
+        :param timeout: Seconds to wait for each item (None waits forever).
+        :return: Generator of streamed items.
+        """
+        while True:
+            item = self._outputs.get(timeout=timeout)
+            if item is _END:
+                # Leave the marker for any other reader of this job
+                self._outputs.put(_END)
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def result(self, timeout=None):
+        """
+        Waits for the job to finish.
+
+        :param timeout: Seconds to wait for each item (None waits forever).
+        :return: The task's return value, or the list of streamed items.
+        """
+        items = list(self.stream(timeout=timeout))
+        if self.status == "cancelled":
+            raise JobCancelledError(f"Job {self.id} was cancelled.")
+        if self._streamed:
+            return items
+        return items[0] if items else None
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.monotonic()
+        self._outputs.put(_END)
+
+
+class InferenceScheduler:
+    def __init__(self, replicas, max_queue=DEFAULT_MAX_QUEUE, max_pending_per_session=None):
+        """
+        Runs inference jobs on a fixed set of model replicas, one worker thread per
+        replica, so no replica is ever used by two requests at once. Waiting jobs are
+        taken round-robin across sessions so one busy user cannot starve the others.
+
+        :param replicas: List of loaded models; each is used by exactly one worker.
+        :param max_queue: Maximum number of waiting jobs before submit() rejects work.
+        :param max_pending_per_session: Optional limit of waiting jobs per session.
+        """
+        if not replicas:
+            raise ValueError("The scheduler needs at least one model replica.")
+        self.replicas = list(replicas)
+        self.max_queue = max_queue
+        self.max_pending_per_session = max_pending_per_session
+        self._sessions = OrderedDict()  # session_id -> deque of queued jobs, in round-robin order
+        self._pending = 0
+        self._running = 0
+        self._condition = threading.Condition()
+        self._job_ids = itertools.count(1)
+        self._shutdown = False
+        self._wait_times = deque(maxlen=WAIT_TIME_WINDOW)
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self._workers = []
+        for index, model in enumerate(self.replicas):
+            worker = threading.Thread(target=self._worker_loop, args=(model,),
+                                      name=f"inference-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, session_id, task):
+        """
+        Queues a task.
+
+        :param session_id: Session submitting the task (used for fair ordering).
+        :param task: Callable(model) returning a value or an iterator of streamed items.
+        :return: InferenceJob handle.
+        :raises QueueFullError: If the queue (or the session's share of it) is full.
+        """
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("The scheduler has been shut down.")
+            session_jobs = self._sessions.get(session_id)
+            session_pending = len(session_jobs) if session_jobs else 0
+            if self._pending >= self.max_queue or (
+                    self.max_pending_per_session is not None
+                    and session_pending >= self.max_pending_per_session):
+                self._counters["rejected"] += 1
+                raise QueueFullError("Too many requests are waiting; please try again shortly.")
+            job = InferenceJob(next(self._job_ids), session_id, task)
+            job._scheduler = self
+            if session_jobs is None:
+                session_jobs = self._sessions[session_id] = deque()
+            session_jobs.append(job)
+            self._pending += 1
+            self._counters["submitted"] += 1
+            self._condition.notify()
+            return job
+
+    def metrics(self):
+        """
+        Reports queue depth, worker usage, job counters and recent queue wait times.
+
+        :return: Dictionary of metrics.
+        """
+        with self._condition:
+            waits = sorted(self._wait_times)
+            metrics = dict(self._counters)
+            metrics.update({
+                "queue_depth": self._pending,
+                "sessions_waiting": len(self._sessions),
+                "running": self._running,
+                "replicas": len(self.replicas),
+            })
+        if waits:
+            metrics.update({
+                "wait_mean_s": sum(waits) / len(waits),
+                "wait_p50_s": waits[len(waits) // 2],
+                "wait_p95_s": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+                "wait_max_s": waits[-1],
+            })
+        return metrics
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers. Queued jobs are cancelled; running jobs finish first.
+
+        :param wait: Wait for the worker threads to exit.
+        """
+        with self._condition:
+            self._shutdown = True
+            for session_jobs in self._sessions.values():
+                for job in session_jobs:
+                    job._cancelled.set()
+                    job._finish("cancelled")
+                    self._counters["cancelled"] += 1
+            self._sessions.clear()
+            self._pending = 0
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _discard(self, job):
+        with self._condition:
+            session_jobs = self._sessions.get(job.session_id)
+            if session_jobs is None or job not in session_jobs:
+                return
+            session_jobs.remove(job)
+            if not session_jobs:
+                del self._sessions[job.session_id]
+            self._pending -= 1
+            self._counters["cancelled"] += 1
+            job._finish("cancelled")
+
+    def _next_job(self):
+        # Take the oldest job of the session at the head, then move that session to the back
+        session_id, session_jobs = next(iter(self._sessions.items()))
+        job = session_jobs.popleft()
+        if session_jobs:
+            self._sessions.move_to_end(session_id)
+        else:
+            del self._sessions[session_id]
+        self._pending -= 1
+        return job
+
+    def _worker_loop(self, model):
+        while True:
+            with self._condition:
+                while not self._sessions and not self._shutdown:
+                    self._condition.wait()
+                if self._shutdown and not self._sessions:
+                    return
+                job = self._next_job()
+                job.status = "running"
+                job.started_at = time.monotonic()
+                self._wait_times.append(job.wait_time)
+                self._running += 1
+            status = self._run(job, model)
+            with self._condition:
+                self._running -= 1
+                self._counters[status] += 1
+
+    def _run(self, job, model):
+        try:
+            result = job.task(model)
+            if hasattr(result, "__next__"):
+                job._streamed = True
+                try:
+                    for item in result:
+                        if job.cancelled:
+                            break
+                        job._outputs.put(item)
+                finally:
+                    # Stops a generator early, e.g. ends llama.cpp streaming on cancel
+                    if hasattr(result, "close"):
+                        result.close()
+            else:
+                job._outputs.put(result)
+        except Exception as e:
+            print(f"Inference job {job.id} failed: {e}")
+            job._finish("failed", e)
+            return "failed"
+        if job.cancelled:
+            job._finish("cancelled")
+            return "cancelled"
+        job._finish("done")
+        return "completed"
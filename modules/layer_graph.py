@@ -0,0 +1,334 @@
+# modules/layer_graph.py
+
+import re
+
+import numpy as np
+
+KINDS = ("embedding", "norm", "attention", "ffn", "router", "expert", "output", "other")
+KIND_COLORS = {
+    "embedding": "#f4a259", "norm": "#9aa5b1", "attention": "#3f88c5", "ffn": "#44af69",
+    "router": "#e94f37", "expert": "#8cd867", "output": "#f6ae2d", "other": "#bc8cbf",
+}
+
+# Order in which the components of a block process the hidden state. Components in
+# the same stage run side by side; every stage feeds the next non-empty one.
+_STAGES = {
+    "attn_norm": 0,
+    "attn_q": 1, "attn_k": 1, "attn_v": 1, "attn_qkv": 1,
+    "attn_output": 2, "attn_post_norm": 2,
+    "ffn_norm": 3,
+    "ffn_gate_inp": 4,
+    "ffn_gate": 5, "ffn_up": 5, "ffn_gate_exps": 5, "ffn_up_exps": 5, "ffn_gate_shexp": 5, "ffn_up_shexp": 5,
+    "ffn_down": 6, "ffn_down_exps": 6, "ffn_down_shexp": 6,
+}
+_OTHER_STAGE = 7
+_N_STAGES = 8
+
+LAYER_SPACING = 6.0
+STAGE_SPACING = 4.0
+NODE_SPACING = 1.5
+EXPERT_SPACING = 0.6
+
+_BLOCK_TENSOR = re.compile(r"^blk\.(\d+)\.(.+)\.([^.]+)$")
+
+
+def _component_stage(component):
+    stage = _STAGES.get(component)
+    if stage is not None:
+        return stage
+    # Components of other architectures are placed by their prefix
+    if component.startswith("attn"):
+        return 0 if "norm" in component else 1
+    if component.startswith("ffn"):
+        return 3 if "norm" in component else 5
+    return _OTHER_STAGE
+
+
+def _component_kind(component, n_experts):
+    if "norm" in component:
+        return "norm"
+    if n_experts > 1:
+        return "expert"
+    if component == "ffn_gate_inp" or component.startswith("exp_probs"):
+        return "router"
+    if component.startswith("attn"):
+        return "attention"
+    if component.startswith("ffn"):
+        return "ffn"
+    return "other"
+
+
+def _global_kind(component):
+    if "embd" in component:
+        return "embedding"
+    if "norm" in component:
+        return "norm"
+    if component.startswith("output"):
+        return "output"
+    return "other"
+
+
+class LayerGraph:
+    def __init__(self, names, blocks, kinds, experts, parameters, n_bytes, mean_abs, std, sparsity,
+                 positions, edges):
+        """
+        Graph of a model's components: one node per block component (attention
+        projections, feed-forward matrices, norms, router, experts) and per global tensor,
+        with edges following the flow of the hidden state. All node attributes are
+        columns indexed by node number, and edges are (source, target) node numbers, so
+        nothing has to be looked up by name.
+
+        :param names: Node names (e.g. 'blk.3.attn_q', or 'blk.3.ffn_up_exps[7]' for an expert).
+        :param blocks: int32 block index of each node (-1 for tensors outside the blocks).
+        :param kinds: uint8 index into KINDS.
+        :param experts: int32 expert index (-1 unless the node is one expert of a MoE tensor).
+        :param parameters: int64 parameter count.
+        :param n_bytes: int64 size of the node's tensor data in the file.
+        :param mean_abs: float32 mean absolute weight (NaN without statistics).
+        :param std: float32 weight standard deviation (NaN without statistics).
+        :param sparsity: float32 fraction of zero weights (NaN without statistics).
+        :param positions: (n, 3) float32 layout coordinates.
+        :param edges: (m, 2) int32 node index pairs.
+        """
+        self.names = names
+        self.blocks = blocks
+        self.kinds = kinds
+        self.experts = experts
+        self.parameters = parameters
+        self.n_bytes = n_bytes
+        self.mean_abs = mean_abs
+        self.std = std
+        self.sparsity = sparsity
+        self.positions = positions
+        self.edges = edges
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def sizes(self):
+        """Node sizes for display, growing with the cube root of the parameter count."""
+        largest = max(int(self.parameters.max()) if len(self) else 1, 1)
+        return (0.3 + 1.7 * np.cbrt(self.parameters / largest)).astype(np.float32)
+
+    @property
+    def colors(self):
+        """Hex color of each node, by kind."""
+        palette = [KIND_COLORS[kind] for kind in KINDS]
+        return [palette[kind] for kind in self.kinds.tolist()]
+
+    def to_buffers(self):
+        """
+        Packed typed buffers for instanced rendering: the browser uploads them to the GPU
+        as they are, instead of building one object per node and per link.
+
+        :return: Dictionary with "positions" ((n, 3) float32), "colors" ((n, 3) float32 RGB
+                 in [0, 1]), "sizes" (float32), "kinds" (uint8 into "kind_names"), "blocks"
+                 (int32), "edges" ((m, 2) uint32 node indices), the layout "center" and
+                 "radius", and the "kind_names" and "kind_colors" legend.
+        """
+        palette = np.array([[int(KIND_COLORS[kind][i:i + 2], 16) for i in (1, 3, 5)] for kind in KINDS],
+                           dtype=np.float32) / 255.0
+        positions = np.ascontiguousarray(self.positions, dtype=np.float32)
+        if len(self):
+            low, high = positions.min(axis=0), positions.max(axis=0)
+            center = (low + high) / 2
+            radius = float(np.linalg.norm(high - low)) / 2
+        else:
+            center, radius = np.zeros(3, dtype=np.float32), 0.0
+        return {
+            "count": len(self),
+            "positions": positions,
+            "colors": palette[self.kinds],
+            "sizes": self.sizes,
+            "kinds": self.kinds.astype(np.uint8),
+            "blocks": self.blocks.astype(np.int32),
+            "edges": self.edges.astype(np.uint32).reshape(-1, 2),
+            "center": center.tolist(),
+            "radius": max(radius, 1.0),
+            "kind_names": list(KINDS),
+            "kind_colors": [KIND_COLORS[kind] for kind in KINDS],
+        }
+
+    def to_dict(self):
+        """
+        JSON-serializable nodes and index-based links, as used by the brain view.
+
+        :return: Dictionary with "nodes", "links" (source and target are node indices) and "kinds".
+        """
+        sizes = self.sizes.tolist()
+        colors = self.colors
+        positions = self.positions.tolist()
+        mean_abs = np.where(np.isnan(self.mean_abs), 0.0, self.mean_abs)
+        nodes = [
+            {"id": i, "name": name, "block": block, "kind": KINDS[kind], "expert": expert,
+             "parameters": parameters, "x": x, "y": y, "z": z, "color": color, "size": size, "weight": weight}
+            for i, (name, block, kind, expert, parameters, (x, y, z), color, size, weight) in enumerate(zip(
+                self.names, self.blocks.tolist(), self.kinds.tolist(), self.experts.tolist(),
+                self.parameters.tolist(), positions, colors, sizes, mean_abs.tolist()))
+        ]
+        # Links carry the mean absolute weight of the component they leave
+        values = mean_abs[self.edges[:, 0]].tolist() if len(self.edges) else []
+        links = [{"source": source, "target": target, "value": value}
+                 for (source, target), value in zip(self.edges.tolist(), values)]
+        return {"nodes": nodes, "links": links, "kinds": list(KINDS)}
+
+
+class _GraphBuilder:
+    def __init__(self):
+        self.columns = {key: [] for key in ("names", "blocks", "kinds", "experts", "parameters", "n_bytes",
+                                            "mean_abs", "std", "sparsity", "x", "y", "z")}
+        self.count = 0
+
+    def add(self, names, block, kind, experts, parameters, n_bytes, stats, x, y, z):
+        n = len(names)
+        c = self.columns
+        c["names"].extend(names)
+        c["blocks"].append(np.full(n, block, dtype=np.int32))
+        c["kinds"].append(np.full(n, KINDS.index(kind), dtype=np.uint8))
+        c["experts"].append(np.asarray(experts, dtype=np.int32))
+        c["parameters"].append(np.full(n, parameters, dtype=np.int64))
+        c["n_bytes"].append(np.full(n, n_bytes, dtype=np.int64))
+        for key, value in zip(("mean_abs", "std", "sparsity"), stats):
+            c[key].append(np.full(n, value, dtype=np.float32))
+        for key, value in (("x", x), ("y", y), ("z", z)):
+            c[key].append(np.broadcast_to(np.asarray(value, dtype=np.float32), (n,)))
+        start = self.count
+        self.count += n
+        return start, n
+
+    def build(self, edges):
+        c = self.columns
+
+        def join(key, dtype):
+            return np.concatenate(c[key]).astype(dtype, copy=False) if c[key] else np.zeros(0, dtype=dtype)
+
+        positions = np.stack([join("x", np.float32), join("y", np.float32), join("z", np.float32)], axis=1)
+        edges = np.concatenate(edges).astype(np.int32) if edges else np.zeros((0, 2), dtype=np.int32)
+        return LayerGraph(c["names"], join("blocks", np.int32), join("kinds", np.uint8), join("experts", np.int32),
+                          join("parameters", np.int64), join("n_bytes", np.int64), join("mean_abs", np.float32),
+                          join("std", np.float32), join("sparsity", np.float32), positions, edges)
+
+
+def _component_stats(infos, tensor_stats):
+    if not tensor_stats:
+        return np.nan, np.nan, np.nan
+    stats = [tensor_stats[info.name] for info in infos if info.name in tensor_stats]
+    count = sum(s.count for s in stats)
+    if not count:
+        return np.nan, np.nan, np.nan
+    # Count-weighted; the std combines second moments about zero
+    mean_abs = sum(s.mean_abs * s.count for s in stats) / count
+    second = sum((s.std ** 2 + s.mean ** 2) * s.count for s in stats) / count
+    mean = sum(s.mean * s.count for s in stats) / count
+    sparsity = sum(s.sparsity * s.count for s in stats) / count
+    return mean_abs, float(np.sqrt(max(second - mean ** 2, 0.0))), sparsity
+
+
+def _family(component):
+    # Routed experts, shared experts and dense matrices form separate paths through the FFN
+    for suffix in ("_exps", "_shexp"):
+        if component.endswith(suffix):
+            return suffix
+    return ""
+
+
+def _connect(groups_a, groups_b):
+    # Groups are (start, count, is_expert, family). A group feeds the groups of its own family
+    # if the next stage has any, else all of them; matching expert groups join expert to expert.
+    pairs = []
+    for start_a, count_a, experts_a, family_a in groups_a:
+        targets = [group for group in groups_b if group[3] == family_a] or groups_b
+        for start_b, count_b, experts_b, _ in targets:
+            a = np.arange(start_a, start_a + count_a)
+            b = np.arange(start_b, start_b + count_b)
+            if experts_a and experts_b and count_a == count_b:
+                pairs.append(np.stack([a, b], axis=1))
+            else:
+                pairs.append(np.stack([np.repeat(a, count_b), np.tile(b, count_a)], axis=1))
+    return pairs
+
+
+def build_layer_graph(reader, tensor_stats=None, expand_experts=False):
+    """
+    Derives the component graph of a model from its GGUF tensor table. Only the
+    header is used: parameter counts come from the tensor shapes and weight statistics
+    from tensor_stats, if given.
+
+    :param reader: Open GGUFReader.
+    :param tensor_stats: Optional dictionary mapping tensor names to TensorStats (e.g. from the stats cache).
+    :param expand_experts: One node per expert of MoE tensors instead of one per tensor.
+    :return: LayerGraph.
+    """
+    blocks, globals_ = {}, {}
+    for info in reader.tensors:
+        match = _BLOCK_TENSOR.match(info.name)
+        if match:
+            components = blocks.setdefault(int(match.group(1)), {})
+            components.setdefault(match.group(2), []).append(info)
+        else:
+            globals_.setdefault(info.name.rsplit(".", 1)[0], []).append(info)
+
+    n_blocks = max(blocks) + 1 if blocks else 0
+    top = (n_blocks - 1) * LAYER_SPACING / 2
+    builder = _GraphBuilder()
+    edges = []
+
+    def add_global(component, infos, y):
+        return builder.add([component], -1, _global_kind(component), [-1], sum(t.n_elements for t in infos),
+                           sum(t.n_bytes for t in infos), _component_stats(infos, tensor_stats), 0.0, y, 0.0)
+
+    inputs, outputs, others = [], [], []
+    for component, infos in globals_.items():
+        kind = _global_kind(component)
+        (inputs if kind == "embedding" else outputs if kind in ("norm", "output") else others).append(
+            (component, infos))
+    first_groups = [(*add_global(c, infos, top + LAYER_SPACING), False, "") for c, infos in inputs]
+    for i, (component, infos) in enumerate(others):
+        builder.add([component], -1, "other", [-1], sum(t.n_elements for t in infos),
+                    sum(t.n_bytes for t in infos), _component_stats(infos, tensor_stats),
+                    (i + 1) * STAGE_SPACING, top + LAYER_SPACING, 0.0)
+
+    previous = first_groups
+    for block in range(n_blocks):
+        y = top - block * LAYER_SPACING
+        stages = [[] for _ in range(_N_STAGES)]
+        for component, infos in blocks.get(block, {}).items():
+            stages[_component_stage(component)].append((component, infos))
+        for stage, members in enumerate(stages):
+            if not members:
+                continue
+            x = (stage - (_N_STAGES - 1) / 2) * STAGE_SPACING
+            groups = []
+            for slot, (component, infos) in enumerate(sorted(members)):
+                z = (slot - (len(members) - 1) / 2) * NODE_SPACING
+                n_experts = max(int(info.dims[-1]) if len(info.dims) == 3 else 1 for info in infos)
+                kind = _component_kind(component, n_experts)
+                parameters = sum(t.n_elements for t in infos)
+                n_bytes = sum(t.n_bytes for t in infos)
+                stats = _component_stats(infos, tensor_stats)
+                if expand_experts and n_experts > 1:
+                    # Experts on a small grid around the component's place
+                    experts = np.arange(n_experts)
+                    columns = int(np.ceil(np.sqrt(n_experts)))
+                    dz = (experts % columns - (columns - 1) / 2) * EXPERT_SPACING
+                    dy = (experts // columns - (columns - 1) / 2) * EXPERT_SPACING
+                    names = [f"blk.{block}.{component}[{e}]" for e in range(n_experts)]
+                    start, count = builder.add(names, block, kind, experts, parameters // n_experts,
+                                               n_bytes // n_experts, stats, x, y + dy, z + dz)
+                    groups.append((start, count, True, _family(component)))
+                else:
+                    start, count = builder.add([f"blk.{block}.{component}"], block, kind, [-1], parameters,
+                                               n_bytes, stats, x, y, z)
+                    groups.append((start, count, False, _family(component)))
+            edges.extend(_connect(previous, groups))
+            previous = groups
+
+    last_y = top - n_blocks * LAYER_SPACING
+    for component, infos in sorted(outputs, key=lambda item: _global_kind(item[0]) != "norm"):
+        start, count = add_global(component, infos, last_y)
+        groups = [(start, count, False, "")]
+        edges.extend(_connect(previous, groups))
+        previous = groups
+        last_y -= LAYER_SPACING / 2
+    return builder.build(edges)
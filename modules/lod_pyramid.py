@@ -0,0 +1,309 @@
+# modules/lod_pyramid.py
+
+import os
+
+import numpy as np
+
+from modules.stats_cache import StatsCache, file_fingerprint
+from modules.weight_stats import DEFAULT_CHUNK_BYTES, read_blocks
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_MAX_STORED_CELLS = 4 * 1024 * 1024  # Finer levels are pooled from the GGUF on demand
+DEFAULT_LOD_CACHE_DIR = os.path.join('outputs', 'cache', 'lod')
+DEFAULT_LOD_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def matrix_shape(info):
+    """
+    Views a tensor as a matrix: one row per innermost row of weights. Higher-dimensional
+    tensors (e.g. stacked MoE experts) are flattened into rows.
+
+    :param info: GGUFTensorInfo.
+    :return: Tuple (rows, columns).
+    """
+    columns = info.dims[0] if info.dims else 1
+    return info.n_elements // columns, columns
+
+
+def _cell_counts(rows, columns, factor):
+    # Number of source values pooled into each cell; edge cells may be partial
+    row_sizes = np.minimum(factor, rows - np.arange(0, rows, factor))
+    column_sizes = np.minimum(factor, columns - np.arange(0, columns, factor))
+    return np.outer(row_sizes, column_sizes)
+
+
+def pool_values(values, factor):
+    """
+    Pools a 2D array into factor x factor cells.
+
+    :param values: 2D float array.
+    :param factor: Pooling factor.
+    :return: Tuple (min, max, sum) arrays.
+    """
+    row_starts = np.arange(0, values.shape[0], factor)
+    column_starts = np.arange(0, values.shape[1], factor)
+    mins = np.minimum.reduceat(np.minimum.reduceat(values, row_starts, axis=0), column_starts, axis=1)
+    maxs = np.maximum.reduceat(np.maximum.reduceat(values, row_starts, axis=0), column_starts, axis=1)
+    sums = np.add.reduceat(np.add.reduceat(values, row_starts, axis=0, dtype=np.float64), column_starts, axis=1)
+    return mins, maxs, sums
+
+
+def pool_level(level, factor=2):
+    """
+    Pools a pyramid level (min, max, mean and count arrays) into the next coarser one.
+
+    :param level: Dictionary with "min", "max", "mean" and "count" arrays.
+    :param factor: Pooling factor.
+    :return: Dictionary for the coarser level.
+    """
+    row_starts = np.arange(0, level["min"].shape[0], factor)
+    column_starts = np.arange(0, level["min"].shape[1], factor)
+
+    def reduce(ufunc, values, dtype=None):
+        return ufunc.reduceat(ufunc.reduceat(values, row_starts, axis=0, dtype=dtype), column_starts, axis=1)
+
+    counts = reduce(np.add, level["count"], dtype=np.int64)
+    sums = reduce(np.add, level["mean"] * level["count"], dtype=np.float64)
+    return {
+        "min": reduce(np.minimum, level["min"]),
+        "max": reduce(np.maximum, level["max"]),
+        "mean": (sums / counts).astype(np.float32),
+        "count": counts,
+    }
+
+
+class TensorPyramid:
+    def __init__(self, name, shape, tile_size, levels, source=None):
+        """
+        Multi-resolution view of a tensor. Level 0 is full resolution and every level
+        halves both dimensions; each cell holds the min, max and mean of the values it
+        covers. Coarse levels are kept in memory; finer ones are pooled from the source
+        when one of their tiles is requested.
+
+        :param name: Tensor name.
+        :param shape: Matrix shape (rows, columns).
+        :param tile_size: Tile edge in cells.
+        :param levels: Dictionary mapping level number to its stored arrays.
+        :param source: Callable(row_start, row_end) returning those full-resolution rows,
+                       needed for levels that are not stored.
+        """
+        self.name = name
+        self.shape = tuple(shape)
+        self.tile_size = tile_size
+        self.levels = levels
+        self.source = source
+        self.n_levels = _level_count(self.shape, tile_size)
+
+    def level_shape(self, level):
+        """
+        :return: Shape in cells of a level.
+        """
+        factor = 1 << level
+        return -(-self.shape[0] // factor), -(-self.shape[1] // factor)
+
+    def tile_grid(self, level):
+        """
+        :return: Number of tiles (rows, columns) of a level.
+        """
+        rows, columns = self.level_shape(level)
+        return -(-rows // self.tile_size), -(-columns // self.tile_size)
+
+    def level_for_view(self, max_cells):
+        """
+        Picks the finest level whose whole extent fits in max_cells cells.
+
+        :param max_cells: Cell budget of the view.
+        :return: Level number.
+        """
+        for level in range(self.n_levels):
+            rows, columns = self.level_shape(level)
+            if rows * columns <= max_cells:
+                return level
+        return self.n_levels - 1
+
+    def tile(self, level, tile_row, tile_column):
+        """
+        Returns one tile of a level. At most tile_size x tile_size cells are returned,
+        whatever the size of the tensor.
+
+        :param level: Level number (0 is full resolution).
+        :param tile_row: Tile row index.
+        :param tile_column: Tile column index.
+        :return: Dictionary with the tile position and its "min", "max" and "mean" arrays.
+        """
+        if not 0 <= level < self.n_levels:
+            raise ValueError(f"Level must be between 0 and {self.n_levels - 1}.")
+        grid = self.tile_grid(level)
+        if not (0 <= tile_row < grid[0] and 0 <= tile_column < grid[1]):
+            raise ValueError(f"Tile ({tile_row}, {tile_column}) is outside the {grid[0]}x{grid[1]} grid.")
+        size = self.tile_size
+        rows = slice(tile_row * size, (tile_row + 1) * size)
+        columns = slice(tile_column * size, (tile_column + 1) * size)
+        if level in self.levels:
+            stored = self.levels[level]
+            cells = {key: stored[key][rows, columns] for key in ("min", "max", "mean")}
+        else:
+            cells = self._pool_tile(level, tile_row, tile_column)
+        return {
+            "name": self.name,
+            "level": level,
+            "factor": 1 << level,
+            "tile": [tile_row, tile_column],
+            "origin": [tile_row * size, tile_column * size],
+            "level_shape": list(self.level_shape(level)),
+            "grid": list(grid),
+            "min": cells["min"],
+            "max": cells["max"],
+            "mean": cells["mean"],
+        }
+
+    def _pool_tile(self, level, tile_row, tile_column):
+        if self.source is None:
+            raise ValueError(f"Level {level} is not stored and the pyramid has no source to read it from.")
+        factor = 1 << level
+        span = self.tile_size * factor
+        row_start, column_start = tile_row * span, tile_column * span
+        values = self.source(row_start, min(self.shape[0], row_start + span))
+        values = values[:, column_start:column_start + span]
+        mins, maxs, sums = pool_values(values, factor)
+        counts = _cell_counts(values.shape[0], values.shape[1], factor)
+        return {"min": mins, "max": maxs, "mean": (sums / counts).astype(np.float32)}
+
+    def overview(self):
+        """
+        :return: The coarsest level as a single tile (the whole tensor in one view).
+        """
+        return self.tile(self.n_levels - 1, 0, 0)
+
+
+def _level_count(shape, tile_size):
+    levels = 1
+    while max(-(-shape[0] // (1 << (levels - 1))), -(-shape[1] // (1 << (levels - 1)))) > tile_size:
+        levels += 1
+    return levels
+
+
+def _finest_stored_level(shape, tile_size, max_stored_cells):
+    n_levels = _level_count(shape, tile_size)
+    for level in range(n_levels):
+        factor = 1 << level
+        if -(-shape[0] // factor) * -(-shape[1] // factor) <= max_stored_cells:
+            return level
+    return n_levels - 1
+
+
+def pyramid_from_array(name, array, tile_size=DEFAULT_TILE_SIZE, max_stored_cells=DEFAULT_MAX_STORED_CELLS):
+    """
+    Builds a pyramid for an in-memory array (e.g. an attention matrix).
+
+    :param name: Name shown with the tiles.
+    :param array: Array; dimensions beyond the last are flattened into rows.
+    :param tile_size: Tile edge in cells.
+    :param max_stored_cells: Largest level kept in memory.
+    :return: TensorPyramid.
+    """
+    values = np.asarray(array, dtype=np.float32)
+    values = values.reshape(-1, values.shape[-1]) if values.ndim else values.reshape(1, 1)
+    return _build(name, values.shape, lambda start, end: values[start:end], tile_size, max_stored_cells)
+
+
+def build_tensor_pyramid(reader, info, tile_size=DEFAULT_TILE_SIZE, max_stored_cells=DEFAULT_MAX_STORED_CELLS,
+                         chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Builds the pyramid of a GGUF tensor in one streaming pass over its rows. Only the
+    levels with at most max_stored_cells cells are kept; tiles of finer levels are read
+    and pooled from the file when requested.
+
+    :param reader: Open GGUFReader.
+    :param info: GGUFTensorInfo of the tensor.
+    :param tile_size: Tile edge in cells.
+    :param max_stored_cells: Largest level kept in memory.
+    :param chunk_bytes: Approximate size of the float32 rows dequantized at a time.
+    :return: TensorPyramid.
+    """
+    return _build(info.name, matrix_shape(info), _tensor_source(reader, info), tile_size, max_stored_cells,
+                  chunk_bytes)
+
+
+def _tensor_source(reader, info):
+    columns = matrix_shape(info)[1]
+    blocks_per_row = columns // info.block_size
+
+    def source(row_start, row_end):
+        values = read_blocks(reader, info, row_start * blocks_per_row, row_end * blocks_per_row)
+        return values.reshape(row_end - row_start, columns)
+
+    return source
+
+
+def _build(name, shape, source, tile_size, max_stored_cells, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    finest = _finest_stored_level(shape, tile_size, max_stored_cells)
+    factor = 1 << finest
+    # Whole groups of `factor` rows per chunk, so chunk boundaries never split a cell
+    rows_per_chunk = max(factor, (chunk_bytes // (4 * shape[1])) // factor * factor)
+    parts = {"min": [], "max": [], "sum": []}
+    for row_start in range(0, shape[0], rows_per_chunk):
+        values = source(row_start, min(shape[0], row_start + rows_per_chunk))
+        mins, maxs, sums = pool_values(values, factor)
+        parts["min"].append(mins)
+        parts["max"].append(maxs)
+        parts["sum"].append(sums)
+    counts = _cell_counts(shape[0], shape[1], factor)
+    level = {
+        "min": np.concatenate(parts["min"]).astype(np.float32),
+        "max": np.concatenate(parts["max"]).astype(np.float32),
+        "mean": (np.concatenate(parts["sum"]) / counts).astype(np.float32),
+        "count": counts,
+    }
+    levels = {finest: level}
+    n_levels = _level_count(shape, tile_size)
+    for number in range(finest + 1, n_levels):
+        level = pool_level(level)
+        levels[number] = level
+    return TensorPyramid(name, shape, tile_size, levels, source)
+
+
+class PyramidCache(StatsCache):
+    def __init__(self, cache_dir=DEFAULT_LOD_CACHE_DIR, max_bytes=DEFAULT_LOD_CACHE_BYTES):
+        """
+        On-disk cache of the stored pyramid levels, one .npz file per tensor, evicted
+        least-recently-used first like the statistics cache.
+        """
+        super().__init__(cache_dir=cache_dir, max_bytes=max_bytes)
+
+    def get_or_build(self, reader, name, tile_size=DEFAULT_TILE_SIZE, max_stored_cells=DEFAULT_MAX_STORED_CELLS):
+        """
+        Returns the pyramid of a tensor, building and caching it on a miss.
+
+        :param reader: Open GGUFReader (kept by the pyramid to read fine levels).
+        :param name: Tensor name.
+        :param tile_size: Tile edge in cells.
+        :param max_stored_cells: Largest level kept in memory.
+        :return: TensorPyramid.
+        """
+        info = reader.get_tensor_info(name)
+        if info is None:
+            raise KeyError(f"Tensor '{name}' not found.")
+        key = file_fingerprint(reader, "lod", name, tile_size, max_stored_cells)
+        levels = self.get_arrays(key, decode=_decode_levels)
+        if levels is not None:
+            return TensorPyramid(name, matrix_shape(info), tile_size, levels, _tensor_source(reader, info))
+        pyramid = build_tensor_pyramid(reader, info, tile_size=tile_size, max_stored_cells=max_stored_cells)
+        self.put_arrays(key, _encode_levels(pyramid.levels))
+        return pyramid
+
+
+def _encode_levels(levels):
+    arrays = {}
+    for number, level in levels.items():
+        for field in ("min", "max", "mean"):
+            arrays[f"{field}_{number}"] = level[field]
+    return arrays
+
+
+def _decode_levels(npz):
+    levels = {}
+    for key in npz.files:
+        field, number = key.rsplit("_", 1)
+        levels.setdefault(int(number), {})[field] = npz[key]
+    return levels
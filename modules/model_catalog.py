@@ -0,0 +1,235 @@
+# modules/model_catalog.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from modules.gguf_reader import GGUFReader
+
+DEFAULT_MODELS_DIR = 'models'
+DEFAULT_CATALOG_PATH = os.path.join('outputs', 'cache', 'model_catalog.db')
+MODEL_EXTENSIONS = ('.gguf',)
+SORT_COLUMNS = ('path', 'name', 'architecture', 'parameters', 'file_type', 'size', 'mtime_ns')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    architecture TEXT,
+    name TEXT,
+    parameters INTEGER,
+    file_type TEXT,
+    context_length INTEGER,
+    block_count INTEGER,
+    tensor_count INTEGER,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_by_directory ON models(directory);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+);
+"""
+
+
+def read_model_metadata(path):
+    """
+    Reads the catalog fields of a model from its GGUF header, without touching tensor data.
+
+    :param path: Path to the GGUF file.
+    :return: Dictionary of catalog fields.
+    """
+    with GGUFReader(path) as reader:
+        context_length = reader.get_arch_field("context_length")
+        return {
+            "architecture": reader.architecture,
+            "name": reader.metadata.get("general.name"),
+            "parameters": sum(t.n_elements for t in reader.tensors),
+            "file_type": reader.file_type,
+            "context_length": int(context_length) if context_length is not None else None,
+            "block_count": reader.block_count,
+            "tensor_count": len(reader.tensors),
+        }
+
+
+class ModelCatalog:
+    def __init__(self, models_dir=DEFAULT_MODELS_DIR, db_path=DEFAULT_CATALOG_PATH):
+        """
+        Persistent index of the GGUF models under a directory and their header metadata.
+
+        Rescans are incremental: a directory whose mtime has not changed since the last
+        scan still has the same entries, so its files are not listed or stat'ed again,
+        and only new or changed files have their headers parsed. Hidden directories
+        (such as the .git folders of git-lfs clones) are skipped.
+
+        :param models_dir: Directory holding the models.
+        :param db_path: Path to the SQLite index (':memory:' for a throwaway index).
+        """
+        self.models_dir = models_dir
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory and db_path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def scan(self, full=False):
+        """
+        Brings the index up to date with the models directory.
+
+        :param full: Stat every file even in unchanged directories (catches files
+                     rewritten in place, which does not change the directory mtime).
+        :return: Dictionary with the numbers of added, updated, removed and unchanged models.
+        """
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        with self._lock:
+            known_dirs = {row["path"]: (row["mtime_ns"], json.loads(row["subdirs"]))
+                          for row in self._conn.execute("SELECT * FROM directories")}
+            known_files = {}
+            for row in self._conn.execute("SELECT path, directory, size, mtime_ns FROM models"):
+                known_files.setdefault(row["directory"], {})[row["path"]] = (row["size"], row["mtime_ns"])
+
+        seen_dirs, seen_files = set(), set()
+        dir_updates, model_updates = [], []
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(self.models_dir, rel_dir)
+            try:
+                dir_mtime = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+            seen_dirs.add(rel_dir)
+            files = known_files.get(rel_dir, {})
+            if not full and rel_dir in known_dirs and known_dirs[rel_dir][0] == dir_mtime:
+                subdirs = known_dirs[rel_dir][1]
+                seen_files.update(files)
+                counts["unchanged"] += len(files)
+            else:
+                subdirs = []
+                try:
+                    entries = list(os.scandir(abs_dir))
+                except OSError as e:
+                    print(f"Cannot list '{abs_dir}': {e}")
+                    continue
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(rel_path)
+                    elif entry.name.lower().endswith(MODEL_EXTENSIONS):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        seen_files.add(rel_path)
+                        if files.get(rel_path) == (stat.st_size, stat.st_mtime_ns):
+                            counts["unchanged"] += 1
+                            continue
+                        counts["updated" if rel_path in files else "added"] += 1
+                        model_updates.append(self._index_entry(rel_path, rel_dir, entry.path, stat))
+                dir_updates.append((rel_dir, dir_mtime, json.dumps(subdirs)))
+            stack.extend(subdirs)
+
+        removed_files = [path for files in known_files.values() for path in files if path not in seen_files]
+        removed_dirs = [path for path in known_dirs if path not in seen_dirs]
+        counts["removed"] = len(removed_files)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO models VALUES (:path, :directory, :size, :mtime_ns, :architecture, "
+                    ":name, :parameters, :file_type, :context_length, :block_count, :tensor_count, :error, "
+                    ":indexed_at)", model_updates)
+                self._conn.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)", dir_updates)
+                self._conn.executemany("DELETE FROM models WHERE path = ?", [(p,) for p in removed_files])
+                self._conn.executemany("DELETE FROM directories WHERE path = ?", [(p,) for p in removed_dirs])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return counts
+
+    @staticmethod
+    def _index_entry(rel_path, rel_dir, abs_path, stat):
+        entry = {
+            "path": rel_path, "directory": rel_dir, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "architecture": None, "name": None, "parameters": None, "file_type": None,
+            "context_length": None, "block_count": None, "tensor_count": None, "error": None,
+            "indexed_at": time.time(),
+        }
+        try:
+            entry.update(read_model_metadata(abs_path))
+        except Exception as e:
+            # Recorded, so a broken or partial file is not parsed again until it changes
+            entry["error"] = str(e)
+            print(f"Could not index '{abs_path}': {e}")
+        return entry
+
+    def list_models(self, query=None, architecture=None, file_type=None, sort_by='path', descending=False,
+                    limit=None, include_errors=False):
+        """
+        Lists indexed models from the index, without touching the models directory.
+
+        :param query: Case-insensitive substring matched against the path and model name.
+        :param architecture: Only models of this architecture.
+        :param file_type: Only models with this quantization (e.g. 'Q4_K_M').
+        :param sort_by: One of SORT_COLUMNS.
+        :param descending: Sort in descending order.
+        :param limit: Maximum number of models to return.
+        :param include_errors: Include files whose header could not be parsed.
+        :return: List of model dictionaries.
+        """
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort_by}'; choose one of {', '.join(SORT_COLUMNS)}.")
+        clauses, params = [], []
+        if query:
+            clauses.append("(path LIKE ? OR name LIKE ?)")
+            params.extend([f"%{query}%"] * 2)
+        if architecture:
+            clauses.append("architecture = ?")
+            params.append(architecture)
+        if file_type:
+            clauses.append("file_type = ?")
+            params.append(file_type)
+        if not include_errors:
+            clauses.append("error IS NULL")
+        sql = "SELECT * FROM models"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {sort_by} {'DESC' if descending else 'ASC'}, path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def get_model(self, rel_path):
+        """
+        :param rel_path: Model path relative to the models directory.
+        :return: Model dictionary, or None if the model is not indexed.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM models WHERE path = ?", (rel_path,)).fetchone()
+        return dict(row) if row else None
@@ -0,0 +1,166 @@
+# modules/model_pool.py
+
+import os
+import threading
+from collections import OrderedDict
+
+from modules.gguf_model import GGUFModel
+from modules.gguf_reader import GGUFReader
+
+DEFAULT_BUDGET_FRACTION = 0.75  # Share of physical RAM the pool may use by default
+
+
+def physical_memory_bytes():
+    """
+    Returns the amount of physical memory, or None where it cannot be determined.
+
+    :return: Physical memory in bytes.
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def estimate_model_bytes(model_path, n_ctx=2048, n_gpu_layers=0, logits_all=False):
+    """
+    Estimates the host memory a loaded model needs from its GGUF tensor table:
+    the weights that stay on the CPU plus an f16 KV cache for n_ctx tokens.
+
+    :param model_path: Path to the GGUF model file.
+    :param n_ctx: Context length.
+    :param n_gpu_layers: Number of layers offloaded to the GPU.
+    :param logits_all: Whether float32 logits are kept for all n_ctx positions.
+    :return: Estimated size in bytes.
+    """
+    with GGUFReader(model_path) as reader:
+        n_layers = reader.block_count
+        n_embd = reader.embedding_length
+        n_head = reader.get_arch_field("attention.head_count") or 1
+        n_head_kv = reader.get_arch_field("attention.head_count_kv") or n_head
+        block_bytes = sum(t.n_bytes for t in reader.tensors if t.name.startswith("blk."))
+        other_bytes = sum(t.n_bytes for t in reader.tensors if not t.name.startswith("blk."))
+        n_vocab = len(reader.metadata.get("tokenizer.ggml.tokens", []))
+
+    cpu_share = 1.0 - min(n_gpu_layers, n_layers) / n_layers if n_layers else 1.0
+    # Grouped-query attention stores fewer KV heads than query heads
+    n_embd_kv = n_embd * int(n_head_kv) // int(n_head)
+    kv_bytes = 2 * n_layers * n_ctx * n_embd_kv * 2
+    logits_bytes = n_ctx * n_vocab * 4 if logits_all else 0
+    return int(other_bytes + logits_bytes + (block_bytes + kv_bytes) * cpu_share)
+
+
+def model_key(model_path, n_ctx, n_gpu_layers, n_threads, logits_all=False):
+    """
+    Builds the pool key of a model configuration.
+
+    :return: Tuple (absolute path, n_ctx, n_gpu_layers, n_threads, logits_all).
+    """
+    return (os.path.abspath(model_path), int(n_ctx), int(n_gpu_layers), int(n_threads), bool(logits_all))
+
+
+class ModelPool:
+    def __init__(self, budget_bytes=None, model_factory=None, size_estimator=None):
+        """
+        Keeps several loaded models warm, keyed by (path, n_ctx, n_gpu_layers, n_threads, logits_all).
+        When a new model does not fit in the memory budget, the least recently used
+        models are unloaded first.
+
+        :param budget_bytes: Memory budget in bytes (defaults to 75% of physical RAM).
+        :param model_factory: Callable(model_path, n_ctx, n_gpu_layers, n_threads, logits_all)
+                              returning an unloaded GGUFModel (defaults to GGUFModel).
+        :param size_estimator: Callable(model_path, n_ctx, n_gpu_layers, logits_all) returning
+                               the expected size in bytes (defaults to estimate_model_bytes).
+        """
+        if budget_bytes is None:
+            memory = physical_memory_bytes()
+            budget_bytes = int(memory * DEFAULT_BUDGET_FRACTION) if memory else float("inf")
+        self.budget_bytes = budget_bytes
+        self.model_factory = model_factory or self._default_factory
+        self.size_estimator = size_estimator or estimate_model_bytes
+        self._models = OrderedDict()  # key -> (model, estimated bytes)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _default_factory(model_path, n_ctx, n_gpu_layers, n_threads, logits_all):
+        device = "cuda" if n_gpu_layers > 0 else "cpu"
+        return GGUFModel(model_path, device, n_ctx=n_ctx, n_gpu_layers=n_gpu_layers, n_threads=n_threads,
+                         logits_all=logits_all)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._models
+
+    def __len__(self):
+        with self._lock:
+            return len(self._models)
+
+    def used_bytes(self):
+        """
+        :return: Estimated memory used by the loaded models, in bytes.
+        """
+        with self._lock:
+            return sum(size for _, size in self._models.values())
+
+    def acquire(self, model_path, n_ctx=2048, n_gpu_layers=0, n_threads=8, logits_all=False, stats_workers=1):
+        """
+        Returns a loaded model for the given configuration, reusing a warm instance
+        when one exists and evicting least recently used models to make room otherwise.
+
+        :param model_path: Path to the GGUF model file.
+        :param n_ctx: Context length for the model.
+        :param n_gpu_layers: Number of layers to offload to GPU.
+        :param n_threads: Number of CPU threads for inference.
+        :param logits_all: Keep the logits of every position (see GGUFModel).
+        :param stats_workers: Processes the model uses to compute weight statistics (see
+                              GGUFModel). Not part of the key: it does not change the loaded
+                              model, so a warm instance is just updated.
+        :return: Loaded GGUFModel.
+        """
+        key = model_key(model_path, n_ctx, n_gpu_layers, n_threads, logits_all)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                model = self._models[key][0]
+                model.stats_workers = int(stats_workers)
+                return model
+
+            size = self.size_estimator(model_path, key[1], key[2], key[4])
+            if size > self.budget_bytes:
+                print(f"Model '{model_path}' needs about {size} bytes, more than the pool budget "
+                      f"of {self.budget_bytes} bytes.")
+            while self._models and self.used_bytes() + size > self.budget_bytes:
+                self._unload_key(next(iter(self._models)))
+
+            model = self.model_factory(model_path, key[1], key[2], key[3], key[4])
+            model.stats_workers = int(stats_workers)
+            model.load_model()
+            self._models[key] = (model, size)
+            return model
+
+    def release(self, model):
+        """
+        Unloads a model and removes it from the pool.
+
+        :param model: GGUFModel previously returned by acquire.
+        :return: True if the model was in the pool.
+        """
+        with self._lock:
+            for key, (pooled, _) in self._models.items():
+                if pooled is model:
+                    self._unload_key(key)
+                    return True
+            return False
+
+    def clear(self):
+        """
+        Unloads every model in the pool.
+        """
+        with self._lock:
+            for key in list(self._models):
+                self._unload_key(key)
+
+    def _unload_key(self, key):
+        model, _ = self._models.pop(key)
+        model.unload_model()
+        print(f"Unloaded model '{key[0]}' from the pool.")
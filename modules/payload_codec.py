@@ -0,0 +1,214 @@
+# modules/payload_codec.py
+
+import base64
+import gzip
+import json
+
+import numpy as np
+
+ARRAY_MARKER = "__ndarray__"
+COMPRESSIONS = (None, "gzip", "zstd")
+QUANTIZE_BITS = (None, 8, 16)
+
+# Little-endian dtypes that have a matching JavaScript TypedArray
+_JS_DTYPES = {
+    "float32": "<f4", "float64": "<f8", "int8": "i1", "uint8": "u1",
+    "int16": "<i2", "uint16": "<u2", "int32": "<i4", "uint32": "<u4",
+}
+_QUANTIZED_DTYPES = {8: "uint8", 16: "uint16"}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the 'zstandard' package; use gzip instead.") from None
+    return zstandard
+
+
+def _compress(data, compression):
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == "zstd":
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unknown compression '{compression}'; choose one of {COMPRESSIONS}.")
+
+
+def _decompress(data, compression):
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        return _zstd().ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression '{compression}'.")
+
+
+def encode_array(array, quantize=None, compression=None):
+    """
+    Encodes a NumPy array as a typed, base64 buffer with its shape.
+
+    With quantize=8 or 16 the values are mapped linearly onto uint8/uint16 between the
+    array's minimum and maximum; the decoder restores value = q * scale + offset.
+
+    :param array: Array to encode (floats are sent as float32 unless quantized).
+    :param quantize: None, 8 or 16 bits.
+    :param compression: None, 'gzip' or 'zstd'.
+    :return: JSON-serializable dictionary.
+    """
+    if quantize not in QUANTIZE_BITS:
+        raise ValueError(f"quantize must be one of {QUANTIZE_BITS}.")
+    array = np.asarray(array)
+    payload = {ARRAY_MARKER: 1, "shape": list(array.shape)}
+    if quantize is not None:
+        values = array.astype(np.float32, copy=False)
+        finite = np.isfinite(values)
+        low = float(values[finite].min()) if finite.any() else 0.0
+        high = float(values[finite].max()) if finite.any() else 0.0
+        levels = (1 << quantize) - 1
+        scale = (high - low) / levels if high > low else 1.0
+        quantized = np.rint((np.where(finite, values, low) - low) / scale)
+        dtype = _QUANTIZED_DTYPES[quantize]
+        array = np.clip(quantized, 0, levels).astype(_JS_DTYPES[dtype])
+        payload.update(scale=scale, offset=low)
+    elif array.dtype.kind == "f":
+        dtype = "float32"
+        array = array.astype(_JS_DTYPES[dtype], copy=False)
+    elif array.dtype.kind == "b":
+        dtype = "uint8"
+        array = array.astype(np.uint8)
+    else:
+        if array.dtype.kind in "iu" and array.dtype.itemsize == 8:
+            # JavaScript has no 64-bit typed arrays that behave like numbers; narrow when lossless
+            narrow = np.int32 if array.dtype.kind == "i" else np.uint32
+            info = np.iinfo(narrow)
+            if array.size and (array.min() < info.min or array.max() > info.max):
+                raise ValueError("64-bit integer values do not fit in 32 bits.")
+            array = array.astype(narrow)
+        dtype = array.dtype.name
+        if dtype not in _JS_DTYPES:
+            raise ValueError(f"Arrays of type {dtype} have no JavaScript typed array equivalent.")
+        array = array.astype(_JS_DTYPES[dtype], copy=False)
+    payload["dtype"] = dtype
+    data = _compress(np.ascontiguousarray(array).tobytes(), compression)
+    if compression is not None:
+        payload["compression"] = compression
+    payload["data"] = base64.b64encode(data).decode("ascii")
+    return payload
+
+
+def decode_array(payload):
+    """
+    Decodes a dictionary produced by encode_array (the inverse of the JavaScript decoder).
+
+    :param payload: Encoded array dictionary.
+    :return: NumPy array (float32 when the array was quantized).
+    """
+    data = _decompress(base64.b64decode(payload["data"]), payload.get("compression"))
+    array = np.frombuffer(data, dtype=_JS_DTYPES[payload["dtype"]]).reshape(payload["shape"])
+    if "scale" in payload:
+        array = array.astype(np.float32) * np.float32(payload["scale"]) + np.float32(payload["offset"])
+    return array
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_payload(data, quantize=None, compression=None):
+    """
+    Serializes visualization data to JSON, encoding every NumPy array with encode_array.
+
+    :param data: Nested dictionaries and lists containing NumPy arrays and JSON values.
+    :param quantize: Quantization applied to float arrays (None, 8 or 16).
+    :param compression: Compression applied to every array buffer (None, 'gzip' or 'zstd').
+    :return: JSON string.
+    """
+    def convert(value):
+        if isinstance(value, np.ndarray):
+            return encode_array(value, quantize=quantize if value.dtype.kind == "f" else None,
+                                compression=compression)
+        if isinstance(value, dict):
+            return {key: convert(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [convert(item) for item in value]
+        return value
+
+    return json.dumps(convert(data), default=_json_default, separators=(",", ":"))
+
+
+def decode_payload(text):
+    """
+    Parses a JSON payload from encode_payload, decoding the arrays back to NumPy.
+
+    :param text: JSON string.
+    :return: Decoded data.
+    """
+    def convert(value):
+        if isinstance(value, dict):
+            if value.get(ARRAY_MARKER):
+                return decode_array(value)
+            return {key: convert(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [convert(item) for item in value]
+        return value
+
+    return convert(json.loads(text))
+
+
+# Browser side: window.decodeVisPayload(payload) resolves to the same structure with every
+# encoded array replaced by a TypedArray (Float32Array when quantized) carrying a .shape.
+# gzip uses the built-in DecompressionStream; zstd needs the fzstd library on the page.
+JS_DECODER = """
+window.decodeVisPayload = window.decodeVisPayload || (function () {
+    const TYPES = {float32: Float32Array, float64: Float64Array, int8: Int8Array, uint8: Uint8Array,
+                   int16: Int16Array, uint16: Uint16Array, int32: Int32Array, uint32: Uint32Array};
+    function base64ToBytes(text) {
+        const binary = atob(text);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+        return bytes;
+    }
+    async function inflate(bytes, compression) {
+        if (!compression) return bytes;
+        if (compression === "gzip") {
+            const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+            return new Uint8Array(await new Response(stream).arrayBuffer());
+        }
+        if (compression === "zstd" && window.fzstd) return window.fzstd.decompress(bytes);
+        throw new Error("Unsupported payload compression: " + compression);
+    }
+    async function decodeArray(payload) {
+        const Type = TYPES[payload.dtype];
+        let bytes = await inflate(base64ToBytes(payload.data), payload.compression);
+        if (bytes.byteOffset % Type.BYTES_PER_ELEMENT) bytes = bytes.slice();
+        let values = new Type(bytes.buffer, bytes.byteOffset, bytes.byteLength / Type.BYTES_PER_ELEMENT);
+        if (payload.scale !== undefined) {
+            const restored = new Float32Array(values.length);
+            for (let i = 0; i < values.length; i++) restored[i] = values[i] * payload.scale + payload.offset;
+            values = restored;
+        }
+        values.shape = payload.shape;
+        return values;
+    }
+    async function walk(node) {
+        if (Array.isArray(node)) return Promise.all(node.map(walk));
+        if (node && typeof node === "object") {
+            if (node.__ndarray__) return decodeArray(node);
+            const out = {};
+            for (const key of Object.keys(node)) out[key] = await walk(node[key]);
+            return out;
+        }
+        return node;
+    }
+    return function (payload) {
+        return walk(typeof payload === "string" ? JSON.parse(payload) : payload);
+    };
+})();
+"""
+
+JS_DECODER_SCRIPT = "<script>" + JS_DECODER + "</script>"
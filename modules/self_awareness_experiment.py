@@ -1,5 +1,15 @@
 # self_awareness_experiment.py
 
+import json
+import os
+import time
+from collections import deque
+
+from modules.gguf_model import GENERATION_ERROR
+from modules.inference_scheduler import InferenceScheduler, QueueFullError
+
+BATCH_SESSION_ID = "batch"
+
 def run_self_referential_question(model, question):
     """
     Ask the model self-referential questions and return the response.
@@ -46,3 +56,133 @@ def consciousness_test(model, prompt):
     response = model.generate(prompt)
     # Additional analysis can be performed here.
     return response
+
+EXPERIMENTS = {
+    "self_referential": run_self_referential_question,
+    "mirror": mirror_test,
+    "self_modifying_code": self_modifying_code,
+    "consciousness": consciousness_test,
+}
+
+def load_prompts(source):
+    """
+    Load experiment prompts from a list or a JSONL file.
+
+    :param source: List of prompt strings or dicts, or a path to a JSONL file whose lines
+                   are strings or objects with a "prompt" (and optional "id") field.
+    :return: List of {"id", "prompt"} dictionaries.
+    """
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as f:
+            items = [json.loads(line) for line in f if line.strip()]
+    else:
+        items = list(source)
+    prompts = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"prompt": item}
+        prompts.append({"id": item.get("id", index), "prompt": item["prompt"]})
+    return prompts
+
+def _completed_ids(output_path):
+    if not os.path.exists(output_path):
+        return set()
+    completed = set()
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A partial last line from an interrupted run
+            if "error" not in record:
+                completed.add(record["id"])
+    return completed
+
+def run_batch_experiment(models, prompts, output_path, experiment="self_referential", system_prompt="",
+                         resume=True, window=None):
+    """
+    Run an experiment over many prompts and stream the results to a JSONL file.
+
+    Every prompt is prefixed with the same system prompt. Items that run on the same
+    replica one after another share that prefix, so llama.cpp keeps it in the KV cache
+    and only evaluates each question. With several replicas the items run in parallel.
+
+    :param models: A GGUFModel, a list of model replicas, or a running InferenceScheduler.
+    :param prompts: List of prompts or a JSONL path (see load_prompts).
+    :param output_path: JSONL file receiving one result per line, in input order.
+    :param experiment: Name of the experiment in EXPERIMENTS.
+    :param system_prompt: Text prepended to every prompt.
+    :param resume: Skip prompts already answered in an existing output file.
+    :param window: Maximum number of items in flight (defaults to twice the replica count).
+    :return: Summary dictionary.
+    """
+    experiment_fn = EXPERIMENTS[experiment]
+    items = load_prompts(prompts)
+    done = _completed_ids(output_path) if resume else set()
+    pending = [item for item in items if item["id"] not in done]
+
+    own_scheduler = not isinstance(models, InferenceScheduler)
+    if own_scheduler:
+        replicas = models if isinstance(models, (list, tuple)) else [models]
+        scheduler = InferenceScheduler(replicas, max_queue=max(1, 2 * len(replicas)))
+    else:
+        scheduler = models
+    if window is None:
+        window = 2 * len(scheduler.replicas)
+
+    def make_task(item):
+        def task(model):
+            started = time.perf_counter()
+            response = experiment_fn(model, system_prompt + item["prompt"])
+            # GGUFModel.generate reports failures as text; record them as errors, so a
+            # resumed run retries them
+            if GENERATION_ERROR in response:
+                raise RuntimeError(GENERATION_ERROR)
+            return response, time.perf_counter() - started
+        return task
+
+    summary = {"completed": 0, "failed": 0, "skipped": len(items) - len(pending), "output_path": output_path}
+    started = time.perf_counter()
+    in_flight = deque()
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    try:
+        with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out:
+
+            def write_next():
+                item, job = in_flight.popleft()
+                record = {"id": item["id"], "experiment": experiment, "prompt": item["prompt"]}
+                try:
+                    response, elapsed = job.result()
+                    record.update(response=response, elapsed_s=round(elapsed, 4))
+                    summary["completed"] += 1
+                except Exception as e:
+                    record["error"] = str(e)
+                    summary["failed"] += 1
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+
+            for item in pending:
+                while True:
+                    if len(in_flight) >= window:
+                        write_next()
+                        continue
+                    try:
+                        in_flight.append((item, scheduler.submit(BATCH_SESSION_ID, make_task(item))))
+                        break
+                    except QueueFullError:
+                        # Shared with interactive users: wait for our own work to drain
+                        if in_flight:
+                            write_next()
+                        else:
+                            time.sleep(0.1)
+            while in_flight:
+                write_next()
+    finally:
+        for _, job in in_flight:
+            job.cancel()
+        if own_scheduler:
+            scheduler.shutdown()
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return summary
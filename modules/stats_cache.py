@@ -0,0 +1,258 @@
+# modules/stats_cache.py
+
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from modules.gguf_reader import GGUFReader
+from modules.weight_stats import DEFAULT_BINS, TensorStats, compute_model_stats, layer_statistics
+
+DEFAULT_CACHE_DIR = os.path.join('outputs', 'cache', 'stats')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CACHE_FORMAT_VERSION = 1
+
+_LAYER_FIELDS = ("parameters", "mean_abs", "sparsity", "min", "max", "tensors")
+
+
+def file_fingerprint(reader, *extra):
+    """
+    Fingerprints a GGUF file by path, size, modification time and a hash of its
+    header. Only the header bytes are hashed, never the tensor data.
+
+    :param reader: Open GGUFReader of the file.
+    :param extra: Additional values that change the cached result (e.g. histogram bins).
+    :return: Hex digest identifying the file contents and settings.
+    """
+    st = os.stat(reader.path)
+    header_hash = hashlib.sha256(reader.header_bytes()).hexdigest()
+    key = "|".join(str(part) for part in (CACHE_FORMAT_VERSION, os.path.abspath(reader.path),
+                                          st.st_size, st.st_mtime_ns, header_hash) + extra)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class StatsCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        On-disk cache of computed model statistics, one compressed .npz file per model.
+        Entries are evicted least-recently-used first once the cache exceeds max_bytes.
+
+        :param cache_dir: Directory holding the cache files.
+        :param max_bytes: Maximum total size of the cache in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Loads cached statistics.
+
+        :param key: Fingerprint from file_fingerprint.
+        :return: Tuple (tensor stats dict, layer stats dict), or None on a cache miss.
+        """
+        return self.get_arrays(key, decode=_decode)
+
+    def put(self, key, tensor_stats, layer_stats=None):
+        """
+        Stores statistics and evicts old entries if the cache is over budget.
+
+        :param key: Fingerprint from file_fingerprint.
+        :param tensor_stats: Dictionary mapping tensor names to TensorStats.
+        :param layer_stats: Per-layer statistics (computed from tensor_stats if omitted).
+        """
+        if layer_stats is None:
+            layer_stats = layer_statistics(tensor_stats)
+        self.put_arrays(key, _encode(tensor_stats, layer_stats))
+
+    def get_arrays(self, key, decode=dict):
+        """
+        Loads a cache entry as arrays.
+
+        :param key: Entry key.
+        :param decode: Callable turning the open .npz file into the returned value.
+        :return: Decoded entry, or None on a cache miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                entry = decode(npz)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            if os.path.exists(path):
+                print(f"Discarding unreadable cache entry '{path}': {e}")
+                os.remove(path)
+            return None
+        # Loading counts as a use for LRU eviction
+        os.utime(path)
+        return entry
+
+    def put_arrays(self, key, arrays):
+        """
+        Stores a dictionary of arrays and evicts old entries if the cache is over budget.
+
+        :param key: Entry key.
+        :param arrays: Dictionary mapping names to NumPy arrays.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=key)
+
+    def lookup(self, model_file, bins=DEFAULT_BINS, zero_threshold=0.0):
+        """
+        Returns cached statistics for a GGUF file without computing them on a miss.
+
+        :param model_file: Path to a GGUF file or an open GGUFReader.
+        :param bins: Number of histogram bins.
+        :param zero_threshold: Threshold for the sparsity count.
+        :return: Tuple (tensor stats dict, layer stats dict), or None if they are not cached.
+        """
+        reader = model_file if isinstance(model_file, GGUFReader) else GGUFReader(model_file)
+        try:
+            return self.get(file_fingerprint(reader, bins, zero_threshold))
+        finally:
+            if reader is not model_file:
+                reader.close()
+
+    def get_or_compute(self, model_file, bins=DEFAULT_BINS, zero_threshold=0.0, workers=1, compute=None):
+        """
+        Returns cached statistics for a GGUF file, computing and storing them on a miss.
+
+        :param model_file: Path to a GGUF file or an open GGUFReader.
+        :param bins: Number of histogram bins.
+        :param zero_threshold: Threshold for the sparsity count.
+        :param workers: Worker processes used on a miss (results do not depend on it).
+        :param compute: Optional callable(reader) returning tensor stats (defaults to
+                        compute_model_stats with the given settings).
+        :return: Tuple (tensor stats dict, layer stats dict).
+        """
+        reader = model_file if isinstance(model_file, GGUFReader) else GGUFReader(model_file)
+        try:
+            key = file_fingerprint(reader, bins, zero_threshold)
+            entry = self.get(key)
+            if entry is not None:
+                return entry
+            if compute is None:
+                tensor_stats = compute_model_stats(reader, bins=bins, zero_threshold=zero_threshold,
+                                                   workers=workers)
+            else:
+                tensor_stats = compute(reader)
+            layer_stats = layer_statistics(tensor_stats)
+            self.put(key, tensor_stats, layer_stats)
+            return tensor_stats, layer_stats
+        finally:
+            if reader is not model_file:
+                reader.close()
+
+    def entries(self):
+        """
+        Lists cache entries, least recently used first.
+
+        :return: List of (path, size in bytes, last use time) tuples.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                st = entry.stat()
+                entries.append((entry.path, st.st_size, st.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def total_bytes(self):
+        """
+        :return: Total size of the cache in bytes.
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Removes least-recently-used entries until the cache fits in max_bytes.
+
+        :param keep: Optional key that must not be evicted (the entry just written).
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        keep_path = self._entry_path(keep) if keep else None
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Removes every cache entry.
+        """
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+
+def _encode(tensor_stats, layer_stats):
+    stats = list(tensor_stats.values())
+    bins = max((len(s.histogram) for s in stats), default=0)
+    histograms = np.zeros((len(stats), bins), dtype=np.int64)
+    for i, s in enumerate(stats):
+        histograms[i, :len(s.histogram)] = s.histogram
+    moments = np.array([s.moments[1:6] for s in stats], dtype=np.float64).reshape(len(stats), 5)
+    layer_ids = sorted(layer_stats)
+    arrays = {
+        "names": np.array([s.name for s in stats], dtype=np.str_),
+        "dtypes": np.array([s.type_name for s in stats], dtype=np.str_),
+        "ndims": np.array([len(s.shape) for s in stats], dtype=np.int64),
+        "shapes": np.array([d for s in stats for d in s.shape], dtype=np.int64),
+        "counts": np.array([s.moments[0] for s in stats], dtype=np.int64),
+        "zeros": np.array([s.moments[6] for s in stats], dtype=np.int64),
+        # mean, m2, sum_abs, min, max
+        "moments": moments,
+        "histograms": histograms,
+        "hist_bins": np.array([len(s.histogram) for s in stats], dtype=np.int64),
+        "hist_ranges": np.array([s.hist_range for s in stats], dtype=np.float64).reshape(len(stats), 2),
+        "layer_ids": np.array(layer_ids, dtype=np.int64),
+    }
+    for field in _LAYER_FIELDS:
+        arrays[f"layer_{field}"] = np.array([layer_stats[i][field] for i in layer_ids])
+    return arrays
+
+
+def _decode(npz):
+    # Every npz[...] access reads and decompresses the whole array again, so each one is
+    # read once here and the loop indexes the in-memory copies
+    tensor_stats = {}
+    shapes = npz["shapes"].tolist()
+    ndims = npz["ndims"].tolist()
+    counts = npz["counts"].tolist()
+    zeros = npz["zeros"].tolist()
+    moments = npz["moments"].tolist()
+    histograms = npz["histograms"]
+    hist_bins = npz["hist_bins"].tolist()
+    hist_ranges = npz["hist_ranges"].tolist()
+    dtypes = npz["dtypes"].tolist()
+    position = 0
+    for i, name in enumerate(npz["names"].tolist()):
+        shape = shapes[position:position + ndims[i]]
+        position += ndims[i]
+        mean, m2, sum_abs, vmin, vmax = moments[i]
+        tensor_stats[name] = TensorStats(name, dtypes[i], shape,
+                                         (counts[i], mean, m2, sum_abs, vmin, vmax, zeros[i]),
+                                         histograms[i, :hist_bins[i]], tuple(hist_ranges[i]))
+    layer_stats = {}
+    columns = {field: npz[f"layer_{field}"].tolist() for field in _LAYER_FIELDS}
+    for j, index in enumerate(npz["layer_ids"].tolist()):
+        layer_stats[index] = {field: columns[field][j] for field in _LAYER_FIELDS}
+    return tensor_stats, layer_stats
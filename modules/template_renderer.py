@@ -0,0 +1,243 @@
+# modules/template_renderer.py
+
+import hashlib
+import html
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from modules.payload_codec import JS_DECODER
+
+PAYLOAD_ROUTE = "/visualization/payload"
+DEFAULT_STORE_BYTES = 256 * 1024 * 1024
+MAX_PAYLOAD_KEYS = 256
+
+# Placeholders are {{name}}, so templates keep plain JavaScript braces
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# Fetches a payload by URL. Payload URLs are content addressed, so the browser cache
+# (or an If-None-Match revalidation answered with 304) means unchanged data is not sent again.
+JS_LOADER = """
+window.loadVisPayload = window.loadVisPayload || function (url) {
+    return fetch(url).then(function (response) {
+        if (!response.ok) throw new Error("Payload " + url + " is no longer available; reload the view.");
+        return response.text();
+    }).then(window.decodeVisPayload);
+};
+"""
+
+
+class PayloadStore:
+    def __init__(self, max_bytes=DEFAULT_STORE_BYTES):
+        """
+        In-memory LRU of encoded payloads, keyed by a hash of their content, which is
+        also their ETag.
+
+        :param max_bytes: Total payload size kept; the least recently used are evicted.
+        """
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self._payloads = OrderedDict()
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def __contains__(self, payload_id):
+        return payload_id in self._payloads
+
+    @staticmethod
+    def payload_id(payload):
+        """
+        :param payload: Payload text or bytes.
+        :return: Content hash identifying the payload.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()[:24]
+
+    def put(self, payload):
+        """
+        Stores a payload. Storing identical content again only refreshes it.
+
+        :param payload: Payload text (e.g. from payload_codec.encode_payload) or bytes.
+        :return: Payload ID.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        payload_id = self.payload_id(payload)
+        with self._lock:
+            if payload_id in self._payloads:
+                self._payloads.move_to_end(payload_id)
+                return payload_id
+            self._payloads[payload_id] = payload
+            self.n_bytes += len(payload)
+            # The newest payload is kept even when it alone exceeds the budget
+            while self.n_bytes > self.max_bytes and len(self._payloads) > 1:
+                _, evicted = self._payloads.popitem(last=False)
+                self.n_bytes -= len(evicted)
+        return payload_id
+
+    def get_or_put(self, key, build):
+        """
+        Returns the payload stored for a key, building and storing it only when it is
+        missing, so unchanged data is not serialized again.
+
+        :param key: Hashable description of the data (e.g. the model path and the capture).
+        :param build: Callable returning the payload text.
+        :return: Payload ID.
+        """
+        with self._lock:
+            payload_id = self._keys.get(key)
+            if payload_id in self._payloads:
+                self._keys.move_to_end(key)
+                return payload_id
+        payload_id = self.put(build())
+        with self._lock:
+            self._keys[key] = payload_id
+            if len(self._keys) > MAX_PAYLOAD_KEYS:
+                self._keys.popitem(last=False)
+        return payload_id
+
+    def get(self, payload_id):
+        """
+        :param payload_id: Payload ID.
+        :return: Payload bytes, or None if unknown or evicted.
+        """
+        with self._lock:
+            payload = self._payloads.get(payload_id)
+            if payload is not None:
+                self._payloads.move_to_end(payload_id)
+            return payload
+
+    def respond(self, payload_id, if_none_match=None):
+        """
+        Builds the HTTP response for a payload request.
+
+        :param payload_id: Requested payload ID.
+        :param if_none_match: Value of the request's If-None-Match header, if any.
+        :return: Tuple (status, headers, body); 304 with an empty body when the client
+                 already has this payload, 404 when it is unknown.
+        """
+        payload = self.get(payload_id)
+        if payload is None:
+            return 404, {}, b""
+        etag = f'"{payload_id}"'
+        # The content never changes under an ID, so it may be cached indefinitely
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable",
+                   "Content-Type": "application/json"}
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            if "*" in tags or etag in tags or f"W/{etag}" in tags:
+                return 304, headers, b""
+        return 200, headers, payload
+
+
+class CompiledTemplate:
+    def __init__(self, source):
+        """
+        A template split once into literal text and {{name}} placeholders, so rendering
+        is a join rather than a parse.
+
+        :param source: Template text.
+        """
+        self.source = source
+        pieces = _PLACEHOLDER.split(source)
+        self._literals = pieces[0::2]
+        self._names = pieces[1::2]
+
+    @property
+    def fields(self):
+        """Names of the placeholders, in order of first appearance."""
+        return list(dict.fromkeys(self._names))
+
+    def render(self, **values):
+        """
+        :param values: Text for each placeholder.
+        :return: Rendered text.
+        """
+        missing = set(self._names) - set(values)
+        if missing:
+            raise KeyError(f"Missing template values: {', '.join(sorted(missing))}.")
+        parts = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            parts.append(str(values[name]))
+            parts.append(literal)
+        return "".join(parts)
+
+
+class TemplateRenderer:
+    def __init__(self, store=None, route=PAYLOAD_ROUTE):
+        """
+        Renders visualization templates as iframe pages. Templates are compiled once at
+        registration; data is stored in a PayloadStore and referenced by ID. Until the
+        payload route is mounted (see mount), payloads are embedded in the page instead.
+
+        Templates write {{load_payload}} where they need the data: it becomes a JavaScript
+        expression resolving to the decoded payload (see payload_codec.JS_DECODER).
+
+        :param store: PayloadStore, or None for a new one.
+        :param route: URL path under which payloads are served.
+        """
+        self.store = store if store is not None else PayloadStore()
+        self.route = route
+        self.mounted = False
+        self.templates = {}
+
+    def register(self, name, source):
+        """
+        :param name: Template name.
+        :param source: Template text with {{name}} placeholders, including {{load_payload}}.
+        :return: CompiledTemplate.
+        """
+        template = CompiledTemplate(source)
+        if "load_payload" not in template.fields:
+            raise ValueError(f"Template '{name}' does not use {{{{load_payload}}}}.")
+        self.templates[name] = template
+        return template
+
+    def payload_url(self, payload_id):
+        return f"{self.route}/{payload_id}"
+
+    def render(self, name, payload_id, frame_height=600, **values):
+        """
+        Renders a registered template for a stored payload.
+
+        :param name: Template name.
+        :param payload_id: ID returned by store.put or store.get_or_put.
+        :param frame_height: Height of the iframe in pixels.
+        :param values: Values of the template's other placeholders.
+        :return: HTML string.
+        """
+        if self.mounted:
+            load = f"window.loadVisPayload({json.dumps(self.payload_url(payload_id))})"
+        else:
+            payload = self.store.get(payload_id)
+            if payload is None:
+                raise KeyError(f"Payload {payload_id} is not in the store.")
+            # "</" is escaped so the payload cannot close the script element
+            text = payload.decode("utf-8").replace("</", "<\\/")
+            load = f"window.decodeVisPayload({text})"
+        page = self.templates[name].render(load_payload=load, **values)
+        page = f"<!DOCTYPE html>\n<script>{JS_DECODER}{JS_LOADER}</script>\n{page}"
+        # Gradio does not run scripts inserted into an HTML component, so pages are iframes
+        return f'<iframe srcdoc="{html.escape(page)}" style="width:100%;height:{int(frame_height)}px;border:0"></iframe>'
+
+    def mount(self, app):
+        """
+        Adds the payload route to a Starlette or FastAPI application (such as the one
+        gradio.mount_gradio_app returns); pages rendered afterwards load their data by reference.
+
+        :param app: Application to add the route to.
+        """
+        from starlette.responses import Response
+
+        async def serve_payload(request):
+            status, headers, body = self.store.respond(request.path_params["payload_id"],
+                                                       request.headers.get("if-none-match"))
+            return Response(body, status_code=status, headers=headers)
+
+        app.add_route(self.route + "/{payload_id}", serve_payload, methods=["GET"])
+        self.mounted = True
@@ -0,0 +1,265 @@
+# modules/token_index.py
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from modules.embedding_projection import EMBEDDING_TENSOR, embedding_info, iter_embedding_rows
+from modules.stats_cache import file_fingerprint
+from modules.weight_stats import DEFAULT_CHUNK_BYTES
+
+INDEX_FORMAT_VERSION = 1
+INDEX_SUFFIX = '.tokenindex'
+DEFAULT_PROBES = 8
+DEFAULT_KMEANS_ITERATIONS = 10
+DEFAULT_TRAINING_ROWS = 32768
+DEFAULT_TRAINING_BYTES = 256 * 1024 * 1024  # Size of the float16 k-means training set
+
+
+def default_index_dir(model_path, tensor_name=EMBEDDING_TENSOR):
+    """
+    :return: Directory the index of a model is persisted to, next to the model file.
+    """
+    suffix = INDEX_SUFFIX if tensor_name == EMBEDDING_TENSOR else f".{tensor_name}{INDEX_SUFFIX}"
+    return model_path + suffix
+
+
+def _normalize(rows):
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    return rows / np.maximum(norms, 1e-12)
+
+
+def default_list_count(n_rows):
+    """
+    :return: Number of IVF lists for n_rows vectors (about 2 * sqrt(n), as usual for IVF).
+    """
+    return int(max(1, min(n_rows, round(2 * np.sqrt(n_rows)))))
+
+
+def spherical_kmeans(vectors, n_lists, iterations=DEFAULT_KMEANS_ITERATIONS, seed=0, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Clusters unit vectors by cosine similarity.
+
+    :param vectors: (n, d) float16 or float32 unit vectors.
+    :param n_lists: Number of clusters.
+    :param iterations: Lloyd iterations.
+    :param seed: Seed of the initial centroids.
+    :param chunk_bytes: Approximate size of the float32 rows scored against the centroids at a time.
+    :return: (n_lists, d) float32 unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].astype(np.float32)
+    # Batches are converted to float32, so their size bounds the working memory
+    batch_rows = max(1, chunk_bytes // (4 * vectors.shape[1]))
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        counts = np.zeros(n_lists, dtype=np.int64)
+        for start in range(0, len(vectors), batch_rows):
+            batch = vectors[start:start + batch_rows].astype(np.float32)
+            labels = np.argmax(batch @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            present, starts = np.unique(labels[order], return_index=True)
+            sums[present] += np.add.reduceat(batch[order], starts, axis=0)
+            counts += np.bincount(labels, minlength=n_lists)
+        # Empty clusters are reseeded on random vectors
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+class TokenIndex:
+    def __init__(self, index_dir, vectors, centroids, offsets, token_ids, fingerprint=None):
+        """
+        Inverted-file (IVF) index of unit-normalized token embeddings for top-k cosine
+        queries. The float16 vectors are stored sorted by cluster, so each inverted list
+        is one contiguous slice of a memory-mapped .npy file; a query scores the centroids,
+        then only the vectors of the closest lists.
+
+        :param index_dir: Directory the index is stored in.
+        :param vectors: (n, d) float16 unit vectors ordered by list (usually a memmap).
+        :param centroids: (n_lists, d) float32 unit centroids.
+        :param offsets: (n_lists + 1,) start of each list in vectors.
+        :param token_ids: (n,) token id of each row of vectors.
+        :param fingerprint: Fingerprint of the model file the index was built from.
+        """
+        self.index_dir = index_dir
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.token_ids = token_ids
+        self.fingerprint = fingerprint
+        self._positions = np.empty(len(token_ids), dtype=np.int64)
+        self._positions[token_ids] = np.arange(len(token_ids))
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def load(cls, index_dir):
+        """
+        Opens a persisted index; the vectors are memory-mapped, not read.
+
+        :param index_dir: Index directory.
+        :return: TokenIndex.
+        """
+        with open(os.path.join(index_dir, 'index.json'), 'r') as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported token index version {meta.get('version')}.")
+        return cls(index_dir,
+                   np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(index_dir, 'centroids.npy')),
+                   np.load(os.path.join(index_dir, 'offsets.npy')),
+                   np.load(os.path.join(index_dir, 'token_ids.npy')),
+                   fingerprint=meta.get("fingerprint"))
+
+    @classmethod
+    def open_or_build(cls, reader, index_dir=None, tensor_name=EMBEDDING_TENSOR, **build_options):
+        """
+        Opens the index persisted for a model, rebuilding it if it is missing, unreadable
+        or was built from a different file.
+
+        :param reader: Open GGUFReader of the model.
+        :param index_dir: Index directory (defaults to one next to the model file).
+        :param tensor_name: Embedding tensor.
+        :param build_options: Options passed to build_token_index on a rebuild.
+        :return: TokenIndex.
+        """
+        if index_dir is None:
+            index_dir = default_index_dir(reader.path, tensor_name)
+        fingerprint = file_fingerprint(reader, "tokenindex", tensor_name)
+        try:
+            index = cls.load(index_dir)
+            if index.fingerprint == fingerprint:
+                return index
+            print(f"Token index '{index_dir}' is out of date; rebuilding.")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Discarding unreadable token index '{index_dir}': {e}")
+        return build_token_index(reader, index_dir, tensor_name=tensor_name, fingerprint=fingerprint,
+                                 **build_options)
+
+    def vector(self, token_id):
+        """
+        :return: Unit embedding of a token as float32.
+        """
+        return np.asarray(self.vectors[self._positions[token_id]], dtype=np.float32)
+
+    def search(self, query, k=10, probes=DEFAULT_PROBES, exclude=None):
+        """
+        Finds the tokens with the highest cosine similarity to a query.
+
+        :param query: Query vector (any norm) or token id.
+        :param k: Number of results.
+        :param probes: Inverted lists scanned; n_lists makes the search exact.
+        :param exclude: Optional token id left out of the results (the query token by default).
+        :return: List of (token id, cosine similarity) pairs, most similar first.
+        """
+        if isinstance(query, (int, np.integer)):
+            if exclude is None:
+                exclude = int(query)
+            query = self.vector(query)
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        probes = min(max(1, probes), self.n_lists)
+        lists = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        best_ids, best_scores = [], []
+        for list_id in np.sort(lists):
+            start, end = int(self.offsets[list_id]), int(self.offsets[list_id + 1])
+            if start == end:
+                continue
+            scores = np.asarray(self.vectors[start:end], dtype=np.float32) @ query
+            best_ids.append(self.token_ids[start:end])
+            best_scores.append(scores)
+        if not best_ids:
+            return []
+        ids = np.concatenate(best_ids)
+        scores = np.concatenate(best_scores)
+        if exclude is not None:
+            scores[ids == exclude] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def build_token_index(reader, index_dir, tensor_name=EMBEDDING_TENSOR, n_lists=None,
+                      iterations=DEFAULT_KMEANS_ITERATIONS, training_rows=DEFAULT_TRAINING_ROWS,
+                      training_bytes=DEFAULT_TRAINING_BYTES, seed=0, chunk_bytes=DEFAULT_CHUNK_BYTES, fingerprint=None):
+    """
+    Builds and persists the IVF index of an embedding tensor. The tensor is streamed
+    twice in dequantized chunks: once to assign every row to a cluster and once to write
+    the rows into their list's slice of the vectors file.
+
+    :param reader: Open GGUFReader.
+    :param index_dir: Directory to store the index in (replaced if it exists).
+    :param tensor_name: Embedding tensor.
+    :param n_lists: Number of inverted lists (defaults to default_list_count).
+    :param iterations: k-means iterations.
+    :param training_rows: Rows sampled to train the centroids.
+    :param training_bytes: Memory budget of the float16 training set, which caps training_rows
+                           for wide embeddings (never below n_lists rows).
+    :param seed: Random seed.
+    :param chunk_bytes: Approximate size of the float32 rows dequantized at a time.
+    :param fingerprint: Fingerprint stored with the index (computed if omitted).
+    :return: TokenIndex.
+    """
+    info = embedding_info(reader, tensor_name)
+    n_columns, n_rows = info.dims
+    if fingerprint is None:
+        fingerprint = file_fingerprint(reader, "tokenindex", tensor_name)
+    n_lists = min(n_lists or default_list_count(n_rows), n_rows)
+
+    rng = np.random.default_rng(seed)
+    n_training = max(n_lists, min(training_rows, training_bytes // (2 * n_columns)))
+    sample = np.sort(rng.choice(n_rows, size=min(n_training, n_rows), replace=False))
+    # Unit vectors lose little in float16, and it halves the largest allocation of the build
+    training = np.empty((len(sample), n_columns), dtype=np.float16)
+    for position, rows in iter_embedding_rows(reader, info, sample, chunk_bytes):
+        training[position:position + len(rows)] = _normalize(rows)
+    centroids = spherical_kmeans(training, n_lists, iterations=iterations, seed=seed, chunk_bytes=chunk_bytes)
+    del training
+
+    labels = np.empty(n_rows, dtype=np.int64)
+    for position, rows in iter_embedding_rows(reader, info, None, chunk_bytes):
+        labels[position:position + len(rows)] = np.argmax(_normalize(rows) @ centroids.T, axis=1)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+    token_ids = np.argsort(labels, kind="stable")
+    slots = np.empty(n_rows, dtype=np.int64)
+    slots[token_ids] = np.arange(n_rows)
+
+    # Written to a sibling directory and swapped in, so a crash never leaves a partial index
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tokenindex-")
+    try:
+        vectors = np.lib.format.open_memmap(os.path.join(tmp_dir, 'vectors.npy'), mode='w+',
+                                            dtype=np.float16, shape=(n_rows, n_columns))
+        for position, rows in iter_embedding_rows(reader, info, None, chunk_bytes):
+            vectors[slots[position:position + len(rows)]] = _normalize(rows)
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(tmp_dir, 'centroids.npy'), centroids)
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+        np.save(os.path.join(tmp_dir, 'token_ids.npy'), token_ids)
+        with open(os.path.join(tmp_dir, 'index.json'), 'w') as f:
+            json.dump({"version": INDEX_FORMAT_VERSION, "fingerprint": fingerprint, "tensor": tensor_name,
+                       "rows": n_rows, "columns": n_columns, "lists": n_lists}, f, indent=2)
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+        os.replace(tmp_dir, index_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return TokenIndex.load(index_dir)
@@ -1,39 +1,100 @@
 # modules/visualization_tool.py
 
-import json
+import numpy as np
+
+from modules.lod_pyramid import pyramid_from_array
+from modules.embedding_projection import embedding_info, iter_embedding_rows
+
+EMBEDDING_VIEW_TOKENS = 5000  # Tokens plotted in the embedding view
+
+def get_attention_pyramid(capture=None):
+    """
+    Level-of-detail pyramid of the attention view, so it is sent one bounded tile at a
+    time (see TensorPyramid.tile) however long the context is.
+
+    :param capture: Optional CaptureBuffer from GGUFModel.generate_with_capture; its
+                    per-position top-k probabilities replace the example attention matrix.
+    :return: TensorPyramid with one row per position.
+    """
+    if capture is not None and len(capture):
+        # Rows are captured positions, columns the probabilities of the top-k tokens
+        return pyramid_from_array("captured top-k probabilities", capture.snapshot()["top_probs"])
+    # Example: Get attention weights
+    attention_weights = np.array([
+        [0.1, 0.2, 0.3],
+        [0.2, 0.3, 0.4],
+        [0.3, 0.4, 0.5]
+    ], dtype=np.float32)
+    return pyramid_from_array("example attention", attention_weights)
 
 def get_visualization_data(model):
     """
-    Retrieve and prepare data for standard visualizations.
+    Retrieve and prepare data for the weight visualization. This needs the statistics of
+    every tensor, so the first call on an uncached model reads the whole file.
 
     :param model: Instance of GGUFModel.
-    :return: Dictionary containing data for various visualizations.
+    :return: Dictionary of NumPy arrays for the visualizations (see payload_codec.encode_payload).
     """
     if model is None:
         return {}
 
-    # Example: Get attention weights
-    attention_weights = [
-        [0.1, 0.2, 0.3],
-        [0.2, 0.3, 0.4],
-        [0.3, 0.4, 0.5]
-    ]
+    # Mean absolute weight of each transformer block, streamed from the GGUF file
+    weights = np.array([layer["mean_abs"] for layer in model.get_layer_statistics().values()], dtype=np.float32)
 
-    # Example: Get model weights
-    weights = [0.5, 0.6, 0.7, 0.8, 0.9]
+    # Prepare data dictionary
+    data = {
+        "weights": weights
+    }
+
+    return data
 
-    # Example: Get node embeddings
-    embeddings = [
-        [1.0, 2.0, 3.0],
-        [2.0, 3.0, 4.0],
-        [3.0, 4.0, 5.0]
-    ]
+def get_embedding_visualization_data(model):
+    """
+    Retrieve and prepare data for the embedding visualization. Only the embedding tensor
+    is read, and only until its projection is cached.
+
+    :param model: Instance of GGUFModel.
+    :return: Dictionary of NumPy arrays for the visualizations (see payload_codec.encode_payload).
+    """
+    if model is None:
+        return {}
+
+    # Token embeddings projected to 3D by randomized PCA, for a sample of the vocabulary
+    try:
+        projection = model.get_embedding_projection(n_components=3, sample=EMBEDDING_VIEW_TOKENS)
+        embeddings, embedding_ids = projection.coords, projection.token_ids
+    except (KeyError, ValueError, NotImplementedError) as e:
+        print(f"Embedding projection unavailable: {e}")
+        embeddings = np.zeros((0, 3), dtype=np.float32)
+        embedding_ids = np.zeros(0, dtype=np.int64)
 
     # Prepare data dictionary
     data = {
-        "attention": attention_weights,
-        "weights": weights,
-        "embeddings": embeddings
+        "embeddings": embeddings,
+        "embedding_ids": embedding_ids
     }
 
     return data
+
+def get_token_neighbourhood(model, token_id, k=10):
+    """
+    Finds the nearest tokens to a token by cosine similarity of their embeddings and
+    places them in the embedding view, so they can be highlighted on the plot.
+
+    :param model: Instance of GGUFModel.
+    :param token_id: Query token id.
+    :param k: Number of neighbours.
+    :return: Dictionary with "neighbours" ((token id, cosine similarity) pairs) and the
+             "highlight" (m, 3) coordinates of the query token and its neighbours, whose
+             ids are in "highlight_ids".
+    """
+    neighbours = model.get_token_index().search(int(token_id), k=k)
+    ids = np.array([int(token_id)] + [i for i, _ in neighbours], dtype=np.int64)
+    # The plotted sample may not contain these tokens; read their rows and project them the same way
+    reader = model.get_reader()
+    order = np.argsort(ids)
+    rows = np.concatenate([chunk for _, chunk in iter_embedding_rows(reader, embedding_info(reader), ids[order])])
+    projection = model.get_embedding_projection(n_components=3, sample=EMBEDDING_VIEW_TOKENS)
+    coords = np.empty((len(ids), len(projection.components)), dtype=np.float32)
+    coords[order] = projection.project(rows)
+    return {"neighbours": neighbours, "highlight": coords, "highlight_ids": ids}
@@ -1,57 +1,371 @@
 # visualization_utils.py
 
 import numpy as np
-import json
+from modules.payload_codec import encode_payload
+from modules.embedding_projection import project_array
 
-def prepare_layer_visualization_data(input_text, output_text):
+def prepare_token_visualization_data(token_data, compression=None):
     """
-    Prepare data for visualizing input and output text in 3D.
+    Prepare the token-level view of a text (see GGUFModel.get_token_data).
 
-    :param input_text: Input text string.
-    :param output_text: Generated output text string.
-    :return: JSON data suitable for 3D visualization.
+    :param token_data: Dictionary with "token_ids", "positions", "logprobs", "pieces" and "source".
+    :param compression: Optional 'gzip' or 'zstd' compression of the buffers.
+    :return: JSON payload with the arrays sent as typed buffers and the token pieces as strings.
     """
-    # Example: Convert text to ASCII codes for visualization
-    input_codes = [ord(c) for c in input_text]
-    output_codes = [ord(c) for c in output_text]
-
-    # Generate 3D coordinates (placeholder example)
-    input_coords = [{"x": i, "y": code, "z": 0} for i, code in enumerate(input_codes)]
-    output_coords = [{"x": i, "y": code, "z": 1} for i, code in enumerate(output_codes)]
-
     data = {
-        "input": input_coords,
-        "output": output_coords
+        "token_ids": np.asarray(token_data["token_ids"], dtype=np.int32),
+        "positions": np.asarray(token_data["positions"], dtype=np.int32),
+        "logprobs": np.asarray(token_data["logprobs"], dtype=np.float32),
+        "pieces": list(token_data["pieces"]),
+        "source": token_data["source"],
     }
-    return json.dumps(data)
+    return encode_payload(data, compression=compression)
 
-def prepare_attention_data(attention_weights):
+def prepare_attention_data(attention_weights, quantize=None, compression=None):
     """
     Prepare attention weights for visualization.
 
     :param attention_weights: Attention weights from the model.
-    :return: JSON data suitable for heatmap or graph visualization.
+    :param quantize: Optional 8 or 16 bit quantization of the values.
+    :param compression: Optional 'gzip' or 'zstd' compression of the buffer.
+    :return: JSON payload of the encoded attention matrix.
     """
-    data = attention_weights.tolist()
-    return json.dumps(data)
+    data = np.asarray(attention_weights, dtype=np.float32)
+    return encode_payload(data, quantize=quantize, compression=compression)
 
-def prepare_weight_data(weights):
+def prepare_weight_data(weights, quantize=8, compression=None):
     """
-    Prepare model weights for visualization.
+    Prepare model weights for visualization. The weights are sent as one typed buffer
+    (x is the index in the flattened array, y the value) rather than a point per weight.
 
     :param weights: Model weights.
-    :return: JSON data suitable for 3D visualization.
+    :param quantize: 8 or 16 bit quantization of the values, or None for float32.
+    :param compression: Optional 'gzip' or 'zstd' compression of the buffer.
+    :return: JSON payload of the encoded weights, keeping their shape.
     """
-    flattened_weights = weights.flatten()
-    coords = [{"x": i, "y": w, "z": 0} for i, w in enumerate(flattened_weights)]
-    return json.dumps(coords)
+    return encode_payload(np.asarray(weights), quantize=quantize, compression=compression)
 
 def prepare_embedding_data(embeddings):
     """
     Prepare node embeddings for visualization.
 
-    :param embeddings: Node embeddings from the model.
-    :return: JSON data suitable for 3D visualization.
+    :param embeddings: Node embeddings from the model; wider than 3 columns, they are
+                       projected onto their 3 leading principal components.
+    :return: JSON payload of an (n, 3) float32 coordinate array.
+    """
+    coords = np.asarray(embeddings, dtype=np.float32)
+    if coords.shape[1] > 3:
+        coords = project_array(coords, n_components=3).coords
+    return encode_payload(coords)
+
+def prepare_tile_data(tile, field=None, quantize=8, compression=None):
+    """
+    Prepare one level-of-detail tile (see lod_pyramid.TensorPyramid.tile) for visualization.
+
+    :param tile: Tile dictionary.
+    :param field: Optional 'mean', 'min' or 'max': only that array is sent.
+    :param quantize: 8 or 16 bit quantization of the min, max and mean arrays, or None for float32.
+    :param compression: Optional 'gzip' or 'zstd' compression of the buffers.
+    :return: JSON payload of the tile.
+    """
+    if field is not None:
+        if field not in ("mean", "min", "max"):
+            raise ValueError("field must be 'mean', 'min' or 'max'.")
+        tile = {key: value for key, value in tile.items() if key not in ("mean", "min", "max") or key == field}
+    return encode_payload(tile, quantize=quantize, compression=compression)
+
+# D3 views, rendered by template_renderer.TemplateRenderer: {{load_payload}} resolves
+# to the decoded visualization data
+TOKEN_TEMPLATE = """<script src="https://d3js.org/d3.v7.min.js"></script>
+<div id="token-summary" style="font:12px sans-serif"></div>
+<canvas id="token-strip" width="800" height="120" style="width:100%;cursor:crosshair"></canvas>
+<div id="token-text" style="font:13px monospace;white-space:pre-wrap;max-height:420px;overflow:auto"></div>
+<script>
+    {{load_payload}}.then(function (data) {
+
+    // One column per pixel: long texts are pooled to the largest surprise in each column
+    const WINDOW = 2000;  // Tokens shown as text around the selected position
+    const count = data.token_ids.length;
+    const scored = data.logprobs.some(v => !isNaN(v));
+    const canvas = document.getElementById("token-strip");
+    const ctx = canvas.getContext("2d");
+    const columns = canvas.width;
+    const perColumn = Math.max(1, Math.ceil(count / columns));
+    let maxSurprise = 1e-6;
+    const pooled = new Float32Array(Math.ceil(count / perColumn));
+    for (let i = 0; i < count; i++) {
+        const surprise = isNaN(data.logprobs[i]) ? 0 : -data.logprobs[i];
+        const c = Math.floor(i / perColumn);
+        if (surprise > pooled[c]) pooled[c] = surprise;
+        if (surprise > maxSurprise) maxSurprise = surprise;
+    }
+    const width = columns / pooled.length;
+    for (let c = 0; c < pooled.length; c++) {
+        const h = scored ? canvas.height * pooled[c] / maxSurprise : canvas.height / 4;
+        ctx.fillStyle = scored ? d3.interpolateOrRd(pooled[c] / maxSurprise) : "#3f88c5";
+        ctx.fillRect(c * width, canvas.height - h, Math.max(width, 1), h);
+    }
+
+    document.getElementById("token-summary").textContent =
+        `${count} tokens (tokenized by the ${data.source === "model" ? "loaded model" : "GGUF vocabulary"})` +
+        (scored ? `, mean surprise ${(d3.mean(data.logprobs.filter(v => !isNaN(v)).map(v => -v)) || 0).toFixed(2)} nats`
+                : "; load the model with 'Keep All Logits' and tick 'Score tokens' for log-probabilities");
+
+    // Token boundaries as the model saw them, shaded by surprise
+    function showText(center) {
+        const start = Math.max(0, Math.min(center - WINDOW / 2, count - WINDOW));
+        const container = document.getElementById("token-text");
+        container.textContent = "";
+        const fragment = document.createDocumentFragment();
+        for (let i = start; i < Math.min(count, start + WINDOW); i++) {
+            const span = document.createElement("span");
+            span.textContent = data.pieces[i];
+            const lp = data.logprobs[i];
+            span.title = `#${data.positions[i]} id ${data.token_ids[i]}` + (isNaN(lp) ? "" : ` logprob ${lp.toFixed(3)}`);
+            span.style.background = isNaN(lp) ? "#eef" : d3.interpolateOrRd(Math.min(1, -lp / maxSurprise));
+            span.style.borderRight = "1px solid #fff";
+            fragment.appendChild(span);
+        }
+        container.appendChild(fragment);
+    }
+    canvas.addEventListener("click", function (event) {
+        const rect = canvas.getBoundingClientRect();
+        showText(Math.floor((event.clientX - rect.left) / rect.width * count));
+    });
+    showText(0);
+    });
+</script>
+"""
+
+WEIGHT_TEMPLATE = """<script src="https://d3js.org/d3.v7.min.js"></script>
+<div id="weight-visualization"></div>
+<script>
+    {{load_payload}}.then(function (data) {
+
+    // Example D3.js visualization for weights
+    const width = 800;
+    const height = 600;
+
+    const svg = d3.select("#weight-visualization")
+                  .append("svg")
+                  .attr("width", width)
+                  .attr("height", height);
+
+    // Simple bar chart example
+    const weights = Array.from(data.weights || []);
+
+    const xScale = d3.scaleBand()
+                     .domain(d3.range(weights.length))
+                     .range([0, width])
+                     .padding(0.1);
+
+    const yScale = d3.scaleLinear()
+                     .domain([0, d3.max(weights)])
+                     .range([height, 0]);
+
+    svg.selectAll("rect")
+       .data(weights)
+       .enter()
+       .append("rect")
+       .attr("x", (d, i) => xScale(i))
+       .attr("y", d => yScale(d))
+       .attr("width", xScale.bandwidth())
+       .attr("height", d => height - yScale(d))
+       .attr("fill", "steelblue");
+    });
+</script>
+"""
+
+EMBEDDING_TEMPLATE = """<script src="https://d3js.org/d3.v7.min.js"></script>
+<div id="embedding-visualization"></div>
+<script>
+    {{load_payload}}.then(function (data) {
+
+    // Example D3.js visualization for node embeddings
+    const width = 800;
+    const height = 600;
+
+    const svg = d3.select("#embedding-visualization")
+                  .append("svg")
+                  .attr("width", width)
+                  .attr("height", height);
+
+    // Embeddings arrive as a flat (n, 3) coordinate buffer
+    const flat = data.embeddings || [];
+    const embeddings = [];
+    for (let i = 0; i + 2 < flat.length; i += 3) embeddings.push([flat[i], flat[i + 1], flat[i + 2]]);
+
+    // Simple scatter plot for 3D embeddings projected to 2D
+    svg.selectAll("circle.token")
+       .data(embeddings)
+       .enter()
+       .append("circle")
+       .attr("class", "token")
+       .attr("cx", d => d[0] * 10 + width / 2)
+       .attr("cy", d => -d[1] * 10 + height / 2)
+       .attr("r", 5)
+       .attr("fill", "green")
+       .attr("opacity", 0.6);
+
+    // Nearest-neighbour lookup: the query token first, then its neighbours
+    const marked = data.highlight || [];
+    const highlighted = [];
+    for (let i = 0; i + 2 < marked.length; i += 3) highlighted.push([marked[i], marked[i + 1], i / 3]);
+    svg.selectAll("circle.highlight")
+       .data(highlighted)
+       .enter()
+       .append("circle")
+       .attr("class", "highlight")
+       .attr("cx", d => d[0] * 10 + width / 2)
+       .attr("cy", d => -d[1] * 10 + height / 2)
+       .attr("r", d => d[2] === 0 ? 8 : 6)
+       .attr("fill", d => d[2] === 0 ? "orange" : "red")
+       .append("title")
+       .text(d => "token " + data.highlight_ids[d[2]]);
+    });
+</script>
+"""
+
+# Canvas views, also rendered by template_renderer.TemplateRenderer
+TILE_HEATMAP_TEMPLATE = """<div style="font:12px sans-serif">
+<div id="caption"></div>
+<canvas id="tile" width="512" height="512" style="image-rendering:pixelated"></canvas>
+</div>
+<script>
+    {{load_payload}}.then(function (tile) {
+
+    const field = {{field}};
+    const values = tile[field];
+    const [rows, columns] = values.shape;
+    let low = Infinity, high = -Infinity;
+    for (const v of values) { if (v < low) low = v; if (v > high) high = v; }
+    const canvas = document.getElementById("tile");
+    const offscreen = new OffscreenCanvas(columns, rows);
+    const context = offscreen.getContext("2d");
+    const image = context.createImageData(columns, rows);
+    const span = high > low ? high - low : 1;
+    for (let i = 0; i < values.length; i++) {
+        const t = (values[i] - low) / span;
+        image.data[4 * i] = 255 * t;
+        image.data[4 * i + 1] = 64;
+        image.data[4 * i + 2] = 255 * (1 - t);
+        image.data[4 * i + 3] = 255;
+    }
+    context.putImageData(image, 0, 0);
+    const ctx = canvas.getContext("2d");
+    ctx.imageSmoothingEnabled = false;
+    ctx.drawImage(offscreen, 0, 0, canvas.width, canvas.height);
+    document.getElementById("caption").textContent =
+        `${tile.name} level ${tile.level} (1 cell = ${tile.factor}x${tile.factor} weights), ` +
+        `tile ${tile.tile} of ${tile.grid}, ${field} range [${low.toFixed(4)}, ${high.toFixed(4)}]`;
+    });
+</script>
+"""
+
+# The payload only configures the view; rows arrive later through applyCaptureDelta, which
+# queues them until the configuration is decoded
+LIVE_CAPTURE_TEMPLATE = """<div style="font:12px sans-serif">
+<div id="status">Waiting for the first tokens...</div>
+<canvas id="rows"></canvas>
+<div id="tokens" style="white-space:pre-wrap;max-height:80px;overflow:auto"></div>
+</div>
+<script>
+(function () {
+    const ROW = 4;
+    const canvas = document.getElementById("rows");
+    const ctx = canvas.getContext("2d");
+    const pending = [];
+    let config = null, cell = 0, lastSeq = 0, rows = 0, lost = 0, scheduled = false, busy = false;
+
+    function drawRow(delta, i) {
+        const topK = config.top_k;
+        // The view scrolls once it is full: the rows drawn so far move up by one
+        if ((rows + 1) * ROW > canvas.height) {
+            ctx.drawImage(canvas, 0, ROW, canvas.width, canvas.height - ROW, 0, 0, canvas.width, canvas.height - ROW);
+            ctx.clearRect(0, canvas.height - ROW, canvas.width, ROW);
+        } else {
+            rows++;
+        }
+        const y = (rows - 1) * ROW;
+        for (let k = 0; k < topK; k++) {
+            const p = delta.top_probs[i * topK + k];
+            ctx.fillStyle = `rgb(${255 * (1 - p)}, ${255 * (1 - p)}, 255)`;
+            ctx.fillRect(k * cell, y, cell, ROW);
+        }
+        // Entropy (nats) and surprise (-log p) of the sampled token as bars on the right
+        ctx.fillStyle = "#888";
+        ctx.fillRect(topK * cell + 4, y, Math.min(56, 8 * delta.entropy[i]), ROW - 1);
+        ctx.fillStyle = delta.generated[i] ? "#e94f37" : "#f4a259";
+        ctx.fillRect(topK * cell + 64, y, Math.min(56, -4 * delta.logprobs[i]), ROW - 1);
+    }
+
+    function schedule() {
+        if (config && pending.length && !scheduled) {
+            scheduled = true;
+            requestAnimationFrame(flush);
+        }
+    }
+
+    async function flush() {
+        scheduled = false;
+        if (busy) return;
+        busy = true;
+        // Deltas that arrived since the last frame are applied together
+        for (const text of pending.splice(0)) {
+            const delta = await window.decodeVisPayload(text);
+            if (delta.seq <= lastSeq) continue;  // Already applied
+            lost += Math.max(0, delta.start - lastSeq);
+            const skip = Math.max(0, lastSeq - delta.start);
+            for (let i = skip; i < delta.positions.length; i++) drawRow(delta, i);
+            document.getElementById("tokens").textContent += (delta.tokens || []).slice(skip).join("");
+            lastSeq = delta.seq;
+            document.getElementById("status").textContent =
+                `${lastSeq} positions` + (lost ? ` (${lost} overwritten before they were sent)` : "");
+        }
+        busy = false;
+        schedule();
+    }
+
+    window.applyCaptureDelta = function (text) {
+        if (!text) return;
+        pending.push(text);
+        schedule();
+    };
+
+    {{load_payload}}.then(function (view) {
+        canvas.width = view.width;
+        canvas.height = view.height;
+        cell = Math.floor((view.width - 120) / view.top_k);
+        config = view;
+        schedule();
+    });
+})();
+</script>
+"""
+
+# Runs in the Gradio page when the hidden delta component changes: hands the payload to
+# the mounted live view instead of re-rendering it. The app may live in a shadow root.
+LIVE_DELTA_JS = """(payload) => {
+    const app = document.querySelector("gradio-app");
+    const root = (app && app.shadowRoot) || document;
+    const frame = root.querySelector("#live-capture-view iframe");
+    if (frame && frame.contentWindow && frame.contentWindow.applyCaptureDelta) {
+        frame.contentWindow.applyCaptureDelta(payload);
+    }
+    return [];
+}"""
+
+def prepare_live_capture_view(top_k=8, width=640, height=480):
+    """
+    Configures an empty live view of an instrumented generation (LIVE_CAPTURE_TEMPLATE):
+    one row per position with the top-k probabilities, the entropy and the surprise of
+    the sampled token. Rows are appended from CaptureBuffer.delta payloads passed to
+    applyCaptureDelta (see LIVE_DELTA_JS), so the page and its scripts are sent once per
+    generation.
+
+    :param top_k: Top-k width of the capture.
+    :param width: Canvas width in pixels.
+    :param height: Canvas height in pixels; older rows scroll out once it is full.
+    :return: JSON payload of the view settings.
     """
-    coords = [{"x": emb[0], "y": emb[1], "z": emb[2]} for emb in embeddings]
-    return json.dumps(coords)
+    return encode_payload({"top_k": int(top_k), "width": int(width), "height": int(height)})
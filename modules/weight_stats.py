@@ -0,0 +1,549 @@
+# modules/weight_stats.py
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from modules.gguf_reader import GGUFReader
+
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024  # Size of one dequantized float32 chunk
+DEFAULT_BINS = 64
+DEFAULT_CHUNKS_PER_TASK = 8  # Work unit of a parallel worker, in chunks
+
+_LAYER_PATTERN = re.compile(r"^blk\.(\d+)\.")
+
+
+def _f16(blocks, start):
+    """Reads a little-endian float16 field from every block as a float32 column."""
+    return np.ascontiguousarray(blocks[:, start:start + 2]).view("<f2").astype(np.float32)
+
+
+def _dequantize_f32(raw):
+    return raw.view("<f4")
+
+
+def _dequantize_f16(raw):
+    return raw.view("<f2").astype(np.float32)
+
+
+def _dequantize_bf16(raw):
+    return (raw.view("<u2").astype(np.uint32) << 16).view(np.float32)
+
+
+def _dequantize_q8_0(raw):
+    blocks = raw.reshape(-1, 34)
+    d = _f16(blocks, 0)
+    qs = blocks[:, 2:].view(np.int8)
+    return (d * qs).ravel()
+
+
+def _nibbles(qs):
+    """Splits 16 packed bytes per block into 32 values: low nibbles first, then high."""
+    return np.concatenate([qs & 0x0F, qs >> 4], axis=1)
+
+
+def _dequantize_q4_0(raw):
+    blocks = raw.reshape(-1, 18)
+    d = _f16(blocks, 0)
+    q = _nibbles(blocks[:, 2:]).astype(np.int8) - 8
+    return (d * q).ravel()
+
+
+def _dequantize_q4_1(raw):
+    blocks = raw.reshape(-1, 20)
+    d = _f16(blocks, 0)
+    m = _f16(blocks, 2)
+    q = _nibbles(blocks[:, 4:])
+    return (d * q + m).ravel()
+
+
+def _high_bits(qh):
+    """Expands a little-endian uint32 per block into 32 fifth bits, shifted into place."""
+    qh = np.ascontiguousarray(qh).view("<u4")
+    return ((qh >> np.arange(32, dtype=np.uint32)) & 1).astype(np.uint8) << 4
+
+
+def _dequantize_q5_0(raw):
+    blocks = raw.reshape(-1, 22)
+    d = _f16(blocks, 0)
+    q = (_nibbles(blocks[:, 6:]) | _high_bits(blocks[:, 2:6])).astype(np.int8) - 16
+    return (d * q).ravel()
+
+
+def _dequantize_q5_1(raw):
+    blocks = raw.reshape(-1, 24)
+    d = _f16(blocks, 0)
+    m = _f16(blocks, 2)
+    q = _nibbles(blocks[:, 8:]) | _high_bits(blocks[:, 4:8])
+    return (d * q + m).ravel()
+
+
+def _dequantize_q4_k(raw):
+    blocks = raw.reshape(-1, 144)
+    n = blocks.shape[0]
+    d = _f16(blocks, 0)
+    dmin = _f16(blocks, 2)
+    s = blocks[:, 4:16]
+    # Eight 6-bit scale/min pairs packed into 12 bytes
+    scales = np.empty((n, 8), dtype=np.uint8)
+    mins = np.empty((n, 8), dtype=np.uint8)
+    scales[:, :4] = s[:, 0:4] & 63
+    mins[:, :4] = s[:, 4:8] & 63
+    scales[:, 4:] = (s[:, 8:12] & 0x0F) | ((s[:, 0:4] >> 6) << 4)
+    mins[:, 4:] = (s[:, 8:12] >> 4) | ((s[:, 4:8] >> 6) << 4)
+    # Each 32-byte group holds two sub-blocks: low nibbles, then high nibbles
+    qs = blocks[:, 16:].reshape(n, 4, 1, 32)
+    q = np.concatenate([qs & 0x0F, qs >> 4], axis=2).reshape(n, 8, 32)
+    y = (d * scales)[:, :, None] * q - (dmin * mins)[:, :, None]
+    return y.reshape(-1)
+
+
+def _dequantize_q6_k(raw):
+    blocks = raw.reshape(-1, 210)
+    n = blocks.shape[0]
+    ql = blocks[:, :128].reshape(n, 2, 64)
+    qh = blocks[:, 128:192].reshape(n, 2, 32)
+    scales = blocks[:, 192:208].view(np.int8).reshape(n, 2, 4, 2, 1)
+    d = _f16(blocks, 208).reshape(n, 1, 1, 1, 1)
+    a, b = ql[:, :, :32], ql[:, :, 32:]
+    q = np.stack([
+        (a & 0x0F) | ((qh & 3) << 4),
+        (b & 0x0F) | (((qh >> 2) & 3) << 4),
+        (a >> 4) | (((qh >> 4) & 3) << 4),
+        (b >> 4) | (((qh >> 6) & 3) << 4),
+    ], axis=2).astype(np.int8) - 32
+    y = d * scales * q.reshape(n, 2, 4, 2, 16)
+    return y.reshape(-1)
+
+
+_DEQUANTIZERS = {
+    "F32": _dequantize_f32,
+    "F16": _dequantize_f16,
+    "BF16": _dequantize_bf16,
+    "Q8_0": _dequantize_q8_0,
+    "Q4_0": _dequantize_q4_0,
+    "Q4_1": _dequantize_q4_1,
+    "Q5_0": _dequantize_q5_0,
+    "Q5_1": _dequantize_q5_1,
+    "Q4_K": _dequantize_q4_k,
+    "Q6_K": _dequantize_q6_k,
+}
+
+
+def is_supported(info):
+    """
+    Checks whether a tensor's data type can be dequantized.
+
+    :param info: GGUFTensorInfo of the tensor.
+    :return: True if dequantization is supported.
+    """
+    return info.type_name in _DEQUANTIZERS
+
+
+def dequantize(raw, type_name):
+    """
+    Dequantizes raw ggml blocks to float32.
+
+    :param raw: uint8 array holding a whole number of blocks.
+    :param type_name: ggml type name (e.g. 'Q4_K').
+    :return: Flat float32 array.
+    """
+    try:
+        dequantizer = _DEQUANTIZERS[type_name]
+    except KeyError:
+        raise NotImplementedError(f"Dequantization of {type_name} tensors is not supported.")
+    return dequantizer(raw).astype(np.float32, copy=False)
+
+
+def chunk_blocks_for(info, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Number of ggml blocks per chunk so that one dequantized chunk fits in chunk_bytes.
+
+    :param info: GGUFTensorInfo of the tensor.
+    :param chunk_bytes: Size budget of one float32 chunk in bytes.
+    :return: Blocks per chunk (at least 1).
+    """
+    return max(1, chunk_bytes // (4 * info.block_size))
+
+
+def iter_chunks(start_block, end_block, chunk_blocks):
+    """
+    Yields (start, end) block ranges. Boundaries fall on multiples of chunk_blocks,
+    so any split of a tensor on those multiples produces exactly the same chunks.
+
+    :param start_block: First block.
+    :param end_block: Block after the last one.
+    :param chunk_blocks: Blocks per chunk.
+    """
+    start = start_block
+    while start < end_block:
+        end = min(end_block, (start // chunk_blocks + 1) * chunk_blocks)
+        yield start, end
+        start = end
+
+
+def read_blocks(reader, info, start_block, end_block):
+    """
+    Dequantizes a range of blocks of a tensor straight from the memory map.
+
+    :param reader: GGUFReader of the file.
+    :param info: GGUFTensorInfo of the tensor.
+    :param start_block: First block.
+    :param end_block: Block after the last one.
+    :return: Flat float32 array.
+    """
+    return dequantize(reader.tensor_bytes(info, start_block, end_block), info.type_name)
+
+
+def chunk_moments(values, zero_threshold=0.0):
+    """
+    Computes the partial moments of one chunk.
+
+    :param values: Flat float32 array.
+    :param zero_threshold: Values with an absolute value at or below this count as zero.
+    :return: Tuple (count, mean, m2, sum_abs, min, max, zeros). min and max only cover
+             the finite values (NaN if there are none).
+    """
+    count = values.size
+    mean = float(values.mean(dtype=np.float64))
+    with np.errstate(invalid="ignore"):
+        # inf - inf: the moments of a tensor with non-finite values are NaN
+        m2 = float(np.square(values - mean, dtype=np.float64).sum())
+    abs_values = np.abs(values)
+    vmin, vmax = float(values.min()), float(values.max())
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        # inf and NaN are left out of the range, so the histogram still has finite bounds
+        finite = values[np.isfinite(values)]
+        vmin, vmax = (float(finite.min()), float(finite.max())) if finite.size else (np.nan, np.nan)
+    return (
+        count,
+        mean,
+        m2,
+        float(abs_values.sum(dtype=np.float64)),
+        vmin,
+        vmax,
+        int(np.count_nonzero(abs_values <= zero_threshold)),
+    )
+
+
+def merge_moments(a, b):
+    """
+    Merges two partial moment tuples (Chan et al. parallel variance).
+
+    :param a: Accumulated moments, or None.
+    :param b: Moments of the next chunk.
+    :return: Merged moments.
+    """
+    if a is None:
+        return b
+    count = a[0] + b[0]
+    delta = b[1] - a[1]
+    mean = a[1] + delta * b[0] / count
+    m2 = a[2] + b[2] + delta * delta * a[0] * b[0] / count
+    # fmin/fmax skip the NaN range of a chunk without finite values
+    return (count, mean, m2, a[3] + b[3], float(np.fmin(a[4], b[4])), float(np.fmax(a[5], b[5])), a[6] + b[6])
+
+
+def histogram_range(moments):
+    """
+    Range of the histogram of a tensor: its finite minimum and maximum.
+
+    :param moments: Folded moment tuple.
+    :return: (min, max), or (0.0, 0.0) if the tensor has no finite values.
+    """
+    if np.isnan(moments[4]):
+        return (0.0, 0.0)
+    return (moments[4], moments[5])
+
+
+def tensor_chunk_moments(reader, info, start_block=0, end_block=None,
+                         chunk_bytes=DEFAULT_CHUNK_BYTES, zero_threshold=0.0):
+    """
+    Computes partial moments for every chunk in a block range of a tensor.
+
+    :param reader: GGUFReader of the file.
+    :param info: GGUFTensorInfo of the tensor.
+    :param start_block: First block.
+    :param end_block: Block after the last one (defaults to all).
+    :param chunk_bytes: Size budget of one float32 chunk in bytes.
+    :param zero_threshold: Threshold for the sparsity count.
+    :return: List of moment tuples, one per chunk.
+    """
+    if end_block is None:
+        end_block = info.n_blocks
+    chunk_blocks = chunk_blocks_for(info, chunk_bytes)
+    return [chunk_moments(read_blocks(reader, info, s, e), zero_threshold)
+            for s, e in iter_chunks(start_block, end_block, chunk_blocks)]
+
+
+def tensor_histogram(reader, info, value_range, bins=DEFAULT_BINS, start_block=0,
+                     end_block=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Counts a histogram over a block range of a tensor, chunk by chunk.
+
+    :param reader: GGUFReader of the file.
+    :param info: GGUFTensorInfo of the tensor.
+    :param value_range: (min, max) of the histogram.
+    :param bins: Number of bins.
+    :param start_block: First block.
+    :param end_block: Block after the last one (defaults to all).
+    :param chunk_bytes: Size budget of one float32 chunk in bytes.
+    :return: int64 array of bin counts.
+    """
+    if end_block is None:
+        end_block = info.n_blocks
+    chunk_blocks = chunk_blocks_for(info, chunk_bytes)
+    counts = np.zeros(bins, dtype=np.int64)
+    for s, e in iter_chunks(start_block, end_block, chunk_blocks):
+        chunk_counts, _ = np.histogram(read_blocks(reader, info, s, e), bins=bins, range=value_range)
+        counts += chunk_counts
+    return counts
+
+
+class TensorStats:
+    def __init__(self, name, type_name, shape, moments, histogram, hist_range):
+        """
+        Summary statistics of one tensor.
+
+        :param name: Tensor name.
+        :param type_name: ggml type name.
+        :param shape: Tensor shape in NumPy order.
+        :param moments: Folded moment tuple (count, mean, m2, sum_abs, min, max, zeros).
+        :param histogram: int64 bin counts of the finite values.
+        :param hist_range: (min, max) covered by the histogram.
+        """
+        count, mean, m2, sum_abs, vmin, vmax, zeros = moments
+        self.moments = tuple(moments)
+        self.name = name
+        self.type_name = type_name
+        self.shape = tuple(shape)
+        self.count = int(count)
+        self.mean = mean
+        self.std = float(np.sqrt(m2 / count)) if count else 0.0
+        self.mean_abs = sum_abs / count if count else 0.0
+        self.min = vmin
+        self.max = vmax
+        self.sparsity = zeros / count if count else 0.0
+        self.histogram = np.asarray(histogram, dtype=np.int64)
+        self.hist_range = tuple(hist_range)
+        # The histogram spans the finite range, so the values it misses are inf or NaN
+        self.nonfinite = self.count - int(self.histogram.sum()) if len(self.histogram) else 0
+
+    @property
+    def hist_edges(self):
+        """Bin edges of the histogram."""
+        return np.linspace(self.hist_range[0], self.hist_range[1], len(self.histogram) + 1)
+
+    def to_dict(self):
+        """
+        Returns a JSON-serializable representation of the statistics.
+
+        :return: Dictionary of statistics.
+        """
+        return {
+            "name": self.name,
+            "dtype": self.type_name,
+            "shape": list(self.shape),
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "mean_abs": self.mean_abs,
+            "min": self.min,
+            "max": self.max,
+            "sparsity": self.sparsity,
+            "nonfinite": self.nonfinite,
+            "histogram": self.histogram.tolist(),
+            "hist_range": list(self.hist_range),
+        }
+
+
+def fold_moments(partials):
+    """
+    Folds per-chunk moments left to right. The fold order is fixed, so the result
+    only depends on the chunk boundaries and not on who computed each chunk.
+
+    :param partials: Moment tuples in chunk order.
+    :return: Folded moment tuple.
+    """
+    moments = None
+    for partial in partials:
+        moments = merge_moments(moments, partial)
+    if moments is None:
+        return (0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+    return moments
+
+
+def compute_tensor_stats(reader, info, chunk_bytes=DEFAULT_CHUNK_BYTES, bins=DEFAULT_BINS,
+                         zero_threshold=0.0):
+    """
+    Streams one tensor through the memory map and computes its statistics. Peak
+    memory is a few multiples of chunk_bytes regardless of the tensor size.
+
+    :param reader: GGUFReader of the file.
+    :param info: GGUFTensorInfo of the tensor.
+    :param chunk_bytes: Size budget of one float32 chunk in bytes.
+    :param bins: Number of histogram bins.
+    :param zero_threshold: Threshold for the sparsity count.
+    :return: TensorStats.
+    """
+    moments = fold_moments(tensor_chunk_moments(reader, info, chunk_bytes=chunk_bytes,
+                                                zero_threshold=zero_threshold))
+    # The histogram spans the exact finite value range found in the first pass
+    hist_range = histogram_range(moments)
+    histogram = tensor_histogram(reader, info, hist_range, bins=bins, chunk_bytes=chunk_bytes)
+    return TensorStats(info.name, info.type_name, info.shape, moments, histogram, hist_range)
+
+
+def compute_model_stats(model_file, names=None, chunk_bytes=DEFAULT_CHUNK_BYTES, bins=DEFAULT_BINS,
+                        zero_threshold=0.0, workers=1, chunks_per_task=DEFAULT_CHUNKS_PER_TASK):
+    """
+    Computes statistics for the tensors of a GGUF file.
+
+    With workers > 1 the tensors are analysed by a process pool. Every worker maps
+    the file itself, so only block ranges and small result tuples cross process
+    boundaries, and the results are bit-for-bit identical to the serial path.
+
+    :param model_file: Path to a GGUF file or an open GGUFReader.
+    :param names: Optional list of tensor names to analyse (defaults to all).
+    :param chunk_bytes: Size budget of one float32 chunk in bytes.
+    :param bins: Number of histogram bins.
+    :param zero_threshold: Threshold for the sparsity count.
+    :param workers: Number of worker processes (1 runs in this process).
+    :param chunks_per_task: Chunks per parallel work unit; large tensors are split into
+                            several units on chunk boundaries.
+    :return: Dictionary mapping tensor names to TensorStats, in file order.
+    """
+    reader = model_file if isinstance(model_file, GGUFReader) else GGUFReader(model_file)
+    try:
+        infos = _select_tensors(reader, names)
+        if workers is not None and workers > 1 and infos:
+            return _compute_parallel(reader.path, infos, chunk_bytes, bins, zero_threshold,
+                                     workers, chunks_per_task)
+        stats = {}
+        for info in infos:
+            stats[info.name] = compute_tensor_stats(reader, info, chunk_bytes, bins, zero_threshold)
+        return stats
+    finally:
+        if reader is not model_file:
+            reader.close()
+
+
+# Reader opened once per worker process by _init_worker
+_worker_reader = None
+
+
+def _init_worker(path):
+    global _worker_reader
+    _worker_reader = GGUFReader(path)
+
+
+def _moments_task(name, start_block, end_block, chunk_bytes, zero_threshold):
+    info = _worker_reader.get_tensor_info(name)
+    return tensor_chunk_moments(_worker_reader, info, start_block, end_block, chunk_bytes, zero_threshold)
+
+
+def _histogram_task(name, start_block, end_block, value_range, bins, chunk_bytes):
+    info = _worker_reader.get_tensor_info(name)
+    return tensor_histogram(_worker_reader, info, value_range, bins, start_block, end_block, chunk_bytes)
+
+
+def _task_ranges(info, chunk_bytes, chunks_per_task):
+    """Splits a tensor into block ranges on multiples of the chunk size."""
+    task_blocks = chunk_blocks_for(info, chunk_bytes) * max(1, chunks_per_task)
+    return [(start, min(start + task_blocks, info.n_blocks))
+            for start in range(0, info.n_blocks, task_blocks)]
+
+
+def _compute_parallel(path, infos, chunk_bytes, bins, zero_threshold, workers, chunks_per_task):
+    ranges = {info.name: _task_ranges(info, chunk_bytes, chunks_per_task) for info in infos}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+        # Pass 1: per-chunk moments, folded in chunk order exactly like the serial path
+        moment_futures = {
+            info.name: [pool.submit(_moments_task, info.name, s, e, chunk_bytes, zero_threshold)
+                        for s, e in ranges[info.name]]
+            for info in infos
+        }
+        moments = {}
+        for info in infos:
+            partials = []
+            for future in moment_futures[info.name]:
+                partials.extend(future.result())
+            moments[info.name] = fold_moments(partials)
+
+        # Pass 2: histograms over each tensor's exact range; integer counts merge exactly
+        histogram_futures = {
+            info.name: [pool.submit(_histogram_task, info.name, s, e,
+                                    histogram_range(moments[info.name]), bins, chunk_bytes)
+                        for s, e in ranges[info.name]]
+            for info in infos
+        }
+        stats = {}
+        for info in infos:
+            histogram = np.zeros(bins, dtype=np.int64)
+            for future in histogram_futures[info.name]:
+                histogram += future.result()
+            hist_range = histogram_range(moments[info.name])
+            stats[info.name] = TensorStats(info.name, info.type_name, info.shape, moments[info.name],
+                                           histogram, hist_range)
+        return stats
+
+
+def _select_tensors(reader, names=None):
+    selected = reader.tensors if names is None else [reader.get_tensor_info(n) for n in names]
+    infos = []
+    for info in selected:
+        if info is None:
+            continue
+        if not is_supported(info):
+            print(f"Skipping tensor '{info.name}': {info.type_name} is not supported.")
+            continue
+        infos.append(info)
+    return infos
+
+
+def layer_index(tensor_name):
+    """
+    Extracts the transformer block index from a tensor name.
+
+    :param tensor_name: Tensor name such as 'blk.3.attn_q.weight'.
+    :return: Block index, or None for tensors outside the blocks.
+    """
+    match = _LAYER_PATTERN.match(tensor_name)
+    return int(match.group(1)) if match else None
+
+
+def layer_statistics(tensor_stats):
+    """
+    Aggregates tensor statistics per transformer block.
+
+    :param tensor_stats: Dictionary mapping tensor names to TensorStats.
+    :return: Dictionary mapping block index to aggregated statistics.
+    """
+    layers = {}
+    for stats in tensor_stats.values():
+        index = layer_index(stats.name)
+        if index is None:
+            continue
+        layer = layers.setdefault(index, {"parameters": 0, "sum_abs": 0.0, "zeros": 0.0,
+                                          "min": np.inf, "max": -np.inf, "tensors": 0})
+        layer["parameters"] += stats.count
+        layer["sum_abs"] += stats.mean_abs * stats.count
+        layer["zeros"] += stats.sparsity * stats.count
+        # A tensor without finite values has a NaN range, which fmin/fmax skip
+        layer["min"] = float(np.fmin(layer["min"], stats.min))
+        layer["max"] = float(np.fmax(layer["max"], stats.max))
+        layer["tensors"] += 1
+
+    result = {}
+    for index in sorted(layers):
+        layer = layers[index]
+        result[index] = {
+            "parameters": layer["parameters"],
+            "mean_abs": layer["sum_abs"] / layer["parameters"],
+            "sparsity": layer["zeros"] / layer["parameters"],
+            "min": layer["min"],
+            "max": layer["max"],
+            "tensors": layer["tensors"],
+        }
+    return result
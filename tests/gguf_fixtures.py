@@ -0,0 +1,125 @@
+# tests/gguf_fixtures.py
+
+import struct
+
+import numpy as np
+
+from modules import gguf_reader as gr
+
+_NP_TO_GGUF = {
+    np.dtype("uint8"): gr.GGUF_TYPE_UINT8,
+    np.dtype("int8"): gr.GGUF_TYPE_INT8,
+    np.dtype("uint16"): gr.GGUF_TYPE_UINT16,
+    np.dtype("int16"): gr.GGUF_TYPE_INT16,
+    np.dtype("uint32"): gr.GGUF_TYPE_UINT32,
+    np.dtype("int32"): gr.GGUF_TYPE_INT32,
+    np.dtype("float32"): gr.GGUF_TYPE_FLOAT32,
+    np.dtype("bool"): gr.GGUF_TYPE_BOOL,
+    np.dtype("uint64"): gr.GGUF_TYPE_UINT64,
+    np.dtype("int64"): gr.GGUF_TYPE_INT64,
+    np.dtype("float64"): gr.GGUF_TYPE_FLOAT64,
+}
+
+
+def _pack_string(value):
+    data = value.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def _pack_value(value):
+    if isinstance(value, str):
+        return struct.pack("<I", gr.GGUF_TYPE_STRING) + _pack_string(value)
+    if isinstance(value, bool):
+        return struct.pack("<I?", gr.GGUF_TYPE_BOOL, value)
+    if isinstance(value, int):
+        if value < 0:
+            return struct.pack("<Ii", gr.GGUF_TYPE_INT32, value)
+        return struct.pack("<II", gr.GGUF_TYPE_UINT32, value)
+    if isinstance(value, float):
+        return struct.pack("<If", gr.GGUF_TYPE_FLOAT32, value)
+    if isinstance(value, list) and value and isinstance(value[0], str):
+        header = struct.pack("<IIQ", gr.GGUF_TYPE_ARRAY, gr.GGUF_TYPE_STRING, len(value))
+        return header + b"".join(_pack_string(v) for v in value)
+    array = np.asarray(value)
+    item_type = _NP_TO_GGUF[array.dtype]
+    return struct.pack("<IIQ", gr.GGUF_TYPE_ARRAY, item_type, array.size) + array.tobytes()
+
+
+def write_gguf(path, metadata, tensors, alignment=32):
+    """
+    Writes a small GGUF v3 file for tests.
+
+    :param path: Destination path.
+    :param metadata: Dictionary of metadata key/values (str, bool, int, float, lists, arrays).
+    :param tensors: List of (name, dims in GGUF order, ggml type id, raw bytes) tuples.
+    :param alignment: Data alignment in bytes.
+    """
+    header = bytearray(b"GGUF")
+    header += struct.pack("<IQQ", 3, len(tensors), len(metadata))
+    for key, value in metadata.items():
+        header += _pack_string(key) + _pack_value(value)
+
+    offset = 0
+    data = bytearray()
+    for name, dims, ggml_type, raw in tensors:
+        header += _pack_string(name)
+        header += struct.pack("<I", len(dims)) + struct.pack(f"<{len(dims)}Q", *dims)
+        header += struct.pack("<IQ", ggml_type, offset)
+        data += raw
+        padding = -len(data) % alignment
+        data += b"\0" * padding
+        offset = len(data)
+
+    header += b"\0" * (-len(header) % alignment)
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(data)
+
+
+def f32_tensor(name, array):
+    """
+    Builds a write_gguf tensor entry from a float32 array.
+
+    :param name: Tensor name.
+    :param array: NumPy array in row-major order.
+    :return: Tensor tuple for write_gguf.
+    """
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return (name, tuple(reversed(array.shape)), 0, array.tobytes())
+
+
+def tiny_llama(path, n_layers=2, n_embd=8, n_vocab=16, seed=0):
+    """
+    Writes a tiny llama-shaped GGUF file with float32 weights.
+
+    :param path: Destination path.
+    :param n_layers: Number of transformer blocks.
+    :param n_embd: Hidden size.
+    :param n_vocab: Vocabulary size.
+    :param seed: Random seed for the weights.
+    :return: Dictionary mapping tensor names to the written arrays.
+    """
+    rng = np.random.default_rng(seed)
+    arrays = {"token_embd.weight": rng.standard_normal((n_vocab, n_embd)).astype(np.float32)}
+    for i in range(n_layers):
+        arrays[f"blk.{i}.attn_norm.weight"] = rng.random(n_embd).astype(np.float32)
+        for part in ("attn_q", "attn_k", "attn_v", "attn_output"):
+            arrays[f"blk.{i}.{part}.weight"] = rng.standard_normal((n_embd, n_embd)).astype(np.float32)
+        arrays[f"blk.{i}.ffn_norm.weight"] = rng.random(n_embd).astype(np.float32)
+        arrays[f"blk.{i}.ffn_gate.weight"] = rng.standard_normal((2 * n_embd, n_embd)).astype(np.float32)
+        arrays[f"blk.{i}.ffn_up.weight"] = rng.standard_normal((2 * n_embd, n_embd)).astype(np.float32)
+        arrays[f"blk.{i}.ffn_down.weight"] = rng.standard_normal((n_embd, 2 * n_embd)).astype(np.float32)
+    arrays["output_norm.weight"] = rng.random(n_embd).astype(np.float32)
+    arrays["output.weight"] = rng.standard_normal((n_vocab, n_embd)).astype(np.float32)
+
+    metadata = {
+        "general.architecture": "llama",
+        "general.name": "tiny-llama",
+        "llama.block_count": n_layers,
+        "llama.embedding_length": n_embd,
+        "llama.attention.head_count": 2,
+        "tokenizer.ggml.tokens": [f"tok{i}" for i in range(n_vocab)],
+        "tokenizer.ggml.scores": np.zeros(n_vocab, dtype=np.float32),
+    }
+    write_gguf(path, metadata, [f32_tensor(name, array) for name, array in arrays.items()])
+    return arrays
@@ -0,0 +1,80 @@
+# tests/test_batch_experiment.py
+
+import json
+import os
+import tempfile
+import unittest
+
+from modules.gguf_model import GENERATION_ERROR
+from modules.self_awareness_experiment import load_prompts, run_batch_experiment
+
+
+class _FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.prompts = []
+
+    def generate(self, prompt, max_tokens=50):
+        self.prompts.append(prompt)
+        if "fail" in prompt:
+            raise RuntimeError("generation failed")
+        if "swallowed" in prompt:
+            # GGUFModel.generate catches inference errors and returns this text instead
+            return GENERATION_ERROR
+        return f"{self.name}:{prompt}"
+
+
+class TestBatchExperiment(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmpdir.name, "out", "results.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_output(self):
+        with open(self.output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_load_prompts_from_jsonl(self):
+        path = os.path.join(self.tmpdir.name, "prompts.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('"Who are you?"\n\n{"id": "q2", "prompt": "Are you aware?"}\n')
+        self.assertEqual(load_prompts(path), [{"id": 0, "prompt": "Who are you?"},
+                                              {"id": "q2", "prompt": "Are you aware?"}])
+
+    def test_results_in_input_order_across_replicas(self):
+        models = [_FakeModel("r0"), _FakeModel("r1")]
+        prompts = [f"question {i}" for i in range(10)]
+        summary = run_batch_experiment(models, prompts, self.output, system_prompt="SYS ")
+        records = self.read_output()
+        self.assertEqual([r["id"] for r in records], list(range(10)))
+        self.assertEqual(summary["completed"], 10)
+        for record in records:
+            self.assertTrue(record["response"].endswith("SYS " + record["prompt"]))
+        self.assertEqual(sum(len(m.prompts) for m in models), 10)
+
+    def test_resume_skips_completed_and_retries_failures(self):
+        model = _FakeModel("r0")
+        run_batch_experiment(model, ["a", "please fail", "c"], self.output, experiment="mirror")
+        self.assertEqual([("error" in r) for r in self.read_output()], [False, True, False])
+        model.prompts.clear()
+        summary = run_batch_experiment(model, ["a", "please fail", "c"], self.output, experiment="mirror")
+        self.assertEqual(model.prompts, ["please fail"])
+        self.assertEqual(summary["skipped"], 2)
+        self.assertEqual(summary["failed"], 1)
+
+    def test_swallowed_generation_errors_are_retried(self):
+        model = _FakeModel("r0")
+        summary = run_batch_experiment(model, ["a", "swallowed"], self.output, experiment="mirror")
+        records = self.read_output()
+        self.assertEqual(summary["failed"], 1)
+        self.assertNotIn("response", records[1])
+        self.assertEqual(records[1]["error"], GENERATION_ERROR)
+        model.prompts.clear()
+        run_batch_experiment(model, ["a", "swallowed"], self.output, experiment="mirror")
+        self.assertEqual(model.prompts, ["swallowed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
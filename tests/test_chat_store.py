@@ -0,0 +1,130 @@
+# tests/test_chat_store.py
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from modules.chat_store import ChatStore, ChatWriter
+
+
+class TestChatStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ChatStore(os.path.join(self.tmpdir.name, "chats.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_append_and_load_session(self):
+        # Messages written in the same second no longer overwrite each other
+        self.store.append("s1", "Hello", "Hi there", created_at=100.0, model="tiny.gguf")
+        self.store.append("s1", "How are you?", "Fine", created_at=100.0)
+        messages = self.store.load_session("s1")
+        self.assertEqual([(m["prompt"], m["response"]) for m in messages],
+                         [("Hello", "Hi there"), ("How are you?", "Fine")])
+        session = self.store.get_session("s1")
+        self.assertEqual(session["title"], "Hello")
+        self.assertEqual(session["model"], "tiny.gguf")
+        self.assertEqual(session["message_count"], 2)
+
+    def test_paged_listing_most_recent_first(self):
+        for i in range(7):
+            self.store.append(f"s{i}", f"prompt {i}", "response", created_at=float(i))
+        seen = []
+        page, cursor = self.store.list_sessions(limit=3)
+        seen.extend(s["id"] for s in page)
+        while cursor is not None:
+            page, cursor = self.store.list_sessions(limit=3, before=cursor)
+            seen.extend(s["id"] for s in page)
+        self.assertEqual(seen, [f"s{i}" for i in reversed(range(7))])
+
+    def test_time_range_query(self):
+        for i in range(10):
+            self.store.append("a" if i % 2 else "b", f"p{i}", "r", created_at=float(i))
+        self.assertEqual([m["prompt"] for m in self.store.messages_between(3, 6)], ["p3", "p4", "p5"])
+        self.assertEqual([m["prompt"] for m in self.store.messages_between(3, 6, session_id="a")], ["p3", "p5"])
+        self.assertEqual(len(self.store.messages_between(start=8)), 2)
+
+    def test_import_legacy_json_files(self):
+        legacy = os.path.join(self.tmpdir.name, "outputs")
+        os.makedirs(legacy)
+        for name in ["chat_20240101_120000.json", "chat_20240101_130000.json", "chat_20240102_090000.json"]:
+            with open(os.path.join(legacy, name), "w") as f:
+                json.dump({"prompt": name, "response": "ok"}, f)
+        with open(os.path.join(legacy, "chat_20240103_090000.json"), "w") as f:
+            f.write("{broken")
+        self.assertEqual(self.store.import_json_chats(legacy), 3)
+        self.assertEqual(len(self.store.load_session("imported-20240101")), 2)
+        sessions, _ = self.store.list_sessions()
+        self.assertEqual([s["id"] for s in sessions], ["imported-20240102", "imported-20240101"])
+
+
+class _SlowStore:
+    """Wraps a ChatStore so the writer thread waits for a gate, like a stalled network drive."""
+
+    def __init__(self, store, gate):
+        self.store = store
+        self.gate = gate
+        self.batches = []
+
+    def append_many(self, messages):
+        if threading.current_thread().name == "chat-writer":
+            self.gate.wait(5)
+        self.batches.append(len(messages))
+        return self.store.append_many(messages)
+
+    def checkpoint(self):
+        self.store.checkpoint()
+
+
+class TestChatWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ChatStore(os.path.join(self.tmpdir.name, "chats.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_group_commit_and_flush(self):
+        gate = threading.Event()
+        slow = _SlowStore(self.store, gate)
+        writer = ChatWriter(slow, batch_size=100, sync_interval=0.05)
+        # The first message holds the writer at the gate while the rest queue up
+        for i in range(50):
+            self.assertTrue(writer.submit("s1", f"p{i}", "r"))
+        gate.set()
+        writer.flush()
+        self.assertEqual([m["prompt"] for m in self.store.load_session("s1")], [f"p{i}" for i in range(50)])
+        self.assertLess(len(slow.batches), 50)
+        writer.close()
+        self.assertEqual(writer.metrics()["written"], 50)
+        self.assertGreaterEqual(writer.metrics()["syncs"], 1)
+
+    def test_full_queue_writes_synchronously(self):
+        gate = threading.Event()
+        writer = ChatWriter(_SlowStore(self.store, gate), max_queue=2, put_timeout=0)
+        results = [writer.submit("s1", f"p{i}", "r", created_at=100.0 + i) for i in range(10)]
+        self.assertFalse(all(results))
+        self.assertEqual(writer.metrics()["synchronous"], results.count(False))
+        # Written while the background writer is still stalled
+        self.assertEqual(len(self.store.load_session("s1")), results.count(False))
+        gate.set()
+        writer.close()
+        self.assertEqual([m["prompt"] for m in self.store.load_session("s1")], [f"p{i}" for i in range(10)])
+
+    def test_close_writes_remaining_messages(self):
+        writer = ChatWriter(self.store, sync_interval=60)
+        for i in range(5):
+            writer.submit("s1", f"p{i}", "r")
+        writer.close()
+        self.assertEqual(len(self.store.load_session("s1")), 5)
+        with self.assertRaises(RuntimeError):
+            writer.submit("s1", "late", "r")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+# tests/test_download_tool.py
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.download_tool import DownloadError, ModelSearch, download_file, download_model
+
+CHUNK = 64 * 1024
+
+
+class _FileServer:
+    """Local stand-in for the Hub: serves files with range support and an API tree listing."""
+
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.fail_ranges = set()  # Range starts that fail once with a dropped connection
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/api/models/"):
+                    tree = [{"type": "file", "path": name, "size": len(data),
+                             "lfs": {"oid": hashlib.sha256(data).hexdigest(), "size": len(data)}}
+                            for name, data in server.files.items()]
+                    tree.append({"type": "directory", "path": "docs"})
+                    self._send(200, json.dumps(tree).encode())
+                    return
+                name = self.path.rsplit("/", 1)[-1]
+                data = server.files[name]
+                header = self.headers.get("Range")
+                server.requests.append(header)
+                if header is None or not server.ranges:
+                    self._send(200, data)
+                    return
+                start, end = (int(v) for v in header[len("bytes="):].split("-"))
+                body = data[start:end + 1]
+                if start in server.fail_ranges and end > 0:
+                    server.fail_ranges.discard(start)
+                    self.send_response(206)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                    self.end_headers()
+                    self.wfile.write(body[:len(body) // 2])
+                    return
+                self.send_response(206)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = os.urandom(10 * CHUNK + 123)
+        self.sha = hashlib.sha256(self.data).hexdigest()
+        self.server = _FileServer({"model.gguf": self.data})
+        self.url = f"{self.server.url}/org/repo/resolve/main/model.gguf"
+        self.dest = os.path.join(self.tmpdir.name, "models", "model.gguf")
+
+    def tearDown(self):
+        self.server.close()
+        self.tmpdir.cleanup()
+
+    def read_dest(self):
+        with open(self.dest, "rb") as f:
+            return f.read()
+
+    def test_parallel_download_is_verified(self):
+        reports = []
+        result = download_file(self.url, self.dest, expected_size=len(self.data), sha256=self.sha,
+                               connections=4, chunk_bytes=CHUNK,
+                               progress=lambda done, total, rate: reports.append((done, total)))
+        self.assertEqual(self.read_dest(), self.data)
+        self.assertEqual(result["size"], len(self.data))
+        self.assertEqual(reports[-1], (len(self.data), len(self.data)))
+        self.assertFalse(os.path.exists(self.dest + ".part"))
+        self.assertFalse(os.path.exists(self.dest + ".part.json"))
+
+    def test_retries_dropped_connections(self):
+        self.server.fail_ranges = {2 * CHUNK, 5 * CHUNK}
+        download_file(self.url, self.dest, sha256=self.sha, connections=3, chunk_bytes=CHUNK)
+        self.assertEqual(self.read_dest(), self.data)
+
+    def test_resumes_after_interruption(self):
+        self.server.fail_ranges = {7 * CHUNK}
+        with self.assertRaises(DownloadError):
+            download_file(self.url, self.dest, sha256=self.sha, connections=1, chunk_bytes=CHUNK, retries=0)
+        self.assertTrue(os.path.exists(self.dest + ".part.json"))
+        self.server.requests.clear()
+        result = download_file(self.url, self.dest, sha256=self.sha, connections=2, chunk_bytes=CHUNK)
+        self.assertEqual(self.read_dest(), self.data)
+        # Chunks before the failure are kept; a chunk already started may also have finished
+        self.assertGreaterEqual(result["resumed_bytes"], 7 * CHUNK)
+        missing_chunks = 11 - result["resumed_bytes"] // CHUNK
+        self.assertEqual(len(self.server.requests), 1 + missing_chunks)
+
+    def test_hash_mismatch_discards_partial_file(self):
+        with self.assertRaises(DownloadError):
+            download_file(self.url, self.dest, sha256="0" * 64, chunk_bytes=CHUNK)
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertFalse(os.path.exists(self.dest + ".part"))
+
+    def test_server_without_ranges(self):
+        self.server.ranges = False
+        download_file(self.url, self.dest, sha256=self.sha, chunk_bytes=CHUNK)
+        self.assertEqual(self.read_dest(), self.data)
+
+
+class TestDownloadModel(unittest.TestCase):
+    def test_downloads_selected_gguf_files(self):
+        files = {"model-Q4_K_M.gguf": os.urandom(3000), "model-Q8_0.gguf": os.urandom(5000), "README.md": b"hi"}
+        server = _FileServer(files)
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                status = download_model("org/repo", destination_dir=tmpdir, filenames=["model-Q8_0.gguf"],
+                                        endpoint=server.url)
+                self.assertIn("downloaded", status)
+                self.assertEqual(os.listdir(os.path.join(tmpdir, "repo")), ["model-Q8_0.gguf"])
+                again = download_model("org/repo", destination_dir=tmpdir, filenames=["model-Q8_0.gguf"],
+                                       endpoint=server.url)
+                self.assertIn("already downloaded", again)
+        finally:
+            server.close()
+
+
+class _FakeHubModel:
+    def __init__(self, model_id):
+        self.id = model_id
+
+
+class _FakeHubClient:
+    """Stands in for HfApi: an unbounded generator of results, like the real listing."""
+
+    def __init__(self):
+        self.calls = []
+        self.offline = False
+        self.delay = 0.0
+
+    def list_models(self, search=None, filter=None, sort=None, direction=None, limit=None):
+        self.calls.append({"search": search, "filter": filter, "limit": limit})
+        if self.offline:
+            raise ConnectionError("network is unreachable")
+        time.sleep(self.delay)
+        i = 0
+        while True:
+            yield _FakeHubModel(f"org/{search}-{i}-GGUF")
+            i += 1
+
+
+class TestModelSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.client = _FakeHubClient()
+        self.cache_path = os.path.join(self.tmpdir.name, "search.json")
+        self.search = ModelSearch(client=self.client, cache_path=self.cache_path, timeout=1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_pages_are_bounded(self):
+        first = self.search.search("llama", page_size=10)
+        self.assertEqual(first["models"][0], "org/llama-0-GGUF")
+        self.assertEqual(len(first["models"]), 10)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(self.client.calls[0], {"search": "llama", "filter": "gguf", "limit": 11})
+        second = self.search.search("llama", page=1, page_size=10)
+        self.assertEqual(second["models"][0], "org/llama-10-GGUF")
+
+    def test_ttl_cache(self):
+        self.search.search("qwen", page_size=5)
+        self.assertTrue(self.search.search("QWEN ", page_size=5)["cached"])
+        self.assertEqual(len(self.client.calls), 1)
+        self.search.ttl = 0
+        self.assertFalse(self.search.search("qwen", page_size=5)["cached"])
+        self.assertEqual(len(self.client.calls), 2)
+
+    def test_offline_fallback_uses_persisted_cache(self):
+        self.search.search("phi", page_size=5)
+        offline_client = _FakeHubClient()
+        offline_client.offline = True
+        restarted = ModelSearch(client=offline_client, cache_path=self.cache_path, ttl=0)
+        result = restarted.search("phi", page_size=5)
+        self.assertTrue(result["stale"])
+        self.assertEqual(result["models"][0], "org/phi-0-GGUF")
+        with self.assertRaises(DownloadError):
+            restarted.search("unknown")
+
+    def test_slow_hub_times_out(self):
+        self.client.delay = 2
+        self.search.timeout = 0.05
+        started = time.monotonic()
+        with self.assertRaises(DownloadError):
+            self.search.search("mistral")
+        self.assertLess(time.monotonic() - started, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
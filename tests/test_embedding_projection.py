@@ -0,0 +1,97 @@
+# tests/test_embedding_projection.py
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import tiny_llama
+from modules.embedding_projection import ProjectionCache, project_array, project_embeddings
+from modules.gguf_model import GGUFModel
+from modules.gguf_reader import GGUFReader
+from modules.visualization_tool import get_embedding_visualization_data
+
+
+def _exact_pca(array, k):
+    centered = array - array.mean(axis=0)
+    _, s, vt = np.linalg.svd(centered, full_matrices=False)
+    return centered @ vt[:k].T, vt[:k], s[:k] ** 2 / (len(array) - 1)
+
+
+class TestEmbeddingProjection(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Three dominant directions over noise, offset from the origin
+        scales = np.r_[20.0, 10.0, 5.0, np.full(45, 0.5)]
+        self.array = (rng.standard_normal((2000, 48)) * scales + 5).astype(np.float32)
+
+    def test_matches_exact_pca(self):
+        projection = project_array(self.array, n_components=3, chunk_rows=300)
+        coords, components, variance = _exact_pca(self.array.astype(np.float64), 3)
+        # Components are defined up to sign
+        signs = np.sign(np.sum(projection.components * components, axis=1))
+        np.testing.assert_allclose(projection.components * signs[:, None], components, atol=1e-2)
+        np.testing.assert_allclose(projection.coords * signs, coords, atol=0.1, rtol=1e-2)
+        np.testing.assert_allclose(projection.explained_variance, variance, rtol=1e-2)
+        np.testing.assert_allclose(projection.project(self.array[:5]), projection.coords[:5], atol=0.1)
+
+    def test_sampling_and_nearest(self):
+        projection = project_array(self.array, n_components=2, sample=100)
+        self.assertEqual(projection.coords.shape, (100, 2))
+        self.assertTrue(np.all(np.diff(projection.token_ids) > 0))
+        token = int(projection.token_ids[7])
+        neighbours = projection.nearest(token, k=5)
+        self.assertEqual(len(neighbours), 5)
+        self.assertNotIn(token, [i for i, _ in neighbours])
+        distances = [d for _, d in neighbours]
+        self.assertEqual(distances, sorted(distances))
+        brute = np.sort(np.linalg.norm(projection.coords - projection.coords[7], axis=1))[1:6]
+        np.testing.assert_allclose(distances, brute, rtol=1e-5)
+        with self.assertRaises(KeyError):
+            projection.nearest(-1)
+
+
+class TestProjectionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tiny.gguf")
+        self.arrays = tiny_llama(self.path, n_layers=1, n_embd=16, n_vocab=200)
+        self.cache = ProjectionCache(cache_dir=os.path.join(self.tmpdir.name, "projection"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_chunked_gguf_projection_is_cached(self):
+        embeddings = self.arrays["token_embd.weight"]
+        with GGUFReader(self.path) as reader:
+            # 16 columns of float32 in 1 KiB chunks: 16 rows per chunk
+            chunked = project_embeddings(reader, sample=150, chunk_bytes=1024)
+            expected = project_array(embeddings, sample=150)
+            np.testing.assert_array_equal(chunked.token_ids, expected.token_ids)
+            np.testing.assert_allclose(chunked.coords, expected.coords, rtol=1e-4, atol=1e-4)
+
+            first = self.cache.get_or_project(reader, sample=150)
+            cached = self.cache.get_or_project(reader, sample=150)
+        np.testing.assert_array_equal(cached.coords, first.coords)
+        np.testing.assert_array_equal(cached.token_ids, first.token_ids)
+        self.assertAlmostEqual(cached.total_variance, first.total_variance)
+        self.assertEqual(len(self.cache.entries()), 1)
+
+    def test_embedding_view_skips_weight_statistics(self):
+        model = GGUFModel(self.path)
+        model.projection_cache = self.cache
+
+        def full_statistics():
+            raise AssertionError("the embedding view read every tensor")
+
+        model.get_layer_statistics = full_statistics
+        data = get_embedding_visualization_data(model)
+        self.assertEqual(sorted(data), ["embedding_ids", "embeddings"])
+        self.assertEqual(data["embeddings"].shape[1], 3)
+        self.assertEqual(len(data["embeddings"]), len(data["embedding_ids"]))
+        model.close_reader()
+
+
+if __name__ == "__main__":
+    unittest.main()
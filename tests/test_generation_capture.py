@@ -0,0 +1,175 @@
+# tests/test_generation_capture.py
+
+import ctypes
+import threading
+import unittest
+
+import numpy as np
+
+from modules.generation_capture import CaptureBuffer, iter_capture_deltas
+from modules.gguf_model import GGUFModel
+from modules.visualization_tool import get_attention_pyramid
+
+
+class _FakeContext:
+    def __init__(self, n_vocab):
+        self.logits = np.zeros(n_vocab, dtype=np.float32)
+
+    def get_logits(self):
+        return self.logits.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+
+
+class _FakeLlama:
+    """
+    Deterministic stand-in for llama_cpp.Llama: token t is always followed by t + 1. As in
+    llama-cpp-python 0.3, scores is only filled with logits_all; the context always holds
+    the logits of the last evaluated token.
+    """
+
+    def __init__(self, n_vocab=16, n_ctx=64, eos=15, logits_all=False):
+        self._n_vocab = n_vocab
+        self.eos = eos
+        self.logits_all = logits_all
+        self.scores = np.zeros((n_ctx, n_vocab), dtype=np.float32)
+        self._ctx = _FakeContext(n_vocab)
+        self.n_tokens = 0
+
+    def n_vocab(self):
+        return self._n_vocab
+
+    def tokenize(self, text):
+        return [int(c) for c in text.decode("utf-8").split()]
+
+    def detokenize(self, tokens):
+        return "".join(f" {t}" for t in tokens).encode("utf-8")
+
+    def token_eos(self):
+        return self.eos
+
+    def _eval(self, tokens):
+        for token in tokens:
+            self._ctx.logits[:] = -1.0
+            self._ctx.logits[(token + 1) % self._n_vocab] = 4.0
+            if self.logits_all:
+                self.scores[self.n_tokens] = self._ctx.logits
+            self.n_tokens += 1
+
+    def generate(self, tokens, **sampling):
+        self.n_tokens = 0
+        self._eval(tokens)
+        while True:
+            token = int(np.argmax(self._ctx.logits))
+            yield token
+            self._eval([token])
+
+
+class TestCaptureBuffer(unittest.TestCase):
+    def test_summaries_match_softmax(self):
+        buffer = CaptureBuffer(capacity=4, top_k=3)
+        logits = np.array([2.0, -1.0, 0.5, 3.0, 0.0], dtype=np.float32)
+        buffer.record(0, 2, logits)
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        data = buffer.snapshot()
+        self.assertAlmostEqual(float(data["logprobs"][0]), np.log(probs[2]), places=5)
+        self.assertAlmostEqual(float(data["entropy"][0]), -np.sum(probs * np.log(probs)), places=5)
+        self.assertEqual(data["ranks"][0], 2)
+        self.assertEqual(data["top_ids"][0].tolist(), [3, 0, 2])
+        np.testing.assert_allclose(data["top_probs"][0], probs[[3, 0, 2]], rtol=1e-5)
+
+    def test_ring_keeps_latest_positions(self):
+        buffer = CaptureBuffer(capacity=3, top_k=2, position_stride=2)
+        logits = np.zeros(4, dtype=np.float32)
+        for position in range(10):
+            buffer.record(position, 0, logits)
+        data = buffer.snapshot()
+        self.assertEqual(data["positions"].tolist(), [4, 6, 8])
+        self.assertEqual((data["recorded"], data["dropped"], data["skipped"]), (5, 2, 5))
+        self.assertGreater(data["overhead_s"], 0.0)
+
+    def test_attention_view_is_tiled(self):
+        buffer = CaptureBuffer(capacity=1024, top_k=4)
+        logits = np.arange(8, dtype=np.float32)
+        for position in range(1000):
+            buffer.record(position, position % 8, logits)
+        pyramid = get_attention_pyramid(buffer)
+        self.assertEqual(pyramid.shape, (1000, 4))
+        overview = pyramid.overview()
+        self.assertLessEqual(max(overview["mean"].shape), pyramid.tile_size)
+        np.testing.assert_allclose(pyramid.tile(0, 0, 0)["max"], buffer.snapshot()["top_probs"][:pyramid.tile_size])
+        self.assertEqual(get_attention_pyramid(None).shape, (3, 3))
+
+    def test_delta_returns_new_positions(self):
+        buffer = CaptureBuffer(capacity=4, top_k=2)
+        logits = np.zeros(4, dtype=np.float32)
+        for position in range(3):
+            buffer.record(position, position % 4, logits)
+        delta = buffer.delta(1)
+        self.assertEqual((delta["start"], delta["seq"], delta["gap"]), (1, 3, 0))
+        self.assertEqual(delta["token_ids"].tolist(), [1, 2])
+        self.assertEqual(buffer.delta(3)["positions"].tolist(), [])
+        for position in range(3, 10):
+            buffer.record(position, position % 4, logits)
+        # The oldest slot is the next to be overwritten, so it is not sent either
+        delta = buffer.delta(3)
+        self.assertEqual(delta["positions"].tolist(), [7, 8, 9])
+        self.assertEqual((delta["start"], delta["gap"]), (7, 4))
+
+    def test_iter_deltas_coalesces_steps(self):
+        buffer = CaptureBuffer(capacity=64, top_k=2)
+        logits = np.zeros(4, dtype=np.float32)
+        recorded = threading.Event()
+
+        def generate():
+            for position in range(40):
+                buffer.record(position, 0, logits)
+            recorded.set()
+
+        thread = threading.Thread(target=generate)
+        thread.start()
+        deltas = list(iter_capture_deltas(buffer, recorded.is_set, interval=0.01))
+        thread.join()
+        self.assertLessEqual(len(deltas), 40)
+        self.assertEqual(deltas[-1]["seq"], 40)
+        self.assertEqual([d["start"] for d in deltas[1:]], [d["seq"] for d in deltas[:-1]])
+        self.assertEqual(np.concatenate([d["positions"] for d in deltas]).tolist(), list(range(40)))
+
+
+class TestGenerateWithCapture(unittest.TestCase):
+    def _model(self, logits_all=False):
+        model = GGUFModel("unused.gguf", logits_all=logits_all)
+        model.model = _FakeLlama(logits_all=logits_all)
+        return model
+
+    def test_records_generated_positions(self):
+        model = self._model()
+        text, capture, elapsed = model.generate_with_capture("3 4", max_tokens=5)
+        self.assertEqual(text, "5 6 7 8 9")
+        data = capture.snapshot()
+        self.assertEqual(data["positions"].tolist(), [2, 3, 4, 5, 6])
+        self.assertEqual(data["token_ids"].tolist(), [5, 6, 7, 8, 9])
+        self.assertTrue(data["generated"].all())
+        self.assertTrue(np.all(data["ranks"] == 0))
+        self.assertLessEqual(capture.overhead_s, elapsed)
+        # Recorded from the context: without logits_all the scores rows stay empty
+        self.assertFalse(model.model.scores.any())
+
+    def test_prompt_positions_need_logits_all(self):
+        _, capture, _ = self._model(logits_all=True).generate_with_capture("3 4 9", max_tokens=1)
+        data = capture.snapshot()
+        self.assertEqual(data["positions"].tolist(), [1, 2, 3])
+        self.assertEqual(data["generated"].tolist(), [False, False, True])
+        # The prompt token 9 after 4 was not the predicted one
+        self.assertEqual(data["ranks"].tolist(), [0, 1, 0])
+
+    def test_stops_at_eos_and_stop_string(self):
+        model = self._model()
+        text, capture, _ = model.generate_with_capture("12", max_tokens=10)
+        self.assertEqual(text, "13 14")
+        self.assertEqual(len(capture), 3)
+        text, _, _ = model.generate_with_capture("1", max_tokens=10, stop_tokens=[" 4"])
+        self.assertEqual(text, "2 3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 # tests/test_gguf_model.py
 
 import unittest
-from modules.gguf_model import GGUFModel
+from modules.gguf_model import GGUFModel, SessionStateCache
 
 class TestGGUFModel(unittest.TestCase):
     def setUp(self):
@@ -22,5 +22,34 @@ class TestGGUFModel(unittest.TestCase):
         self.assertIsInstance(response, str)
         self.model.unload_model()
 
+    def test_generate_stream(self):
+        self.model.load_model()
+        prompt = "Hello, how are you?"
+        pieces = list(self.model.generate_stream(prompt, max_tokens=8))
+        self.assertTrue(all(isinstance(piece, str) for piece in pieces))
+        self.model.unload_model()
+
+class _FakeState:
+    def __init__(self, size):
+        self.llama_state_size = size
+
+class TestSessionStateCache(unittest.TestCase):
+    def test_evicts_least_recently_used_session(self):
+        cache = SessionStateCache(max_bytes=250)
+        cache.put("a", _FakeState(100))
+        cache.put("b", _FakeState(100))
+        cache.get("a")
+        cache.put("c", _FakeState(100))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_discard(self):
+        cache = SessionStateCache()
+        cache.put("a", _FakeState(10))
+        cache.discard("a")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+# tests/test_gguf_reader.py
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import tiny_llama, write_gguf
+from modules.gguf_reader import GGUFFormatError, GGUFReader
+
+
+class TestGGUFReader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tiny.gguf")
+        self.arrays = tiny_llama(self.path, n_layers=3, n_embd=8, n_vocab=16)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_header_and_metadata(self):
+        with GGUFReader(self.path) as reader:
+            self.assertEqual(reader.version, 3)
+            self.assertEqual(reader.architecture, "llama")
+            self.assertEqual(reader.block_count, 3)
+            self.assertEqual(reader.embedding_length, 8)
+            self.assertEqual(reader.get_arch_field("attention.head_count"), 2)
+            tokens = reader.metadata["tokenizer.ggml.tokens"]
+            self.assertEqual(len(tokens), 16)
+            self.assertEqual(tokens[5], "tok5")
+            self.assertEqual(tokens[-2:], ["tok14", "tok15"])
+            np.testing.assert_array_equal(reader.metadata["tokenizer.ggml.scores"], np.zeros(16))
+
+    def test_tensor_table(self):
+        with GGUFReader(self.path) as reader:
+            self.assertEqual([t.name for t in reader.tensors], list(self.arrays))
+            info = reader.get_tensor_info("blk.1.ffn_down.weight")
+            self.assertEqual(info.shape, (8, 16))
+            self.assertEqual(info.type_name, "F32")
+            self.assertEqual(info.offset % reader.alignment, 0)
+            raw = reader.tensor_bytes(info)
+            values = raw.view(np.float32).reshape(info.shape)
+            np.testing.assert_array_equal(values, self.arrays["blk.1.ffn_down.weight"])
+            del raw, values
+
+    def test_block_count_falls_back_to_tensor_names(self):
+        path = os.path.join(self.tmpdir.name, "nometa.gguf")
+        raw = np.zeros(4, dtype=np.float32).tobytes()
+        write_gguf(path, {"general.architecture": "llama"},
+                   [(f"blk.{i}.attn_norm.weight", (4,), 0, raw) for i in range(5)])
+        with GGUFReader(path) as reader:
+            self.assertEqual(reader.block_count, 5)
+
+    def test_rejects_non_gguf_file(self):
+        path = os.path.join(self.tmpdir.name, "bogus.gguf")
+        with open(path, "wb") as f:
+            f.write(b"not a gguf file at all")
+        with self.assertRaises(GGUFFormatError):
+            GGUFReader(path)
+
+    def test_rejects_truncated_file(self):
+        path = os.path.join(self.tmpdir.name, "truncated.gguf")
+        with open(self.path, "rb") as src, open(path, "wb") as dst:
+            dst.write(src.read(200))
+        with self.assertRaises(GGUFFormatError):
+            GGUFReader(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# tests/test_gguf_tokenizer.py
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import f32_tensor, write_gguf
+from modules.gguf_model import GGUFModel
+from modules.gguf_tokenizer import GGUFTokenizer
+
+# A small SentencePiece vocabulary: control tokens, byte fallback, then pieces with scores
+SPM_PIECES = {"▁": -1.0, "h": -5.0, "e": -5.0, "l": -5.0, "o": -5.0, "w": -5.0, "r": -5.0, "d": -5.0,
+              "he": -3.0, "ll": -3.0, "hell": -2.5, "hello": -2.0, "▁hello": -1.5,
+              "or": -3.0, "ld": -3.0, "wor": -2.8, "world": -2.1, "▁world": -1.6, "▁▁": -4.0}
+SPM_TOKENS = ["<unk>", "<s>", "</s>"] + [f"<0x{b:02X}>" for b in range(256)] + list(SPM_PIECES)
+SPM_SCORES = np.array([0.0] * 259 + list(SPM_PIECES.values()), dtype=np.float32)
+
+
+def _spm():
+    return GGUFTokenizer(SPM_TOKENS, scores=SPM_SCORES, bos_id=1, unk_id=0)
+
+
+class TestSentencePiece(unittest.TestCase):
+    def test_merges_by_score(self):
+        tokenizer = _spm()
+        ids = tokenizer.encode("hello world")
+        self.assertEqual([SPM_TOKENS[i] for i in ids], ["<s>", "▁hello", "▁world"])
+        self.assertEqual(tokenizer.pieces(ids)[1:], [" hello", " world"])
+        self.assertEqual(ids.dtype, np.int32)
+
+    def test_space_runs_and_byte_fallback(self):
+        tokenizer = _spm()
+        ids = tokenizer.encode("hello  hé", add_bos=False)
+        self.assertEqual([SPM_TOKENS[i] for i in ids], ["▁hello", "▁▁", "h", "<0xC3>", "<0xA9>"])
+        self.assertEqual("".join(tokenizer.pieces(ids[:3])), " hello  h")
+
+    def test_long_text_is_fast(self):
+        tokenizer = _spm()
+        words = ["hello", "world", "held", "low", "row", "hole"]
+        text = " ".join(words[i % len(words)] for i in range(12000))
+        started = time.perf_counter()
+        ids = tokenizer.encode(text)
+        self.assertGreater(len(ids), 32000)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+class TestByteLevelBPE(unittest.TestCase):
+    def test_merges_by_rank(self):
+        # 'Ġh' + 'i' is never reached: 'h i' has the higher priority
+        tokens = ["<|endoftext|>", "h", "i", "Ġ", "!", "hi", "Ġh", "Ġhi"]
+        tokenizer = GGUFTokenizer(tokens, merges=["h i", "Ġ h", "Ġ hi", "Ġh i"], model="gpt2",
+                                  token_types=[3] + [1] * 7, bos_id=0, add_bos=False)
+        ids = tokenizer.encode("hi hi!")
+        self.assertEqual([tokens[i] for i in ids], ["hi", "Ġhi", "!"])
+        self.assertEqual("".join(tokenizer.pieces(ids)), "hi hi!")
+        self.assertEqual(tokenizer.pieces([0]), ["<|endoftext|>"])
+
+
+class _ScoringLlama:
+    """Stand-in for llama_cpp.Llama with logits_all: token t predicts t + 1 most strongly."""
+
+    def __init__(self, n_vocab=8, n_ctx=4):
+        self.n_vocab = n_vocab
+        self.scores = np.zeros((n_ctx, n_vocab), dtype=np.float32)
+        self.n_tokens = 0
+        self.resets = 0
+
+    def tokenize(self, text, add_bos=True):
+        return ([1] if add_bos else []) + [int(c) for c in text.decode("utf-8").split()]
+
+    def detokenize(self, tokens):
+        # Token 7 is half of a UTF-8 sequence, like a byte-fallback token
+        return b"".join(b"\xc3" if token == 7 else f"<{token}>".encode("utf-8") for token in tokens)
+
+    def reset(self):
+        self.n_tokens = 0
+        self.resets += 1
+
+    def eval(self, tokens):
+        for token in tokens:
+            self.scores[self.n_tokens] = 0.0
+            self.scores[self.n_tokens, (token + 1) % self.n_vocab] = 2.0
+            self.n_tokens += 1
+
+
+class TestTokenData(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "vocab.gguf")
+        write_gguf(self.path, {"general.architecture": "llama", "tokenizer.ggml.model": "llama",
+                               "tokenizer.ggml.tokens": SPM_TOKENS, "tokenizer.ggml.scores": SPM_SCORES,
+                               "tokenizer.ggml.bos_token_id": 1},
+                   [f32_tensor("token_embd.weight", np.zeros((len(SPM_TOKENS), 2)))])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_vocabulary_without_weights(self):
+        model = GGUFModel(self.path)
+        data = model.get_token_data("hello world hello")
+        self.assertEqual(data["source"], "vocab")
+        self.assertEqual(data["pieces"], ["<s>", " hello", " world", " hello"])
+        self.assertEqual(data["positions"].tolist(), [0, 1, 2, 3])
+        self.assertTrue(np.isnan(data["logprobs"]).all())
+        self.assertIs(model.get_token_data("hello world hello"), data)
+        model.close_reader()
+
+    def test_scores_in_context_windows(self):
+        model = GGUFModel(self.path, n_ctx=4, logits_all=True)
+        model.model = _ScoringLlama()
+        ids = np.array([1, 2, 3, 5, 6, 7, 0], dtype=np.int32)
+        logprobs = model.score_tokens(ids)
+        predicted = 2.0 - np.log(np.exp(2.0) + 7)
+        missed = 0.0 - np.log(np.exp(2.0) + 7)
+        expected = [np.nan, predicted, predicted, missed, np.nan, predicted, predicted]
+        np.testing.assert_allclose(logprobs, expected, rtol=1e-5)
+        self.assertEqual(model.model.resets, 2)
+        model.close_reader()
+
+    def test_scoring_needs_logits_all(self):
+        model = GGUFModel(self.path)
+        model.model = _ScoringLlama()
+        with self.assertRaises(ValueError):
+            model.get_token_data("1 2", logprobs=True)
+        data = model.get_token_data("2 3")
+        self.assertEqual((data["source"], data["token_ids"].tolist()), ("model", [1, 2, 3]))
+        model.close_reader()
+
+    def test_loaded_model_pieces_need_no_gguf_tokenizer(self):
+        # A vocabulary type the GGUF tokenizer does not implement
+        path = os.path.join(self.tmpdir.name, "bert.gguf")
+        write_gguf(path, {"general.architecture": "bert", "tokenizer.ggml.model": "bert",
+                          "tokenizer.ggml.tokens": SPM_TOKENS[:8]},
+                   [f32_tensor("token_embd.weight", np.zeros((8, 2)))])
+        model = GGUFModel(path)
+        with self.assertRaises(NotImplementedError):
+            model.get_token_data("2 3")
+        model.model = _ScoringLlama()
+        data = model.get_token_data("2 7")
+        self.assertEqual(data["pieces"], ["<1>", "<2>", "\ufffd"])
+        model.close_reader()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# tests/test_import_time.py
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must stay importable without paying for the heavy dependencies
+LIGHT_MODULES = [
+    "modules.gguf_model",
+    "modules.model_pool",
+    "modules.download_tool",
+    "modules.self_awareness_experiment",
+    "modules.weight_stats",
+    "modules.stats_cache",
+]
+HEAVY_MODULES = ["torch", "llama_cpp", "huggingface_hub"]
+IMPORT_BUDGET_S = 2.0
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _probe_imports(modules):
+    # A fresh interpreter, so modules imported by other tests do not hide the cost
+    code = _PROBE.format(modules=modules, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+    def test_heavy_dependencies_are_not_imported(self):
+        result = _probe_imports(LIGHT_MODULES)
+        self.assertEqual(result["loaded"], [])
+
+    def test_import_time_budget(self):
+        result = _probe_imports(LIGHT_MODULES)
+        self.assertLess(result["elapsed"], IMPORT_BUDGET_S,
+                        f"Importing the core modules took {result['elapsed']:.2f}s")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# tests/test_inference_scheduler.py
+
+import threading
+import unittest
+
+from modules.inference_scheduler import InferenceScheduler, JobCancelledError, QueueFullError
+
+
+class _FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def generate_stream(self, prompt, gate=None):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if gate is not None:
+                gate.wait(5)
+            for word in prompt.split():
+                yield word
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class TestInferenceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.models = [_FakeModel("r0"), _FakeModel("r1")]
+        self.scheduler = None
+
+    def tearDown(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+
+    def test_streams_results(self):
+        self.scheduler = InferenceScheduler(self.models[:1])
+        job = self.scheduler.submit("s1", lambda m: m.generate_stream("hello there world"))
+        self.assertEqual(list(job.stream(timeout=5)), ["hello", "there", "world"])
+        self.assertEqual(job.status, "done")
+        plain = self.scheduler.submit("s1", lambda m: m.name)
+        self.assertEqual(plain.result(timeout=5), "r0")
+
+    def test_replicas_are_never_shared(self):
+        self.scheduler = InferenceScheduler(self.models)
+        jobs = [self.scheduler.submit(f"s{i}", lambda m: m.generate_stream("a b c")) for i in range(20)]
+        for job in jobs:
+            self.assertEqual(job.result(timeout=5), ["a", "b", "c"])
+        for model in self.models:
+            self.assertLessEqual(model.max_active, 1)
+        self.assertEqual(self.scheduler.metrics()["completed"], 20)
+
+    def test_round_robin_across_sessions(self):
+        self.scheduler = InferenceScheduler(self.models[:1])
+        gate = threading.Event()
+        order = []
+        blocker = self.scheduler.submit("busy", lambda m: m.generate_stream("x", gate))
+        jobs = [self.scheduler.submit("busy", lambda m, i=i: order.append(("busy", i))) for i in range(3)]
+        jobs += [self.scheduler.submit("other", lambda m: order.append(("other", 0)))]
+        gate.set()
+        for job in [blocker] + jobs:
+            job.result(timeout=5)
+        # "other" is served before busy's second job however the blocker was scheduled
+        self.assertLess(order.index(("other", 0)), order.index(("busy", 1)))
+        self.assertEqual([item for item in order if item[0] == "busy"], [("busy", i) for i in range(3)])
+
+    def test_backpressure(self):
+        self.scheduler = InferenceScheduler(self.models[:1], max_queue=2, max_pending_per_session=1)
+        gate = threading.Event()
+        self.scheduler.submit("a", lambda m: m.generate_stream("x", gate))
+        # Wait until the worker has picked up the first job
+        while self.scheduler.metrics()["running"] == 0:
+            pass
+        self.scheduler.submit("a", lambda m: None)
+        with self.assertRaises(QueueFullError):
+            self.scheduler.submit("a", lambda m: None)
+        self.scheduler.submit("b", lambda m: None)
+        with self.assertRaises(QueueFullError):
+            self.scheduler.submit("c", lambda m: None)
+        metrics = self.scheduler.metrics()
+        self.assertEqual(metrics["queue_depth"], 2)
+        self.assertEqual(metrics["rejected"], 2)
+        gate.set()
+
+    def test_cancel_queued_and_running_jobs(self):
+        self.scheduler = InferenceScheduler(self.models[:1])
+        gate = threading.Event()
+        running = self.scheduler.submit("a", lambda m: m.generate_stream("one two three", gate))
+        queued = self.scheduler.submit("b", lambda m: m.name)
+        while running.status != "running":
+            pass
+        queued.cancel()
+        self.assertEqual(queued.status, "cancelled")
+        with self.assertRaises(JobCancelledError):
+            queued.result(timeout=5)
+        running.cancel()
+        gate.set()
+        self.assertLessEqual(len(list(running.stream(timeout=5))), 1)
+        self.assertEqual(running.status, "cancelled")
+        self.assertEqual(self.models[0].active, 0)
+
+    def test_failed_job_reports_error(self):
+        self.scheduler = InferenceScheduler(self.models[:1])
+
+        def broken(model):
+            raise RuntimeError("boom")
+
+        job = self.scheduler.submit("a", broken)
+        with self.assertRaises(RuntimeError):
+            job.result(timeout=5)
+        self.assertEqual(job.status, "failed")
+        self.assertIn("wait_p95_s", self.scheduler.metrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
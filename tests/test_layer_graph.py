@@ -0,0 +1,159 @@
+# tests/test_layer_graph.py
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import f32_tensor, tiny_llama, write_gguf
+from modules.brain_visualization import BRAIN_TEMPLATE
+from modules.gguf_model import GGUFModel
+from modules.gguf_reader import GGUFReader
+from modules.layer_graph import KINDS, build_layer_graph
+from modules.payload_codec import decode_payload, encode_payload
+from modules.stats_cache import StatsCache
+from modules.template_renderer import TemplateRenderer
+from modules.weight_stats import compute_model_stats
+
+
+def _moe_gguf(path, n_layers=2, n_embd=8, n_ff=4, n_experts=4):
+    rng = np.random.default_rng(0)
+    tensors = [f32_tensor("token_embd.weight", rng.standard_normal((16, n_embd)))]
+    for i in range(n_layers):
+        tensors += [
+            f32_tensor(f"blk.{i}.attn_norm.weight", np.ones(n_embd)),
+            f32_tensor(f"blk.{i}.attn_q.weight", rng.standard_normal((n_embd, n_embd))),
+            f32_tensor(f"blk.{i}.attn_k.weight", rng.standard_normal((n_embd, n_embd))),
+            f32_tensor(f"blk.{i}.attn_v.weight", rng.standard_normal((n_embd, n_embd))),
+            f32_tensor(f"blk.{i}.attn_output.weight", rng.standard_normal((n_embd, n_embd))),
+            f32_tensor(f"blk.{i}.ffn_norm.weight", np.ones(n_embd)),
+            f32_tensor(f"blk.{i}.ffn_gate_inp.weight", rng.standard_normal((n_experts, n_embd))),
+            f32_tensor(f"blk.{i}.ffn_gate_exps.weight", rng.standard_normal((n_experts, n_ff, n_embd))),
+            f32_tensor(f"blk.{i}.ffn_up_exps.weight", rng.standard_normal((n_experts, n_ff, n_embd))),
+            f32_tensor(f"blk.{i}.ffn_down_exps.weight", rng.standard_normal((n_experts, n_embd, n_ff))),
+        ]
+    tensors += [f32_tensor("output_norm.weight", np.ones(n_embd)),
+                f32_tensor("output.weight", rng.standard_normal((16, n_embd)))]
+    write_gguf(path, {"general.architecture": "llama"}, tensors)
+
+
+class TestLayerGraph(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _edges(self, graph):
+        return {(graph.names[a], graph.names[b]) for a, b in graph.edges.tolist()}
+
+    def test_dense_model(self):
+        path = os.path.join(self.tmpdir.name, "tiny.gguf")
+        arrays = tiny_llama(path, n_layers=2, n_embd=8, n_vocab=16)
+        with GGUFReader(path) as reader:
+            stats = compute_model_stats(reader)
+            graph = build_layer_graph(reader, tensor_stats=stats)
+        # One node per tensor here: 9 components per block plus the three globals
+        self.assertEqual(len(graph), 2 * 9 + 3)
+        self.assertEqual(int(graph.parameters.sum()), sum(a.size for a in arrays.values()))
+        q = graph.names.index("blk.1.attn_q")
+        self.assertEqual(graph.parameters[q], 64)
+        self.assertEqual(KINDS[graph.kinds[q]], "attention")
+        self.assertAlmostEqual(float(graph.mean_abs[q]), stats["blk.1.attn_q.weight"].mean_abs, places=5)
+        edges = self._edges(graph)
+        for edge in [("token_embd", "blk.0.attn_norm"), ("blk.0.attn_norm", "blk.0.attn_k"),
+                     ("blk.0.attn_v", "blk.0.attn_output"), ("blk.0.ffn_up", "blk.0.ffn_down"),
+                     ("blk.0.ffn_down", "blk.1.attn_norm"), ("blk.1.ffn_down", "output_norm"),
+                     ("output_norm", "output")]:
+            self.assertIn(edge, edges)
+        self.assertNotIn(("blk.0.ffn_gate", "blk.0.ffn_up"), edges)
+        self.assertEqual(graph.positions.shape, (len(graph), 3))
+        self.assertEqual(len({tuple(p) for p in graph.positions.tolist()}), len(graph))
+
+    def test_moe_expansion(self):
+        path = os.path.join(self.tmpdir.name, "moe.gguf")
+        _moe_gguf(path, n_layers=2, n_experts=4)
+        with GGUFReader(path) as reader:
+            collapsed = build_layer_graph(reader)
+            expanded = build_layer_graph(reader, expand_experts=True)
+        self.assertTrue(np.isnan(collapsed.mean_abs).all())
+        self.assertEqual(len(expanded), len(collapsed) + 2 * 3 * 3)
+        self.assertEqual(int(expanded.parameters.sum()), int(collapsed.parameters.sum()))
+        edges = self._edges(expanded)
+        self.assertIn(("blk.0.ffn_gate_inp", "blk.0.ffn_up_exps[2]"), edges)
+        self.assertIn(("blk.0.ffn_up_exps[2]", "blk.0.ffn_down_exps[2]"), edges)
+        self.assertNotIn(("blk.0.ffn_up_exps[2]", "blk.0.ffn_down_exps[3]"), edges)
+        self.assertIn(("blk.0.ffn_down_exps[3]", "blk.1.attn_norm"), edges)
+
+        data = expanded.to_dict()
+        self.assertEqual(len(data["nodes"]), len(expanded))
+        link = data["links"][0]
+        self.assertEqual(data["nodes"][link["source"]]["id"], link["source"])
+
+    def test_model_graph_reads_only_the_header(self):
+        path = os.path.join(self.tmpdir.name, "moe.gguf")
+        _moe_gguf(path)
+        cache = StatsCache(cache_dir=os.path.join(self.tmpdir.name, "stats"))
+        model = GGUFModel(path, stats_cache=cache)
+        graph = model.get_layer_graph()
+        # No statistics were computed for the graph, so it has none yet
+        self.assertTrue(np.isnan(graph.mean_abs).all())
+        self.assertEqual(cache.entries(), [])
+        self.assertIs(model.get_layer_graph(), graph)
+        model.get_weight_statistics()
+        self.assertFalse(np.isnan(model.get_layer_graph().mean_abs).any())
+        model.close_reader()
+        # A later instance finds them in the cache
+        fresh = GGUFModel(path, stats_cache=cache)
+        self.assertFalse(np.isnan(fresh.get_layer_graph(expand_experts=True).mean_abs).any())
+        fresh.close_reader()
+
+    def test_render_buffers(self):
+        path = os.path.join(self.tmpdir.name, "moe.gguf")
+        _moe_gguf(path)
+        with GGUFReader(path) as reader:
+            graph = build_layer_graph(reader, expand_experts=True)
+        buffers = decode_payload(encode_payload(graph.to_buffers()))
+        n = len(graph)
+        self.assertEqual(buffers["count"], n)
+        self.assertEqual((buffers["positions"].shape, buffers["positions"].dtype), ((n, 3), np.float32))
+        self.assertEqual((buffers["colors"].shape, buffers["colors"].dtype), ((n, 3), np.float32))
+        self.assertTrue(((buffers["colors"] >= 0) & (buffers["colors"] <= 1)).all())
+        self.assertEqual(buffers["edges"].dtype, np.uint32)
+        np.testing.assert_array_equal(buffers["edges"], graph.edges)
+        expert = graph.names.index("blk.0.ffn_up_exps[1]")
+        self.assertEqual(buffers["kind_names"][buffers["kinds"][expert]], "expert")
+        np.testing.assert_allclose(buffers["colors"][expert], [0x8c / 255, 0xd8 / 255, 0x67 / 255], rtol=1e-6)
+        renderer = TemplateRenderer()
+        renderer.register("brain", BRAIN_TEMPLATE)
+        page = renderer.render("brain", renderer.store.put(encode_payload(graph.to_buffers())), height=600)
+        self.assertIn("InstancedMesh", page)
+        self.assertIn("LineSegments", page)
+
+    def test_large_moe_table_is_fast(self):
+        # Header-only stand-in for a 120-layer, 128-expert model
+        class Info:
+            def __init__(self, name, *dims):
+                self.name, self.dims = name, dims
+                self.n_elements = int(np.prod(dims))
+                self.n_bytes = self.n_elements // 2
+
+        class Reader:
+            tensors = [Info("token_embd.weight", 4096, 150000)]
+
+        for i in range(120):
+            Reader.tensors += [Info(f"blk.{i}.attn_norm.weight", 4096), Info(f"blk.{i}.attn_q.weight", 4096, 4096),
+                               Info(f"blk.{i}.attn_output.weight", 4096, 4096),
+                               Info(f"blk.{i}.ffn_norm.weight", 4096), Info(f"blk.{i}.ffn_gate_inp.weight", 4096, 128)]
+            Reader.tensors += [Info(f"blk.{i}.ffn_{p}_exps.weight", 4096, 1024, 128) for p in ("gate", "up", "down")]
+        started = time.perf_counter()
+        graph = build_layer_graph(Reader, expand_experts=True)
+        graph.to_dict()
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(graph), 1 + 120 * (5 + 3 * 128))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# tests/test_lod_pyramid.py
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import tiny_llama
+from modules.gguf_reader import GGUFReader
+from modules.lod_pyramid import PyramidCache, build_tensor_pyramid, pyramid_from_array
+
+
+def _reference_pool(values, factor):
+    rows = -(-values.shape[0] // factor)
+    columns = -(-values.shape[1] // factor)
+    mins, maxs, means = (np.zeros((rows, columns)) for _ in range(3))
+    for r in range(rows):
+        for c in range(columns):
+            cell = values[r * factor:(r + 1) * factor, c * factor:(c + 1) * factor]
+            mins[r, c], maxs[r, c], means[r, c] = cell.min(), cell.max(), cell.mean()
+    return mins, maxs, means
+
+
+class TestTensorPyramid(unittest.TestCase):
+    def setUp(self):
+        self.values = np.random.default_rng(0).standard_normal((37, 53)).astype(np.float32)
+
+    def test_levels_match_direct_pooling(self):
+        pyramid = pyramid_from_array("x", self.values, tile_size=8, max_stored_cells=64)
+        self.assertEqual(pyramid.n_levels, 4)
+        for level in range(pyramid.n_levels):
+            mins, maxs, means = _reference_pool(self.values, 1 << level)
+            grid = pyramid.tile_grid(level)
+            for key, expected in (("min", mins), ("max", maxs), ("mean", means)):
+                stitched = np.block([[pyramid.tile(level, r, c)[key] for c in range(grid[1])]
+                                     for r in range(grid[0])])
+                np.testing.assert_allclose(stitched, expected, rtol=1e-5, atol=1e-6)
+
+    def test_stored_and_on_demand_tiles_agree(self):
+        stored = pyramid_from_array("x", self.values, tile_size=8)
+        streamed = pyramid_from_array("x", self.values, tile_size=8, max_stored_cells=1)
+        self.assertIn(0, stored.levels)
+        self.assertNotIn(0, streamed.levels)
+        for key in ("min", "max", "mean"):
+            np.testing.assert_allclose(streamed.tile(1, 2, 1)[key], stored.tile(1, 2, 1)[key], rtol=1e-6)
+
+    def test_tiles_are_bounded(self):
+        pyramid = pyramid_from_array("big", np.zeros((5000, 300), dtype=np.float32), tile_size=64,
+                                     max_stored_cells=4096)
+        overview = pyramid.overview()
+        self.assertLessEqual(max(overview["mean"].shape), 64)
+        rows, columns = pyramid.level_shape(pyramid.level_for_view(4096))
+        self.assertLessEqual(rows * columns, 4096)
+        with self.assertRaises(ValueError):
+            pyramid.tile(0, 1000, 0)
+
+
+class TestPyramidCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tiny.gguf")
+        self.arrays = tiny_llama(self.path, n_layers=1, n_embd=16, n_vocab=40)
+        self.cache = PyramidCache(cache_dir=os.path.join(self.tmpdir.name, "lod"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_gguf_pyramid_round_trip(self):
+        name = "token_embd.weight"
+        with GGUFReader(self.path) as reader:
+            built = self.cache.get_or_build(reader, name, tile_size=8, max_stored_cells=100)
+            cached = self.cache.get_or_build(reader, name, tile_size=8, max_stored_cells=100)
+            direct = build_tensor_pyramid(reader, reader.get_tensor_info(name), tile_size=8)
+            self.assertEqual(sorted(cached.levels), sorted(built.levels))
+            for level in range(built.n_levels):
+                for r in range(built.tile_grid(level)[0]):
+                    np.testing.assert_allclose(cached.tile(level, r, 0)["mean"], direct.tile(level, r, 0)["mean"],
+                                               rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(direct.tile(0, 0, 0)["mean"], self.arrays[name][:8, :8])
+        self.assertEqual(len(os.listdir(self.cache.cache_dir)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# tests/test_model_catalog.py
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from gguf_fixtures import tiny_llama
+from modules import model_catalog
+from modules.model_catalog import ModelCatalog
+
+
+class TestModelCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.models = os.path.join(self.tmpdir.name, "models")
+        os.makedirs(os.path.join(self.models, "repo", ".git", "lfs"))
+        tiny_llama(os.path.join(self.models, "small.gguf"), n_layers=1, n_embd=8)
+        tiny_llama(os.path.join(self.models, "repo", "big.gguf"), n_layers=3, n_embd=16)
+        # Only .gguf files outside hidden directories are indexed
+        tiny_llama(os.path.join(self.models, "repo", ".git", "lfs", "object.gguf"))
+        with open(os.path.join(self.models, "repo", "README.md"), "w") as f:
+            f.write("readme")
+        self.catalog = ModelCatalog(self.models, os.path.join(self.tmpdir.name, "catalog.db"))
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmpdir.cleanup()
+
+    def test_indexes_header_metadata(self):
+        self.assertEqual(self.catalog.scan(), {"added": 2, "updated": 0, "removed": 0, "unchanged": 0})
+        models = self.catalog.list_models()
+        self.assertEqual([m["path"] for m in models], ["repo/big.gguf", "small.gguf"])
+        big = self.catalog.get_model("repo/big.gguf")
+        self.assertEqual(big["architecture"], "llama")
+        self.assertEqual(big["block_count"], 3)
+        self.assertEqual(big["file_type"], "F32")
+        self.assertGreater(big["parameters"], models[1]["parameters"])
+
+    def test_incremental_rescan(self):
+        self.catalog.scan()
+        with mock.patch.object(model_catalog, "read_model_metadata",
+                               wraps=model_catalog.read_model_metadata) as read:
+            self.assertEqual(self.catalog.scan()["unchanged"], 2)
+            self.assertEqual(read.call_count, 0)
+            tiny_llama(os.path.join(self.models, "repo", "new.gguf"))
+            os.remove(os.path.join(self.models, "small.gguf"))
+            counts = self.catalog.scan()
+            self.assertEqual(read.call_count, 1)
+        self.assertEqual(counts, {"added": 1, "updated": 0, "removed": 1, "unchanged": 1})
+        self.assertEqual([m["path"] for m in self.catalog.list_models()], ["repo/big.gguf", "repo/new.gguf"])
+
+    def test_index_persists(self):
+        self.catalog.scan()
+        with ModelCatalog(self.models, self.catalog.db_path) as reopened:
+            self.assertEqual(len(reopened.list_models()), 2)
+
+    def test_filters_and_sorting(self):
+        with open(os.path.join(self.models, "broken.gguf"), "wb") as f:
+            f.write(b"not a gguf file")
+        self.catalog.scan()
+        self.assertEqual([m["path"] for m in self.catalog.list_models(sort_by="parameters", descending=True)],
+                         ["repo/big.gguf", "small.gguf"])
+        self.assertEqual([m["path"] for m in self.catalog.list_models(query="SMALL")], ["small.gguf"])
+        self.assertEqual(self.catalog.list_models(architecture="qwen2"), [])
+        self.assertIsNotNone(self.catalog.get_model("broken.gguf")["error"])
+        self.assertEqual(len(self.catalog.list_models(include_errors=True)), 3)
+        with self.assertRaises(ValueError):
+            self.catalog.list_models(sort_by="size; DROP TABLE models")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# tests/test_model_pool.py
+
+import os
+import tempfile
+import unittest
+
+from gguf_fixtures import tiny_llama
+from modules.model_pool import ModelPool, estimate_model_bytes, model_key
+
+
+class _FakeModel:
+    def __init__(self, model_path, n_ctx, n_gpu_layers, n_threads, logits_all):
+        self.model_path = model_path
+        self.logits_all = logits_all
+        self.loaded = False
+
+    def load_model(self):
+        self.loaded = True
+
+    def unload_model(self):
+        self.loaded = False
+
+
+class TestModelPool(unittest.TestCase):
+    def setUp(self):
+        self.sizes = {"a.gguf": 40, "b.gguf": 40, "c.gguf": 40, "huge.gguf": 500}
+        self.pool = ModelPool(
+            budget_bytes=100,
+            model_factory=_FakeModel,
+            size_estimator=lambda path, n_ctx, n_gpu_layers, logits_all: self.sizes[os.path.basename(path)],
+        )
+
+    def test_reuses_warm_instance(self):
+        first = self.pool.acquire("a.gguf", n_ctx=512)
+        self.assertIs(self.pool.acquire("a.gguf", n_ctx=512), first)
+        self.assertIsNot(self.pool.acquire("a.gguf", n_ctx=1024), first)
+        self.assertIn(model_key("a.gguf", 512, 0, 8), self.pool)
+        scoring = self.pool.acquire("a.gguf", n_ctx=512, logits_all=True)
+        self.assertIsNot(scoring, first)
+        self.assertTrue(scoring.logits_all)
+
+    def test_stats_workers_update_warm_instance(self):
+        first = self.pool.acquire("a.gguf", stats_workers=4)
+        self.assertEqual(first.stats_workers, 4)
+        self.assertIs(self.pool.acquire("a.gguf"), first)
+        self.assertEqual(first.stats_workers, 1)
+
+    def test_evicts_least_recently_used(self):
+        a = self.pool.acquire("a.gguf")
+        b = self.pool.acquire("b.gguf")
+        self.pool.acquire("a.gguf")
+        self.pool.acquire("c.gguf")
+        self.assertTrue(a.loaded)
+        self.assertFalse(b.loaded)
+        self.assertEqual(len(self.pool), 2)
+        self.assertLessEqual(self.pool.used_bytes(), self.pool.budget_bytes)
+
+    def test_oversized_model_evicts_everything(self):
+        a = self.pool.acquire("a.gguf")
+        huge = self.pool.acquire("huge.gguf")
+        self.assertFalse(a.loaded)
+        self.assertTrue(huge.loaded)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_release(self):
+        a = self.pool.acquire("a.gguf")
+        self.assertTrue(self.pool.release(a))
+        self.assertFalse(a.loaded)
+        self.assertFalse(self.pool.release(a))
+        self.assertEqual(self.pool.used_bytes(), 0)
+
+
+class TestEstimateModelBytes(unittest.TestCase):
+    def test_estimate_from_tensor_table(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tiny.gguf")
+            arrays = tiny_llama(path, n_layers=2, n_embd=8)
+            weights = sum(a.nbytes for a in arrays.values())
+            kv_cache = 2 * 2 * 128 * 8 * 2
+            self.assertEqual(estimate_model_bytes(path, n_ctx=128), weights + kv_cache)
+            logits = 128 * 16 * 4
+            self.assertEqual(estimate_model_bytes(path, n_ctx=128, logits_all=True), weights + kv_cache + logits)
+            offloaded = estimate_model_bytes(path, n_ctx=128, n_gpu_layers=2)
+            block_weights = sum(a.nbytes for n, a in arrays.items() if n.startswith("blk."))
+            self.assertEqual(offloaded, weights - block_weights)
+
+
+if __name__ == '__main__':
+    unittest.main()
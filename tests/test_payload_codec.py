@@ -0,0 +1,77 @@
+# tests/test_payload_codec.py
+
+import json
+import shutil
+import subprocess
+import unittest
+
+import numpy as np
+
+from modules.payload_codec import JS_DECODER, decode_payload, encode_array, encode_payload
+from modules.visualization_utils import prepare_weight_data
+
+
+class TestPayloadCodec(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.weights = rng.standard_normal((64, 48)).astype(np.float32)
+
+    def test_float_round_trip_is_exact(self):
+        data = {"weights": self.weights, "name": "blk.0", "layers": [np.arange(3), 7]}
+        decoded = decode_payload(encode_payload(data, compression="gzip"))
+        np.testing.assert_array_equal(decoded["weights"], self.weights)
+        self.assertEqual(decoded["name"], "blk.0")
+        np.testing.assert_array_equal(decoded["layers"][0], [0, 1, 2])
+        self.assertEqual(decoded["layers"][0].dtype, np.int32)
+        self.assertEqual(decoded["layers"][1], 7)
+
+    def test_quantization_error_is_bounded(self):
+        span = float(self.weights.max() - self.weights.min())
+        for bits in (8, 16):
+            encoded = encode_array(self.weights, quantize=bits)
+            self.assertEqual(encoded["dtype"], f"uint{bits}")
+            decoded = decode_payload(json.dumps(encoded))
+            self.assertEqual(decoded.shape, self.weights.shape)
+            self.assertLessEqual(np.abs(decoded - self.weights).max(), span / ((1 << bits) - 1) * 0.51)
+
+    def test_constant_and_non_finite_values(self):
+        values = np.array([1.5, 1.5, np.nan], dtype=np.float32)
+        decoded = decode_payload(encode_payload(values, quantize=8))
+        np.testing.assert_array_equal(decoded, [1.5, 1.5, 1.5])
+
+    def test_much_smaller_than_point_dicts(self):
+        old = json.dumps([{"x": i, "y": float(w), "z": 0} for i, w in enumerate(self.weights.flatten())])
+        self.assertLess(len(prepare_weight_data(self.weights)) * 20, len(old))
+
+    def test_zstd_requires_zstandard(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            with self.assertRaises(ValueError):
+                encode_array(self.weights, compression="zstd")
+        else:
+            decoded = decode_payload(encode_payload(self.weights, compression="zstd"))
+            np.testing.assert_array_equal(decoded, self.weights)
+
+
+@unittest.skipUnless(shutil.which("node"), "Node.js is not installed")
+class TestJavaScriptDecoder(unittest.TestCase):
+    def decode_in_node(self, payload):
+        script = ("globalThis.window = globalThis;\n" + JS_DECODER +
+                  "\nwindow.decodeVisPayload(" + json.dumps(payload) + ").then(d => console.log(JSON.stringify("
+                  "{values: Array.from(d.values), shape: d.values.shape, label: d.label})));")
+        output = subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout
+        return json.loads(output)
+
+    def test_browser_decoder_matches(self):
+        values = np.linspace(-1, 1, 12, dtype=np.float32).reshape(3, 4)
+        for options in ({}, {"quantize": 8}, {"compression": "gzip", "quantize": 16}):
+            result = self.decode_in_node(encode_payload({"values": values, "label": "x"}, **options))
+            expected = decode_payload(encode_payload(values, **options))
+            np.testing.assert_allclose(result["values"], expected.flatten(), rtol=1e-6, atol=1e-6)
+            self.assertEqual(result["shape"], [3, 4])
+            self.assertEqual(result["label"], "x")
+
+
+if __name__ == '__main__':
+    unittest.main()
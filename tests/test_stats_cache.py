@@ -0,0 +1,109 @@
+# tests/test_stats_cache.py
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import tiny_llama
+from modules.gguf_reader import GGUFReader
+from modules.stats_cache import StatsCache, file_fingerprint
+from modules.weight_stats import TensorStats, compute_model_stats
+
+
+class TestStatsCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tiny.gguf")
+        tiny_llama(self.path, n_layers=2, n_embd=8, n_vocab=16)
+        self.cache = StatsCache(cache_dir=os.path.join(self.tmpdir.name, "cache"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip_is_exact(self):
+        expected = compute_model_stats(self.path)
+        computed, layers = self.cache.get_or_compute(self.path)
+        cached, cached_layers = self.cache.get_or_compute(self.path)
+        self.assertEqual(list(cached), list(expected))
+        for name, stats in expected.items():
+            self.assertEqual(cached[name].to_dict(), stats.to_dict())
+            self.assertEqual(cached[name].moments, stats.moments)
+        self.assertEqual(cached_layers, layers)
+
+    def test_hit_skips_computation(self):
+        calls = []
+
+        def compute(reader):
+            calls.append(reader.path)
+            return compute_model_stats(reader)
+
+        self.cache.get_or_compute(self.path, compute=compute)
+        self.cache.get_or_compute(self.path, compute=compute)
+        self.assertEqual(len(calls), 1)
+
+    def test_fingerprint_changes_with_file_and_settings(self):
+        with GGUFReader(self.path) as reader:
+            before = file_fingerprint(reader, 64)
+            self.assertNotEqual(before, file_fingerprint(reader, 32))
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        with GGUFReader(self.path) as reader:
+            self.assertNotEqual(before, file_fingerprint(reader, 64))
+
+    def test_lru_eviction_by_total_bytes(self):
+        stats = compute_model_stats(self.path)
+        self.cache.put("a", stats)
+        entry_size = self.cache.total_bytes()
+        self.cache.max_bytes = int(entry_size * 2.5)
+        self.cache.put("b", stats)
+        # Make "a" the most recently used entry, so "b" is evicted first
+        past = time.time() - 60
+        os.utime(os.path.join(self.cache.cache_dir, "b.npz"), (past, past))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.cache.put("c", stats)
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+        self.assertLessEqual(self.cache.total_bytes(), self.cache.max_bytes)
+
+    def test_corrupt_entry_is_discarded(self):
+        os.makedirs(self.cache.cache_dir)
+        with open(os.path.join(self.cache.cache_dir, "bad.npz"), "wb") as f:
+            f.write(b"garbage")
+        self.assertIsNone(self.cache.get("bad"))
+        self.assertEqual(self.cache.entries(), [])
+        # A file that looks like a zip archive but is not one
+        with open(os.path.join(self.cache.cache_dir, "bad.npz"), "wb") as f:
+            f.write(b"PK\x03\x04" + b"garbage" * 8)
+        self.assertIsNone(self.cache.get_arrays("bad"))
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_histograms_survive(self):
+        tensor_stats, _ = self.cache.get_or_compute(self.path, bins=8)
+        cached, _ = self.cache.get_or_compute(self.path, bins=8)
+        for name in tensor_stats:
+            np.testing.assert_array_equal(cached[name].histogram, tensor_stats[name].histogram)
+            self.assertEqual(len(cached[name].histogram), 8)
+
+    def test_many_tensors_load_quickly(self):
+        rng = np.random.default_rng(0)
+        stats = {}
+        for i in range(3000):
+            moments = (4096, float(rng.normal()), 1.0, 800.0, -1.0, 1.0, i % 7)
+            stats[f"blk.{i}.weight"] = TensorStats(f"blk.{i}.weight", "Q4_K", (64, 64), moments,
+                                                   rng.integers(0, 100, size=64), (-1.0, 1.0))
+        self.cache.put("many", stats)
+        started = time.perf_counter()
+        cached, _ = self.cache.get("many")
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(cached), 3000)
+        last = cached["blk.2999.weight"]
+        self.assertEqual(last.moments, stats["blk.2999.weight"].moments)
+        np.testing.assert_array_equal(last.histogram, stats["blk.2999.weight"].histogram)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# tests/test_template_renderer.py
+
+import html
+import unittest
+
+import numpy as np
+
+from modules.lod_pyramid import pyramid_from_array
+from modules.payload_codec import decode_payload, encode_payload
+from modules.template_renderer import CompiledTemplate, PayloadStore, TemplateRenderer
+from modules import visualization_utils
+
+
+class TestCompiledTemplate(unittest.TestCase):
+    def test_placeholders_keep_javascript_braces(self):
+        template = CompiledTemplate("f({{load_payload}}).then(d => { return {x: {{ size }}}; });")
+        self.assertEqual(template.fields, ["load_payload", "size"])
+        self.assertEqual(template.render(load_payload="p", size=3), "f(p).then(d => { return {x: 3}; });")
+        with self.assertRaises(KeyError):
+            template.render(load_payload="p")
+
+
+class TestPayloadStore(unittest.TestCase):
+    def test_identical_content_is_stored_once(self):
+        store = PayloadStore()
+        first = store.put(encode_payload({"a": np.arange(4)}))
+        self.assertEqual(store.put(encode_payload({"a": np.arange(4)})), first)
+        self.assertNotEqual(store.put(encode_payload({"a": np.arange(5)})), first)
+        self.assertEqual(len(store), 2)
+
+    def test_get_or_put_builds_once(self):
+        store = PayloadStore()
+        calls = []
+
+        def build():
+            calls.append(1)
+            return "{}"
+
+        self.assertEqual(store.get_or_put(("model", 1), build), store.get_or_put(("model", 1), build))
+        self.assertEqual(len(calls), 1)
+
+    def test_evicts_least_recently_used(self):
+        store = PayloadStore(max_bytes=10)
+        first = store.put("x" * 6)
+        second = store.put("y" * 6)
+        self.assertNotIn(first, store)
+        self.assertEqual(store.get(second), b"y" * 6)
+
+    def test_etag_responses(self):
+        store = PayloadStore()
+        payload_id = store.put('{"a":1}')
+        status, headers, body = store.respond(payload_id)
+        self.assertEqual((status, body), (200, b'{"a":1}'))
+        self.assertEqual(headers["ETag"], f'"{payload_id}"')
+        status, _, body = store.respond(payload_id, if_none_match=f'"other", {headers["ETag"]}')
+        self.assertEqual((status, body), (304, b""))
+        self.assertEqual(store.respond(payload_id, if_none_match='"other"')[0], 200)
+        self.assertEqual(store.respond("missing")[0], 404)
+
+
+class TestTemplateRenderer(unittest.TestCase):
+    def setUp(self):
+        self.renderer = TemplateRenderer()
+        self.renderer.register("view", "<div>{{title}}</div><script>{{load_payload}}.then(show);</script>")
+        self.payload_id = self.renderer.store.put('{"s":"</script>"}')
+
+    def test_inline_until_mounted(self):
+        page = html.unescape(self.renderer.render("view", self.payload_id, title="T"))
+        self.assertIn('window.decodeVisPayload({"s":"<\\/script>"}).then(show);', page)
+        self.assertIn("<div>T</div>", page)
+
+    def test_by_reference_when_mounted(self):
+        self.renderer.mounted = True
+        page = html.unescape(self.renderer.render("view", self.payload_id, title="T"))
+        self.assertIn(f'window.loadVisPayload("/visualization/payload/{self.payload_id}")', page)
+        self.assertNotIn('"s"', page)
+
+    def test_canvas_views(self):
+        self.renderer.register("tile", visualization_utils.TILE_HEATMAP_TEMPLATE)
+        self.renderer.register("live", visualization_utils.LIVE_CAPTURE_TEMPLATE)
+        tile = pyramid_from_array("x", np.arange(12.0).reshape(3, 4)).overview()
+        payload = visualization_utils.prepare_tile_data(tile, field="max")
+        self.assertEqual(set(decode_payload(payload)) & {"min", "max", "mean"}, {"max"})
+        page = html.unescape(self.renderer.render("tile", self.renderer.store.put(payload), field='"max"'))
+        self.assertIn('const field = "max";', page)
+        live_id = self.renderer.store.put(visualization_utils.prepare_live_capture_view(top_k=4))
+        page = html.unescape(self.renderer.render("live", live_id))
+        self.assertIn("window.applyCaptureDelta", page)
+        self.assertNotIn("{{", page)
+
+    def test_requires_load_payload(self):
+        with self.assertRaises(ValueError):
+            self.renderer.register("broken", "<div>{{title}}</div>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# tests/test_token_index.py
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import f32_tensor, write_gguf
+from modules.gguf_reader import GGUFReader
+from modules.token_index import TokenIndex, build_token_index, default_index_dir
+
+
+class TestTokenIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "embd.gguf")
+        rng = np.random.default_rng(0)
+        # Tokens scattered around 20 topics, as real embeddings cluster
+        centers = rng.standard_normal((20, 32))
+        self.embeddings = (centers[rng.integers(0, 20, 1000)] + 0.4 * rng.standard_normal((1000, 32)))
+        self.embeddings = self.embeddings.astype(np.float32)
+        write_gguf(self.path, {"general.architecture": "llama"},
+                   [f32_tensor("token_embd.weight", self.embeddings)])
+        self.unit = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _brute_force(self, token_id, k):
+        scores = self.unit @ self.unit[token_id]
+        scores[token_id] = -np.inf
+        return list(np.argsort(-scores)[:k])
+
+    def test_exact_probe_matches_brute_force(self):
+        with GGUFReader(self.path) as reader:
+            index = build_token_index(reader, os.path.join(self.tmpdir.name, "index"), chunk_bytes=4096)
+        self.assertEqual(len(index), 1000)
+        self.assertEqual(sorted(index.token_ids.tolist()), list(range(1000)))
+        # Lists are contiguous slices covering every vector
+        self.assertEqual(index.offsets[0], 0)
+        self.assertEqual(index.offsets[-1], 1000)
+        for token_id in (0, 123, 999):
+            results = index.search(token_id, k=10, probes=index.n_lists)
+            expected = self.unit @ self.unit[token_id]
+            # float16 storage may swap near-ties, so compare the scores rather than the order
+            np.testing.assert_allclose([s for _, s in results], expected[self._brute_force(token_id, 10)],
+                                       atol=2e-3)
+            for i, similarity in results:
+                self.assertAlmostEqual(similarity, expected[i], places=2)
+
+    def test_approximate_recall(self):
+        with GGUFReader(self.path) as reader:
+            index = build_token_index(reader, os.path.join(self.tmpdir.name, "index"))
+        hits = 0
+        for token_id in range(0, 1000, 50):
+            found = {i for i, _ in index.search(token_id, k=10)}
+            hits += len(found & set(self._brute_force(token_id, 10)))
+        self.assertGreaterEqual(hits / 200, 0.9)
+
+    def test_training_set_is_capped_by_bytes(self):
+        # Room for 100 float16 rows of 32 columns: the lists are trained on a subsample
+        with GGUFReader(self.path) as reader:
+            index = build_token_index(reader, os.path.join(self.tmpdir.name, "index"), training_bytes=100 * 2 * 32)
+        self.assertEqual(index.offsets[-1], 1000)
+        results = index.search(7, k=5, probes=index.n_lists)
+        self.assertEqual([i for i, _ in results], self._brute_force(7, 5))
+
+    def test_persists_next_to_model(self):
+        with GGUFReader(self.path) as reader:
+            built = TokenIndex.open_or_build(reader)
+            self.assertEqual(built.index_dir, default_index_dir(self.path))
+            self.assertTrue(os.path.isfile(os.path.join(built.index_dir, "vectors.npy")))
+            reopened = TokenIndex.open_or_build(reader)
+        self.assertIsInstance(reopened.vectors, np.memmap)
+        self.assertEqual(reopened.vectors.dtype, np.float16)
+        np.testing.assert_array_equal(reopened.token_ids, built.token_ids)
+        self.assertEqual(reopened.search(5, k=3), built.search(5, k=3))
+        query = self.embeddings[5] * 3.0
+        self.assertEqual(reopened.search(query, k=1)[0][0], 5)
+
+    def test_rebuilds_when_model_changes(self):
+        with GGUFReader(self.path) as reader:
+            TokenIndex.open_or_build(reader)
+        write_gguf(self.path, {"general.architecture": "llama", "general.name": "changed"},
+                   [f32_tensor("token_embd.weight", self.embeddings[:500])])
+        with GGUFReader(self.path) as reader:
+            index = TokenIndex.open_or_build(reader)
+        self.assertEqual(len(index), 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+# tests/test_weight_stats.py
+
+import os
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from gguf_fixtures import f32_tensor, tiny_llama, write_gguf
+from modules.gguf_reader import GGUFReader
+from modules.weight_stats import compute_model_stats, dequantize, layer_statistics
+
+
+def _random_blocks(rng, n_blocks, block_bytes, f16_fields):
+    """Random block bytes with finite float16 values at the given byte offsets."""
+    raw = rng.integers(0, 256, size=(n_blocks, block_bytes), dtype=np.uint8)
+    for offset in f16_fields:
+        values = rng.uniform(-0.05, 0.05, n_blocks).astype("<f2")
+        raw[:, offset:offset + 2] = values.view(np.uint8).reshape(n_blocks, 2)
+    return raw.reshape(-1)
+
+
+def _f16(block, offset):
+    return float(np.frombuffer(bytes(block[offset:offset + 2]), dtype="<f2")[0])
+
+
+def _reference_q4_k(raw):
+    # Straight port of dequantize_row_q4_K from ggml
+    out = []
+    for block in raw.reshape(-1, 144):
+        d, dmin = _f16(block, 0), _f16(block, 2)
+        scales, qs = block[4:16], block[16:]
+
+        def scale_min(j):
+            if j < 4:
+                return scales[j] & 63, scales[j + 4] & 63
+            return ((scales[j + 4] & 0xF) | ((scales[j - 4] >> 6) << 4),
+                    (scales[j + 4] >> 4) | ((scales[j] >> 6) << 4))
+
+        for group in range(4):
+            sc1, m1 = scale_min(2 * group)
+            sc2, m2 = scale_min(2 * group + 1)
+            q = qs[32 * group:32 * group + 32]
+            out.extend(d * sc1 * (v & 0xF) - dmin * m1 for v in q)
+            out.extend(d * sc2 * (v >> 4) - dmin * m2 for v in q)
+    return np.array(out, dtype=np.float32)
+
+
+def _reference_q6_k(raw):
+    # Straight port of dequantize_row_q6_K from ggml
+    out = []
+    for block in raw.reshape(-1, 210):
+        ql, qh = block[:128].astype(int), block[128:192].astype(int)
+        scales = block[192:208].view(np.int8).astype(int)
+        d = _f16(block, 208)
+        y = [0.0] * 256
+        for half in range(2):
+            for l in range(32):
+                i = l // 16
+                a, b, h = ql[64 * half + l], ql[64 * half + l + 32], qh[32 * half + l]
+                sc = scales[8 * half:8 * half + 8]
+                y[128 * half + l] = d * sc[i] * (((a & 0xF) | ((h & 3) << 4)) - 32)
+                y[128 * half + l + 32] = d * sc[i + 2] * (((b & 0xF) | (((h >> 2) & 3) << 4)) - 32)
+                y[128 * half + l + 64] = d * sc[i + 4] * (((a >> 4) | (((h >> 4) & 3) << 4)) - 32)
+                y[128 * half + l + 96] = d * sc[i + 6] * (((b >> 4) | (((h >> 6) & 3) << 4)) - 32)
+        out.extend(y)
+    return np.array(out, dtype=np.float32)
+
+
+class TestDequantize(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_float_formats(self):
+        values = self.rng.standard_normal(64).astype(np.float32)
+        np.testing.assert_array_equal(dequantize(values.view(np.uint8), "F32"), values)
+        half = values.astype("<f2")
+        np.testing.assert_array_equal(dequantize(half.view(np.uint8), "F16"), half.astype(np.float32))
+        bf16 = (values.view(np.uint32) >> 16).astype("<u2")
+        expected = (bf16.astype(np.uint32) << 16).view(np.float32)
+        np.testing.assert_array_equal(dequantize(bf16.view(np.uint8), "BF16"), expected)
+
+    def test_q8_0(self):
+        raw = _random_blocks(self.rng, 3, 34, [0])
+        blocks = raw.reshape(3, 34)
+        expected = np.concatenate([_f16(b, 0) * b[2:].view(np.int8).astype(np.float32) for b in blocks])
+        np.testing.assert_allclose(dequantize(raw, "Q8_0"), expected, rtol=1e-6)
+
+    def test_q4_0(self):
+        raw = _random_blocks(self.rng, 3, 18, [0])
+        expected = []
+        for b in raw.reshape(3, 18):
+            qs = b[2:].astype(int)
+            expected.extend(_f16(b, 0) * ((qs & 0xF) - 8))
+            expected.extend(_f16(b, 0) * ((qs >> 4) - 8))
+        np.testing.assert_allclose(dequantize(raw, "Q4_0"), expected, rtol=1e-6)
+
+    def test_q5_0(self):
+        raw = _random_blocks(self.rng, 2, 22, [0])
+        expected = []
+        for b in raw.reshape(2, 22):
+            (qh,) = struct.unpack("<I", bytes(b[2:6]))
+            qs = b[6:].astype(int)
+            for j in range(16):
+                expected.append(_f16(b, 0) * (((qs[j] & 0xF) | (((qh >> j) << 4) & 0x10)) - 16))
+            for j in range(16):
+                expected.append(_f16(b, 0) * (((qs[j] >> 4) | ((qh >> (j + 12)) & 0x10)) - 16))
+        np.testing.assert_allclose(dequantize(raw, "Q5_0"), expected, rtol=1e-6)
+
+    def test_q4_k(self):
+        raw = _random_blocks(self.rng, 2, 144, [0, 2])
+        np.testing.assert_allclose(dequantize(raw, "Q4_K"), _reference_q4_k(raw), rtol=1e-5, atol=1e-6)
+
+    def test_q6_k(self):
+        raw = _random_blocks(self.rng, 2, 210, [208])
+        np.testing.assert_allclose(dequantize(raw, "Q6_K"), _reference_q6_k(raw), rtol=1e-5, atol=1e-6)
+
+    def test_unsupported_type(self):
+        with self.assertRaises(NotImplementedError):
+            dequantize(np.zeros(110, dtype=np.uint8), "Q3_K")
+
+
+class TestWeightStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tiny.gguf")
+        self.arrays = tiny_llama(self.path, n_layers=2, n_embd=16, n_vocab=40)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stats_match_numpy(self):
+        # A 256-byte chunk budget forces many chunks per tensor
+        stats = compute_model_stats(self.path, chunk_bytes=256, bins=16)
+        self.assertEqual(list(stats), list(self.arrays))
+        for name, array in self.arrays.items():
+            s = stats[name]
+            self.assertEqual(s.count, array.size)
+            self.assertAlmostEqual(s.mean, float(array.mean(dtype=np.float64)), places=6)
+            self.assertAlmostEqual(s.std, float(array.std(dtype=np.float64)), places=6)
+            self.assertAlmostEqual(s.mean_abs, float(np.abs(array).mean(dtype=np.float64)), places=6)
+            self.assertEqual(s.min, float(array.min()))
+            self.assertEqual(s.max, float(array.max()))
+            expected, _ = np.histogram(array, bins=16, range=(array.min(), array.max()))
+            np.testing.assert_array_equal(s.histogram, expected)
+
+    def test_sparsity(self):
+        with GGUFReader(self.path) as reader:
+            stats = compute_model_stats(reader, names=["token_embd.weight"], zero_threshold=0.5)
+        array = self.arrays["token_embd.weight"]
+        expected = np.count_nonzero(np.abs(array) <= 0.5) / array.size
+        self.assertAlmostEqual(stats["token_embd.weight"].sparsity, expected)
+
+    def test_layer_statistics(self):
+        layers = layer_statistics(compute_model_stats(self.path))
+        self.assertEqual(sorted(layers), [0, 1])
+        block = [a for n, a in self.arrays.items() if n.startswith("blk.1.")]
+        self.assertEqual(layers[1]["parameters"], sum(a.size for a in block))
+        self.assertEqual(layers[1]["tensors"], 9)
+
+    def test_non_finite_values(self):
+        path = os.path.join(self.tmpdir.name, "inf.gguf")
+        with_inf = np.array([[1.0, -2.0, np.inf, 0.5], [np.nan, 3.0, -np.inf, 0.0]], dtype=np.float32)
+        write_gguf(path, {"general.architecture": "llama"}, [
+            f32_tensor("blk.0.attn_q.weight", with_inf),
+            f32_tensor("blk.0.attn_k.weight", np.full((2, 4), np.nan, dtype=np.float32)),
+        ])
+        stats = compute_model_stats(path, chunk_bytes=16, bins=4)
+        s = stats["blk.0.attn_q.weight"]
+        self.assertEqual((s.min, s.max), (-2.0, 3.0))
+        self.assertEqual(s.hist_range, (-2.0, 3.0))
+        self.assertEqual(int(s.histogram.sum()), 5)
+        self.assertEqual(s.nonfinite, 3)
+        empty = stats["blk.0.attn_k.weight"]
+        self.assertEqual(empty.hist_range, (0.0, 0.0))
+        self.assertEqual(empty.nonfinite, 8)
+        layer = layer_statistics(stats)[0]
+        self.assertEqual((layer["min"], layer["max"]), (-2.0, 3.0))
+
+
+class TestParallelWeightStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "mixed.gguf")
+        rng = np.random.default_rng(1)
+        q8 = _random_blocks(rng, 96, 34, [0])
+        q4k = _random_blocks(rng, 6, 144, [0, 2])
+        big = rng.standard_normal((64, 96)).astype(np.float32) * 0.02
+        write_gguf(self.path, {"general.architecture": "llama"}, [
+            f32_tensor("blk.0.attn_q.weight", big),
+            ("blk.0.ffn_up.weight", (256, 12), 8, q8.tobytes()),
+            ("blk.0.ffn_down.weight", (256, 6), 12, q4k.tobytes()),
+            f32_tensor("output_norm.weight", rng.random(96).astype(np.float32)),
+        ])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parallel_matches_serial_bit_for_bit(self):
+        # Small chunks and work units split each large tensor across several workers
+        settings = dict(chunk_bytes=512, bins=32, zero_threshold=1e-3)
+        serial = compute_model_stats(self.path, **settings)
+        parallel = compute_model_stats(self.path, workers=3, chunks_per_task=2, **settings)
+        self.assertEqual(list(parallel), list(serial))
+        for name, stats in serial.items():
+            self.assertEqual(parallel[name].moments, stats.moments)
+            self.assertEqual(parallel[name].hist_range, stats.hist_range)
+            np.testing.assert_array_equal(parallel[name].histogram, stats.histogram)
+
+
+if __name__ == '__main__':
+    unittest.main()